@@ -0,0 +1,478 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from ml.metrics import REGISTRY
+
+# --- ACTUATORS ---
+# Valves (pumps) and breakers sit behind Modbus TCP controllers: each room maps to
+# a controller, a unit ID and one coil per utility (ON = supply on). Commands are
+# fire-and-forget for the caller; the dispatcher owns delivery:
+#
+#   - one small pool of persistent connections per controller, and requests are
+#     pipelined on them (matched to responses by transaction ID), so a burst of
+#     cutoffs costs one round trip, not one connect + round trip each
+#   - per coil, only the latest command matters: commands arriving while a write
+#     is in flight collapse into one follow-up write, and a command for the value
+#     the coil acknowledged in the last ack_ttl seconds is not sent again (older
+#     acknowledgements are read back first: someone may have flipped it by hand)
+#   - every write has a timeout and is retried with backoff; acknowledgements and
+#     failures are reported back through on_result (room status, dashboards), which
+#     runs on a worker thread so its store writes never block the event loop
+#
+# Speaks just the Modbus TCP subset it needs (Write Single Coil, Read Coils), so no
+# client library is required. ModbusSimulator is a local controller for
+# development and tests: python -m ml.actuators --simulate
+
+UTILITY_COILS = {"WATER": "water_coil", "POWER": "power_coil"}
+UTILITY_STATUS = {"WATER": "pump_on", "POWER": "power_on"}
+
+READ_COILS = 0x01
+WRITE_SINGLE_COIL = 0x05
+MBAP = struct.Struct(">HHHB")  # transaction ID, protocol (0), length, unit ID
+ILLEGAL_FUNCTION, ILLEGAL_ADDRESS = 0x01, 0x02
+
+ACTUATOR_COMMANDS = REGISTRY.counter("ecocore_actuator_commands_total", "Actuator commands, by outcome",
+                                     ["result"])
+ACTUATOR_ACK_SECONDS = REGISTRY.histogram("ecocore_actuator_ack_seconds", "Command to acknowledgement time")
+
+
+class ModbusError(Exception):
+    """The controller answered with a Modbus exception (not worth retrying)."""
+
+    def __init__(self, function, code):
+        super().__init__(f"Modbus exception {code:#04x} for function {function:#04x}")
+        self.code = code
+
+
+def write_coil_pdu(address, on):
+    return struct.pack(">BHH", WRITE_SINGLE_COIL, address, 0xFF00 if on else 0x0000)
+
+
+def read_coils_pdu(address, count):
+    return struct.pack(">BHH", READ_COILS, address, count)
+
+
+class ModbusConnection:
+    """
+    One TCP connection to a controller. request() may be called concurrently: frames
+    are written back to back and a reader task resolves each by transaction ID.
+    """
+
+    def __init__(self, host, port, timeout=1.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._reader = self._writer = self._read_task = None
+        self._pending = {}
+        self._tids = itertools.count(1)
+        self.closed = True
+
+    @property
+    def outstanding(self):
+        return len(self._pending)
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port),
+                                                            self.timeout)
+        self.closed = False
+        self._read_task = asyncio.create_task(self._read_loop())
+
+    async def request(self, unit, pdu):
+        tid = next(self._tids) & 0xFFFF
+        future = asyncio.get_running_loop().create_future()
+        self._pending[tid] = future
+        try:
+            self._writer.write(MBAP.pack(tid, 0, len(pdu) + 1, unit) + pdu)
+            response = await asyncio.wait_for(future, self.timeout)
+        finally:
+            self._pending.pop(tid, None)
+        if response[0] & 0x80:
+            raise ModbusError(response[0] & 0x7F, response[1])
+        return response
+
+    async def _read_loop(self):
+        try:
+            while True:
+                header = await self._reader.readexactly(MBAP.size)
+                tid, _, length, _ = MBAP.unpack(header)
+                pdu = await self._reader.readexactly(length - 1)
+                future = self._pending.get(tid)
+                if future is not None and not future.done():
+                    future.set_result(pdu)  # Late answers to timed-out requests are dropped
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        finally:
+            self._fail_pending()
+
+    def _fail_pending(self):
+        self.closed = True
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f"connection to {self.host}:{self.port} closed"))
+
+    async def close(self):
+        if self._read_task:
+            self._read_task.cancel()
+        if self._writer:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+        self._fail_pending()
+
+
+class ControllerPool:
+    """
+    Up to `size` persistent connections to one controller, opened on demand and
+    reopened when dropped. At most `window` requests are outstanding per connection:
+    controllers answer in order, so a deeper pipeline only turns queueing into timeouts.
+    """
+
+    def __init__(self, host, port, size=2, timeout=1.0, window=16):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.timeout = timeout
+        self._connections = []
+        self._connect_lock = asyncio.Lock()
+        self._slots = asyncio.Semaphore(size * window)
+        self.connects = 0
+
+    async def _connection(self):
+        self._connections = [c for c in self._connections if not c.closed]
+        idle = [c for c in self._connections if c.outstanding == 0]
+        if idle or len(self._connections) >= self.size:
+            return min(idle or self._connections, key=lambda c: c.outstanding)
+        async with self._connect_lock:
+            if len(self._connections) < self.size:
+                connection = ModbusConnection(self.host, self.port, self.timeout)
+                await connection.connect()
+                self.connects += 1
+                self._connections.append(connection)
+                return connection
+        return min(self._connections, key=lambda c: c.outstanding)
+
+    async def request(self, unit, pdu):
+        async with self._slots:  # The timeout starts once the request is on the wire
+            connection = await self._connection()
+            return await connection.request(unit, pdu)
+
+    async def close(self):
+        for connection in self._connections:
+            await connection.close()
+        self._connections = []
+
+
+def load_device_map(path):
+    """
+    JSON device map:
+      {"controllers": {"plc-1": {"host": "10.0.0.5", "port": 502}},
+       "rooms": {"Room 101": {"controller": "plc-1", "unit": 1, "water_coil": 0, "power_coil": 1}}}
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+class ActuatorDispatcher:
+    """
+    Delivers room commands to Modbus coils from a background asyncio loop (the
+    server's). command() is safe to call from any thread; rooms without a device
+    mapping are accepted but never sent anywhere.
+    """
+
+    def __init__(self, device_map=None, connections=2, timeout=0.5, retries=3, backoff=0.05, ack_ttl=5.0,
+                 on_result=None):
+        device_map = device_map or {}
+        self.controllers = device_map.get("controllers", {})
+        self.rooms = device_map.get("rooms", {})
+        self.connections = connections
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.ack_ttl = ack_ttl
+        self.on_result = on_result
+        self._loop = None
+        self._results = None  # One worker thread, so callbacks run in delivery order
+        self._pools = {}
+        self._tasks = set()
+        self._inflight = {}  # coil -> next (room_id, utility, on, queued_at), or None
+        self._acked = {}  # coil -> (last acknowledged or read value, monotonic time)
+        self._state = {}  # room_id -> utility -> delivery record
+        self.sent = 0
+        self.acked = 0
+        self.failed = 0
+        self.retried = 0
+        self.coalesced = 0
+        self.read_back = 0
+        self.unmapped = 0
+
+    # --- LIFECYCLE ---
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._results = ThreadPoolExecutor(max_workers=1, thread_name_prefix="actuator-results")
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for pool in self._pools.values():
+            await pool.close()
+        self._pools = {}
+        if self._results:
+            await asyncio.to_thread(self._results.shutdown)  # Lets queued callbacks finish
+            self._results = None
+        self._loop = None
+
+    # --- COMMANDS ---
+    def command(self, room_id, utility, on):
+        """Queues room_id's WATER/POWER supply on/off. Returns "QUEUED", "UNMAPPED" or "STOPPED"."""
+        target = self._target(room_id, utility)
+        if target is None:
+            self.unmapped += 1
+            ACTUATOR_COMMANDS.inc("unmapped")
+            return "UNMAPPED"
+        if self._loop is None:
+            return "STOPPED"
+        try:
+            self._loop.call_soon_threadsafe(self._enqueue, target, room_id, utility, bool(on), time.perf_counter())
+        except RuntimeError:
+            return "STOPPED"  # Loop closed during shutdown
+        return "QUEUED"
+
+    def _target(self, room_id, utility):
+        room = self.rooms.get(room_id)
+        if room is None or room.get(UTILITY_COILS.get(utility)) is None:
+            return None
+        return room["controller"], room.get("unit", 1), room[UTILITY_COILS[utility]]
+
+    def _enqueue(self, coil, room_id, utility, on, queued_at):
+        command = (room_id, utility, on, queued_at)
+        if coil in self._inflight:
+            if self._inflight[coil] is not None:
+                self.coalesced += 1
+                ACTUATOR_COMMANDS.inc("coalesced")
+            self._inflight[coil] = command  # Only the latest one is sent once the current write ends
+            return
+        if self._cached(coil) == on:
+            self.coalesced += 1
+            ACTUATOR_COMMANDS.inc("unchanged")
+            return
+        self._inflight[coil] = None
+        task = self._loop.create_task(self._deliver(coil, command))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _deliver(self, coil, command):
+        while command is not None:
+            if await self._unchanged(coil, command[2]):
+                self.coalesced += 1
+                ACTUATOR_COMMANDS.inc("unchanged")
+            else:
+                await self._write(coil, *command)
+            command = self._inflight[coil]
+            self._inflight[coil] = None
+        del self._inflight[coil]
+
+    def _cached(self, coil):
+        """The coil's last known value while it is recent enough to trust, else None."""
+        entry = self._acked.get(coil)
+        if entry is None or time.monotonic() - entry[1] > self.ack_ttl:
+            return None
+        return entry[0]
+
+    async def _unchanged(self, coil, on):
+        """True if the coil already holds `on`: trusted from a recent ack, otherwise read back."""
+        cached = self._cached(coil)
+        if cached is not None or coil not in self._acked:
+            return cached == on  # Never acknowledged (or failed since): always write
+        controller, unit, address = coil
+        self.read_back += 1
+        try:
+            response = await self._pool(controller).request(unit, read_coils_pdu(address, 1))
+        except (ModbusError, asyncio.TimeoutError, ConnectionError, OSError):
+            return False  # Can't tell: writing is the safe choice
+        value = bool(response[2] & 1)
+        self._acked[coil] = (value, time.monotonic())
+        return value == on
+
+    async def _write(self, coil, room_id, utility, on, queued_at):
+        controller, unit, address = coil
+        pool = self._pool(controller)
+        self._record(room_id, utility, on, "PENDING")
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            self.sent += 1
+            try:
+                await pool.request(unit, write_coil_pdu(address, on))
+            except ModbusError as e:
+                error = e
+                break  # The controller refused it: retrying won't help
+            except (asyncio.TimeoutError, ConnectionError, OSError) as e:
+                error = e
+                continue
+            latency = time.perf_counter() - queued_at
+            self.acked += 1
+            self._acked[coil] = (on, time.monotonic())
+            ACTUATOR_COMMANDS.inc("acked")
+            ACTUATOR_ACK_SECONDS.observe(latency)
+            self._record(room_id, utility, on, "ACKED", attempts=attempt + 1, latency_ms=round(latency * 1000, 1))
+            return
+        self.failed += 1
+        self._acked.pop(coil, None)  # Unknown now: the next command is always sent
+        ACTUATOR_COMMANDS.inc("failed")
+        self._record(room_id, utility, on, "FAILED", attempts=attempt + 1,
+                     error=str(error) or type(error).__name__)
+
+    def _pool(self, controller):
+        if controller not in self._pools:
+            config = self.controllers[controller]
+            self._pools[controller] = ControllerPool(config["host"], config.get("port", 502),
+                                                     config.get("connections", self.connections), self.timeout)
+        return self._pools[controller]
+
+    def _record(self, room_id, utility, on, state, **details):
+        self._state.setdefault(room_id, {})[utility] = {"on": on, "state": state, "time": datetime.now(), **details}
+        if self.on_result and self._results and state != "PENDING":
+            self._results.submit(self._report, room_id)
+
+    def _report(self, room_id):
+        try:
+            self.on_result(room_id)
+        except Exception as e:
+            print(f"Actuator result callback failed for {room_id}: {e}")
+
+    # --- STATUS ---
+    def room_status(self, room_id):
+        """
+        Fields to merge into a room's status: pump_on/power_on as last acknowledged
+        by the controller, plus every utility's latest delivery record.
+        """
+        records = self._state.get(room_id)
+        if not records:
+            return {}
+        status = {"actuators": {utility: dict(record) for utility, record in records.items()}}
+        for utility, record in records.items():
+            if record["state"] == "ACKED":
+                status[UTILITY_STATUS[utility]] = record["on"]
+        return status
+
+    def stats(self):
+        return {"controllers": len(self.controllers), "rooms_mapped": len(self.rooms),
+                "connections": sum(len(pool._connections) for pool in self._pools.values()),
+                "in_flight": len(self._inflight), "sent": self.sent, "acked": self.acked, "failed": self.failed,
+                "retried": self.retried, "coalesced": self.coalesced, "read_back": self.read_back,
+                "unmapped": self.unmapped}
+
+
+def open_dispatcher(on_result=None):
+    """ECOCORE_ACTUATORS=/path/to/devices.json enables delivery; unset, commands are only recorded."""
+    path = os.environ.get("ECOCORE_ACTUATORS")
+    return ActuatorDispatcher(load_device_map(path) if path else None, on_result=on_result)
+
+
+# --- SIMULATOR ---
+class ModbusSimulator:
+    """
+    A local Modbus TCP controller holding coils in memory. Requests on a connection
+    are answered in order, each after `latency` seconds; unanswered_units never
+    reply (for timeout tests).
+    """
+
+    def __init__(self, host="127.0.0.1", port=5020, latency=0.0, coils=4096, unanswered_units=()):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.coil_count = coils
+        self.unanswered_units = set(unanswered_units)
+        self.coils = {}  # (unit, address) -> bool
+        self.writes = 0
+        self.connections = 0
+        self._writers = set()
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]  # port=0 picks a free one
+
+    async def stop(self):
+        self.disconnect()
+        self._server.close()
+        await self._server.wait_closed()
+
+    def disconnect(self):
+        """Drops every client connection (as a controller reboot would)."""
+        for writer in list(self._writers):
+            writer.close()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        self._writers.add(writer)
+        try:
+            while True:
+                tid, _, length, unit = MBAP.unpack(await reader.readexactly(MBAP.size))
+                pdu = await reader.readexactly(length - 1)
+                if unit in self.unanswered_units:
+                    continue
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                response = self._respond(unit, pdu)
+                writer.write(MBAP.pack(tid, 0, len(response) + 1, unit) + response)
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def _respond(self, unit, pdu):
+        function = pdu[0]
+        if function == WRITE_SINGLE_COIL:
+            address, value = struct.unpack(">HH", pdu[1:5])
+            if address >= self.coil_count or value not in (0x0000, 0xFF00):
+                return bytes((function | 0x80, ILLEGAL_ADDRESS))
+            self.coils[(unit, address)] = value == 0xFF00
+            self.writes += 1
+            return pdu[:5]  # Echo
+        if function == READ_COILS:
+            address, count = struct.unpack(">HH", pdu[1:5])
+            if address + count > self.coil_count:
+                return bytes((function | 0x80, ILLEGAL_ADDRESS))
+            packed = bytearray((count + 7) // 8)
+            for i in range(count):
+                if self.coils.get((unit, address + i)):
+                    packed[i // 8] |= 1 << (i % 8)
+            return bytes((function, len(packed))) + bytes(packed)
+        return bytes((function | 0x80, ILLEGAL_FUNCTION))
+
+
+async def _serve(host, port, latency):
+    simulator = ModbusSimulator(host, port, latency)
+    await simulator.start()
+    print(f"Modbus simulator listening on {host}:{simulator.port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EcoCore actuator tools")
+    parser.add_argument("--simulate", action="store_true", help="Run a local Modbus TCP controller")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5020)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before each response")
+    args = parser.parse_args()
+    if args.simulate:
+        try:
+            asyncio.run(_serve(args.host, args.port, args.latency))
+        except KeyboardInterrupt:
+            pass
+    else:
+        parser.print_help()
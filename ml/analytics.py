@@ -1,34 +1,94 @@
-import pandas as pd
-from sklearn.ensemble import GradientBoostingRegressor
-import joblib
+import numpy as np
 import warnings
 import os
-import random
+import threading
+from ml.artifact import FlatTreeEnsemble, export_model, read_header
+from ml.prediction_cache import PredictionCache
+from ml.metrics import REGISTRY
+
+PREDICT_CALLS = REGISTRY.counter("ecocore_predict_demand_calls_total", "predict_demand calls", ["mode"])
+INFERENCE_SECONDS = REGISTRY.histogram("ecocore_model_inference_seconds",
+                                       "Time inside model.predict (cache misses only)", ["model"])
+INFERENCE_ROWS = REGISTRY.counter("ecocore_model_inference_rows_total", "Rows scored by the model", ["model"])
+
+# pandas, scikit-learn and joblib are imported only where they are needed (training,
+# unpickling). Serving from the .ecotree artifact needs NumPy alone, which keeps
+# worker cold starts fast.
 
 # Silence warnings for a clean terminal
 warnings.filterwarnings("ignore")
 
 
 class EcoBrain:
-    def __init__(self):
+    def __init__(self, cache_size=None, lux_resolution=10.0, lazy=False):
         # 1. SETUP PATHS (Robust Logic)
         # This ensures we always find the file, no matter where you run python from.
         self.base_dir = os.path.dirname(os.path.abspath(__file__))
         self.data_path = os.path.join(self.base_dir, "ecocore_research_data.csv")
         self.model_path = os.path.join(self.base_dir, "water_demand_model.pkl")
+        self.artifact_path = os.path.join(self.base_dir, "water_demand_model.ecotree")
 
         self.model = None
+        self.model_version = 0  # Bumped on every swap; keys caches that depend on the model
+
+        # Optional prediction cache: quantized (hour, occupancy, lux-bin) -> demand
+        self.cache = PredictionCache(cache_size, lux_resolution) if cache_size else None
+
+        self.loaded = False
+        self._load_lock = threading.Lock()
+
+        # lazy=True defers loading to the first prediction (or an explicit ensure_loaded())
+        if not lazy:
+            self.ensure_loaded()
+
+    def ensure_loaded(self):
+        if self.loaded:
+            return
+        with self._load_lock:
+            if self.loaded:
+                return
+            # 2. TRY TO LOAD. IF FAIL -> AUTO-TRAIN
+            if os.path.exists(self.model_path) or os.path.exists(self.artifact_path):
+                self.load_model()
+            else:
+                print("Model file not found. Auto-training a new AI model now...")
+                self.train_new_model()
+            if self.cache and self.model:
+                # Precompute the hours around now; every later swap re-warms (PredictionCache.rebuild)
+                self.cache.warm(self._predict_batch_uncached)
+            self.loaded = True
+
+    def _artifact_is_fresh(self):
+        if not os.path.exists(self.artifact_path):
+            return False
+        if not os.path.exists(self.model_path):
+            return True
+        try:
+            return read_header(self.artifact_path)["source_mtime"] == os.path.getmtime(self.model_path)
+        except (OSError, ValueError, KeyError):
+            return False
 
-        # 2. TRY TO LOAD. IF FAIL -> AUTO-TRAIN
-        if os.path.exists(self.model_path):
-            self.load_model()
-        else:
-            print("Model file not found. Auto-training a new AI model now...")
-            self.train_new_model()
+    def export_artifact(self, model):
+        """Flattens a fitted model to the memory-mappable .ecotree format and serves from it."""
+        try:
+            export_model(model, self.artifact_path, source_mtime=os.path.getmtime(self.model_path))
+            return FlatTreeEnsemble(self.artifact_path)
+        except Exception as e:
+            print(f"Could not export model artifact ({e}); serving the pickled model.")
+            return model
 
     def load_model(self):
         try:
-            self.model = joblib.load(self.model_path)
+            if self._artifact_is_fresh():
+                # Fast path: memory-map the flat arrays, no sklearn import or unpickling
+                self.model = FlatTreeEnsemble(self.artifact_path)
+                self._model_swapped()
+                print(f"EcoBrain loaded successfully from: {self.artifact_path}")
+                return
+
+            import joblib
+            self.model = self.export_artifact(joblib.load(self.model_path))
+            self._model_swapped()
             print(f"EcoBrain loaded successfully from: {self.model_path}")
         except Exception as e:
             print(f"Error loading model: {e}")
@@ -36,6 +96,10 @@ class EcoBrain:
             self.train_new_model()
 
     def train_new_model(self):
+        import joblib
+        import pandas as pd
+        from sklearn.ensemble import GradientBoostingRegressor
+
         # 1. Check if Data Exists. If not, create it.
         if not os.path.exists(self.data_path):
             print("Data file missing. Generating synthetic data...")
@@ -53,35 +117,87 @@ class EcoBrain:
 
         # 4. Save Model
         joblib.dump(model, self.model_path)
-        self.model = model
+        self.model = self.export_artifact(model)
+        self._model_swapped()
         print(f"New model saved to: {self.model_path}")
 
-    def generate_data(self):
+    def generate_data(self, rows=1000, seed=None):
+        import pandas as pd
+
         # Internal generator in case data_generator.py wasn't run
-        data = []
-        for _ in range(1000):
-            hour = random.randint(0, 23)
-            occupancy = random.randint(0, 100) if 9 <= hour <= 18 else random.randint(0, 5)
-            light_lux = (occupancy * 5) + random.randint(0, 50) if occupancy > 0 else 0
-            water_flow = (occupancy * 0.2) + 2.0 + random.uniform(-0.5, 0.5)
-            data.append([hour, occupancy, light_lux, round(water_flow, 2)])
-
-        df = pd.DataFrame(data, columns=['hour', 'occupancy', 'light_lux', 'water_flow'])
+        rng = np.random.default_rng(seed)
+        hour = rng.integers(0, 24, rows)
+        working = (hour >= 9) & (hour <= 18)
+        occupancy = np.where(working, rng.integers(0, 101, rows), rng.integers(0, 6, rows))
+        light_lux = np.where(occupancy > 0, occupancy * 5 + rng.integers(0, 51, rows), 0)
+        water_flow = occupancy * 0.2 + 2.0 + rng.uniform(-0.5, 0.5, rows)
+
+        df = pd.DataFrame({'hour': hour, 'occupancy': occupancy, 'light_lux': light_lux,
+                           'water_flow': np.round(water_flow, 2)})
         df.to_csv(self.data_path, index=False)
         print("✅ Synthetic data generated internally.")
 
+    def swap_model(self, model):
+        """Hot-swap: in-flight predictions finish on the old model, new ones use this one."""
+        self.model = model
+        self._model_swapped()
+
+    def _model_swapped(self):
+        self.model_version += 1
+        # Cached predictions belong to the old model
+        if self.cache:
+            self.cache.rebuild(self._predict_batch_uncached)
+
     def predict_demand(self, hour, occupancy, light_lux):
+        PREDICT_CALLS.inc("single")
+        self.ensure_loaded()
+        if self.cache and self.model:
+            return self.cache.get_or_compute(hour, occupancy, light_lux, self._predict_batch_uncached)
+
         if not self.model:
             return (occupancy * 0.2) + 2.0  # Fallback
 
         try:
-            input_data = pd.DataFrame([[hour, occupancy, light_lux]],
-                                      columns=['hour', 'occupancy', 'light_lux'])
-            prediction = self.model.predict(input_data)[0]
+            input_data = np.array([[hour, occupancy, light_lux]], dtype=np.float64)
+            model_name = type(self.model).__name__
+            with INFERENCE_SECONDS.time(model_name):
+                prediction = float(self.model.predict(input_data)[0])
+            INFERENCE_ROWS.inc(model_name)
             return max(0.0, round(prediction, 2))
         except:
             return 0.0
 
+    def predict_demand_batch(self, hours, occupancies, light_luxes):
+        """ Vectorized predict_demand: scores N readings with one model call. """
+        PREDICT_CALLS.inc("batch")
+        self.ensure_loaded()
+        if self.cache and self.model:
+            return self.cache.get_or_compute_batch(hours, occupancies, light_luxes,
+                                                   self._predict_batch_uncached)
+        return self._predict_batch_uncached(hours, occupancies, light_luxes)
+
+    def _predict_batch_uncached(self, hours, occupancies, light_luxes):
+        hours = np.asarray(hours, dtype=np.float64)
+        occupancies = np.asarray(occupancies, dtype=np.float64)
+        light_luxes = np.asarray(light_luxes, dtype=np.float64)
+
+        if not self.model:
+            return (occupancies * 0.2) + 2.0  # Fallback
+
+        if len(hours) == 0:
+            return np.zeros(0)
+
+        try:
+            # Plain ndarray input skips the per-call DataFrame construction
+            features = np.column_stack((hours, occupancies, light_luxes))
+            model_name = type(self.model).__name__
+            with INFERENCE_SECONDS.time(model_name):
+                predictions = self.model.predict(features)
+            INFERENCE_ROWS.inc(model_name, amount=len(features))
+            return np.maximum(0.0, np.round(predictions, 2))
+        except:
+            return np.zeros(len(hours))
+
 
 if __name__ == "__main__":
     brain = EcoBrain()
@@ -0,0 +1,360 @@
+import fcntl
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# --- TELEMETRY ARCHIVE ---
+# Raw sensor readings, append-only and columnar:
+#
+#   <path>/2026-10-16/<segment>/time.npy, occupancy.npy, light_lux.npy, ...
+#                              rooms.npy   room IDs in this segment, sorted
+#                              offsets.npy rows of rooms[i] are offsets[i]:offsets[i + 1]
+#
+# One partition per day; a segment is written per flush (rows sorted by room,
+# then time). Flushes are small, so the flusher merges them as the day goes on:
+# every merge_fanout segments of one level become one segment of the next
+# (1 s flushes -> 8 s -> 64 s -> ~9 min -> ~68 min), which keeps an open day
+# at a few dozen segments instead of one per flush. compact() merges a closed
+# day's segments into one.
+# Segments are immutable .npy files opened with mmap_mode="r", so a room's
+# readings in a time window are a zero-copy slice. Each segment carries its own
+# room dictionary, so several processes can write to one archive.
+# 22 bytes per reading (vs ~60 as CSV text).
+
+COLUMNS = {
+    "time": "datetime64[ms]",
+    "occupancy": np.uint16,
+    "light_lux": np.float32,
+    "water_flow": np.float32,
+    "energy_load": np.float32,
+}
+STALE_TMP_SECONDS = 3600  # A .tmp-* segment directory this old is left over from a crashed write
+
+
+def hour_of_day(times):
+    """Hour (0-23) of datetime64 values, the model's `hour` feature."""
+    return (times.astype("datetime64[h]").astype(np.int64) % 24).astype(np.int8)
+
+
+class Segment:
+    """One immutable segment; columns are memory-mapped on first use."""
+
+    def __init__(self, path):
+        self.path = path
+        self.rooms = np.load(os.path.join(path, "rooms.npy"))
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+        self._columns = {}
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def column(self, name):
+        if name not in self._columns:
+            self._columns[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+        return self._columns[name]
+
+    def room_rows(self, room_id):
+        i = np.searchsorted(self.rooms, room_id)
+        if i == len(self.rooms) or self.rooms[i] != room_id:
+            return slice(0, 0)
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def room_ids(self, rows=slice(None)):
+        """Room ID of every row (expanded from the dictionary; a copy)."""
+        ids = np.repeat(self.rooms, np.diff(self.offsets))
+        return ids[rows]
+
+
+class ArchiveReader:
+    """
+    Read side of the archive; also used by processes that only read (training).
+    Open segments are kept in a small LRU so their memory maps are reused.
+    """
+
+    def __init__(self, path, cache_size=256):
+        self.path = path
+        self.cache_size = cache_size
+        self._segments = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _partitions(self, since=None, until=None):
+        if not os.path.isdir(self.path):
+            return []
+        days = sorted(name for name in os.listdir(self.path) if not name.startswith("."))
+        first = since.date().isoformat() if since else ""
+        last = until.date().isoformat() if until else "9999"
+        return [day for day in days if first <= day <= last]
+
+    def segment_paths(self, since=None, until=None):
+        paths = []
+        for day in self._partitions(since, until):
+            partition = os.path.join(self.path, day)
+            paths.extend(os.path.join(partition, name) for name in sorted(os.listdir(partition))
+                         if not name.startswith("."))
+        return paths
+
+    def segment(self, path):
+        with self._lock:
+            if path in self._segments:
+                self._segments.move_to_end(path)
+                return self._segments[path]
+        segment = Segment(path)
+        with self._lock:
+            self._segments[path] = segment
+            while len(self._segments) > self.cache_size:
+                self._segments.popitem(last=False)
+        return segment
+
+    def _forget(self, paths):
+        with self._lock:
+            for path in paths:
+                self._segments.pop(path, None)
+
+    def scan(self, room_id=None, since=None, until=None, columns=None, room_ids=False):
+        """
+        Yields one dict of column arrays per segment, in partition order. With room_id
+        (and/or a window within one room) the arrays are zero-copy views of the
+        memory map; a window over all rooms needs a boolean mask, i.e. a copy.
+        room_ids=True adds a "room_id" column.
+        """
+        columns = list(columns or COLUMNS)
+        lo = np.datetime64(since, "ms") if since else None
+        hi = np.datetime64(until, "ms") if until else None
+        for path in self.segment_paths(since, until):
+            try:
+                segment = self.segment(path)
+            except FileNotFoundError:
+                continue  # Merged away by compaction since listing
+            rows = segment.room_rows(room_id) if room_id is not None else slice(0, len(segment))
+            mask = None
+            if lo is not None or hi is not None:
+                times = segment.column("time")[rows]
+                if room_id is not None:
+                    # Sorted by time within a room: narrow the slice, still a view
+                    start = np.searchsorted(times, lo) if lo is not None else 0
+                    stop = np.searchsorted(times, hi, side="right") if hi is not None else len(times)
+                    rows = slice(rows.start + int(start), rows.start + int(stop))
+                else:
+                    mask = np.ones(len(times), dtype=bool)
+                    if lo is not None:
+                        mask &= times >= lo
+                    if hi is not None:
+                        mask &= times <= hi
+            if rows.stop - rows.start == 0 or (mask is not None and not mask.any()):
+                continue
+
+            batch = {}
+            for name in columns:
+                values = segment.column(name)[rows]
+                batch[name] = values[mask] if mask is not None else values
+            if room_ids:
+                ids = segment.room_ids(rows)
+                batch["room_id"] = ids[mask] if mask is not None else ids
+            yield batch
+
+    def read(self, room_id=None, since=None, until=None, columns=None, room_ids=False):
+        """scan() concatenated into one dict of arrays (a view when only one segment matches)."""
+        columns = list(columns or COLUMNS)
+        batches = list(self.scan(room_id, since, until, columns, room_ids))
+        names = columns + (["room_id"] if room_ids else [])
+        if len(batches) == 1:
+            return batches[0]
+        if not batches:
+            return {name: np.empty(0, dtype=COLUMNS.get(name, str)) for name in names}
+        return {name: np.concatenate([batch[name] for batch in batches]) for name in names}
+
+    def stats(self):
+        paths = self.segment_paths()
+        rows = nbytes = 0
+        for path in paths:
+            for name in os.listdir(path):
+                nbytes += os.path.getsize(os.path.join(path, name))
+            try:
+                rows += len(self.segment(path))
+            except FileNotFoundError:
+                pass
+        return {"path": self.path, "partitions": len(self._partitions()), "segments": len(paths),
+                "rows": rows, "bytes": nbytes, "open_segments": len(self._segments)}
+
+    def version(self):
+        """Changes whenever a segment is added or merged (for caches of derived data)."""
+        paths = self.segment_paths()
+        return len(paths), paths[-1] if paths else None
+
+
+class TelemetryArchive(ArchiveReader):
+    """
+    Append side: readings are buffered as columns and written as a new segment
+    every flush_interval seconds (or once flush_rows are pending), by a background
+    thread, so ingest never waits on disk.
+    """
+
+    def __init__(self, path, flush_interval=1.0, flush_rows=65_536, retention_days=None, cache_size=256,
+                 merge_fanout=8, max_level=4):
+        super().__init__(path, cache_size)
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.merge_fanout = merge_fanout
+        self.max_level = max_level  # Bounds how much one merge rewrites (fanout ** max_level flushes)
+        self.retention_days = retention_days
+        os.makedirs(path, exist_ok=True)
+
+        self._write_lock = threading.Lock()
+        self._pending = []
+        self._pending_rows = 0
+        self._segment_seq = 0
+        self.appended = 0
+        self.segments_written = 0
+        self.segments_merged = 0
+
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="archive-flusher", daemon=True)
+        self._flusher.start()
+
+    # --- WRITES ---
+    def append(self, room_ids, times, occupancy, light_lux, water_flow, energy_load):
+        """Columns of equal length (lists or arrays); times are datetimes or datetime64."""
+        with self._write_lock:
+            self._pending.append((room_ids, times, occupancy, light_lux, water_flow, energy_load))
+            self._pending_rows += len(room_ids)
+            self.appended += len(room_ids)
+            full = self._pending_rows >= self.flush_rows
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._write_lock:
+            if not self._pending:
+                return
+            pending, self._pending, self._pending_rows = self._pending, [], 0
+
+            room_ids = np.concatenate([np.asarray(chunk[0], dtype=str) for chunk in pending])
+            columns = {}
+            for i, (name, dtype) in enumerate(COLUMNS.items(), start=1):
+                values = [np.asarray(chunk[i]) for chunk in pending]
+                if name == "occupancy":
+                    values = [np.clip(v, 0, np.iinfo(np.uint16).max) for v in values]
+                columns[name] = np.concatenate(values).astype(dtype)
+
+            days = columns["time"].astype("datetime64[D]")
+            for day in np.unique(days):
+                rows = days == day
+                self._write_segment(str(day), room_ids[rows], {name: v[rows] for name, v in columns.items()})
+
+    def _write_segment(self, day, room_ids, columns, name=None):
+        rooms, codes = np.unique(room_ids, return_inverse=True)
+        order = np.lexsort((columns["time"], codes))
+        offsets = np.searchsorted(codes[order], np.arange(len(rooms) + 1)).astype(np.int64)
+
+        self._segment_seq += 1
+        name = name or f"{time.time_ns()}-{os.getpid()}-{self._segment_seq}"
+        partition = os.path.join(self.path, day)
+        tmp = os.path.join(partition, f".tmp-{name}")
+        # Merges reuse their output's name: clear what a crashed attempt left behind. Named
+        # writes run under the compaction lock and flush names are unique, so it is nobody's
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        np.save(os.path.join(tmp, "rooms.npy"), rooms)
+        np.save(os.path.join(tmp, "offsets.npy"), offsets)
+        for column, values in columns.items():
+            np.save(os.path.join(tmp, f"{column}.npy"), values[order])
+        os.rename(tmp, os.path.join(partition, name))  # Readers only ever see complete segments
+        self.segments_written += 1
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                self.merge_open_day()
+            except Exception as e:  # Keep archiving: a bad batch or a full disk must not stop the thread
+                print(f"Archive flush failed: {type(e).__name__}: {e}")
+
+    # --- MAINTENANCE ---
+    @staticmethod
+    def _level(name):
+        # "<ns>-<pid>-<seq>" is a flush; merges keep the oldest input's name and add "+<level>",
+        # so names still sort in write order
+        return int(name.partition("+")[2] or 0)
+
+    def _merge(self, day, paths, name=None):
+        segments = [self.segment(path) for path in paths]
+        room_ids = np.concatenate([segment.room_ids() for segment in segments])
+        columns = {name: np.concatenate([segment.column(name) for segment in segments]) for name in COLUMNS}
+        if name:
+            self._write_segment(day, room_ids, columns, name)  # Named: no sequence number, appends needn't wait
+        else:
+            with self._write_lock:
+                self._write_segment(day, room_ids, columns)
+        self._forget(paths)
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
+        self.segments_merged += len(paths)
+
+    def merge_open_day(self):
+        """
+        Merges today's segments level by level (merge_fanout of a level -> one of the
+        next). Skipped while another process holds the compaction lock.
+        """
+        day = datetime.now().date().isoformat()
+        partition = os.path.join(self.path, day)
+        if not os.path.isdir(partition):
+            return
+        with open(os.path.join(self.path, ".compact.lock"), "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            for level in range(self.max_level):
+                names = sorted(name for name in os.listdir(partition)
+                               if not name.startswith(".") and self._level(name) == level)
+                if len(names) < self.merge_fanout:
+                    break  # Higher levels only grow from this one
+                # Every segment of a level is older than every segment below it, so the
+                # merged one takes the oldest input's place in the order
+                self._merge(day, [os.path.join(partition, name) for name in names],
+                            f"{names[0].partition('+')[0]}+{level + 1}")
+
+    def compact(self):
+        """
+        Drops partitions past retention, then merges each closed day's segments into
+        one. Runs in one process at a time (a lock file); others skip the pass.
+        """
+        self.flush()
+        with open(os.path.join(self.path, ".compact.lock"), "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            today = datetime.now().date().isoformat()
+            if self.retention_days:
+                cutoff = (datetime.now() - timedelta(days=self.retention_days)).date().isoformat()
+                for day in self._partitions():
+                    if day < cutoff:
+                        shutil.rmtree(os.path.join(self.path, day), ignore_errors=True)
+
+            for day in self._partitions():
+                partition = os.path.join(self.path, day)
+                for name in os.listdir(partition):
+                    tmp = os.path.join(partition, name)
+                    # Crashed writes; live ones (other workers' flushes) are seconds old
+                    if name.startswith(".tmp-") and time.time() - os.path.getmtime(tmp) > STALE_TMP_SECONDS:
+                        shutil.rmtree(tmp, ignore_errors=True)
+                paths = [os.path.join(partition, name) for name in sorted(os.listdir(partition))
+                         if not name.startswith(".")]
+                if day >= today or len(paths) < 2:
+                    continue
+                self._merge(day, paths)
+
+    def stats(self):
+        return {**super().stats(), "pending_rows": self._pending_rows, "appended": self.appended,
+                "segments_written": self.segments_written, "segments_merged": self.segments_merged}
+
+    def close(self):
+        self._stop.set()
+        self._flusher.join()
+        self.flush()
@@ -0,0 +1,176 @@
+import json
+import os
+
+import numpy as np
+
+# --- ECOTREE ARTIFACT FORMAT ---
+# A fitted tree ensemble flattened into one node table, so it can be memory-mapped
+# and evaluated with NumPy alone (no sklearn import, no unpickling). Every worker
+# mapping the same file shares one copy in the OS page cache.
+#
+#   8 bytes   magic  b"ECOTREE1"
+#   8 bytes   little-endian header length
+#   N bytes   JSON header (format version, base, scale, depth, array table)
+#   arrays    one contiguous, 64-byte aligned column per field:
+#               feature       int32    split feature
+#               threshold     float64  go left when x <= threshold
+#               missing_left  uint8    where NaN goes
+#               children      int32    [left, right] pairs, interleaved
+#               value         float64  leaf output (0 on split nodes)
+#               roots         int32    root node of each tree
+#
+# Leaves are stored as self-loops (threshold +inf, both children = itself), so the
+# predictor can walk every tree exactly max_depth steps without branching.
+
+MAGIC = b"ECOTREE1"
+FORMAT_VERSION = 1
+ALIGN = 64
+HEADER_SLOT = 4096
+
+
+def _aligned(n):
+    return -(-n // ALIGN) * ALIGN
+
+
+def _tree_columns(is_leaf, feature, threshold, left, right, value, missing_left):
+    own = np.arange(len(is_leaf), dtype=np.int32)
+    children = np.empty(2 * len(is_leaf), dtype=np.int32)
+    children[0::2] = np.where(is_leaf, own, left)
+    children[1::2] = np.where(is_leaf, own, right)
+    return {
+        "feature": np.where(is_leaf, 0, feature).astype(np.int32),
+        "threshold": np.where(is_leaf, np.inf, threshold).astype(np.float64),
+        "missing_left": np.where(is_leaf, 1, missing_left).astype(np.uint8),
+        "children": children,
+        "value": np.where(is_leaf, value, 0.0).astype(np.float64),
+    }
+
+
+def _sklearn_tree(tree):
+    return _tree_columns(tree.children_left < 0, tree.feature, tree.threshold, tree.children_left,
+                         tree.children_right, tree.value[:, 0, 0],
+                         getattr(tree, "missing_go_to_left", np.zeros(tree.node_count)))
+
+
+def _hist_predictor(predictor):
+    nodes = predictor.nodes
+    return _tree_columns(nodes["is_leaf"].astype(bool), nodes["feature_idx"], nodes["num_threshold"],
+                         nodes["left"], nodes["right"], nodes["value"], nodes["missing_go_to_left"])
+
+
+def flatten_model(model):
+    """Returns (trees, base, scale, n_features) for the regressors EcoBrain trains."""
+    if hasattr(model, "estimators_"):  # GradientBoostingRegressor
+        n_features = model.n_features_in_
+        base = float(model._raw_predict_init(np.zeros((1, n_features)))[0, 0])
+        trees = [_sklearn_tree(est.tree_) for est in model.estimators_[:, 0]]
+        return trees, base, float(model.learning_rate), n_features
+    if hasattr(model, "_predictors"):  # HistGradientBoostingRegressor (shrinkage already in leaves)
+        base = float(np.ravel(model._baseline_prediction)[0])
+        trees = [_hist_predictor(p[0]) for p in model._predictors]
+        return trees, base, 1.0, model.n_features_in_
+    raise TypeError(f"Cannot export {type(model).__name__} as an ECOTREE artifact")
+
+
+def _depth(tree):
+    children = tree["children"]
+    depth = np.zeros(len(tree["feature"]), dtype=np.int32)
+    for i in range(len(depth)):  # Parents always come before children
+        left, right = children[2 * i], children[2 * i + 1]
+        if left != i:
+            depth[left] = depth[right] = depth[i] + 1
+    return int(depth.max())
+
+
+def export_model(model, path, source_mtime=None):
+    """Writes model to path atomically (temp file + rename)."""
+    trees, base, scale, n_features = flatten_model(model)
+    max_depth = max(_depth(t) for t in trees)
+
+    # Re-base child pointers so every tree indexes into one shared node table
+    sizes = [len(t["feature"]) for t in trees]
+    roots = np.cumsum([0] + sizes[:-1]).astype(np.int32)
+    for tree, offset in zip(trees, roots):
+        tree["children"] += offset
+    columns = {name: np.concatenate([t[name] for t in trees]) for name in trees[0]}
+    columns["roots"] = roots
+
+    header = {
+        "format_version": FORMAT_VERSION,
+        "model_type": type(model).__name__,
+        "n_features": int(n_features),
+        "n_trees": len(trees),
+        "n_nodes": int(sum(sizes)),
+        "max_depth": max_depth,
+        "base": base,
+        "scale": scale,
+        "source_mtime": source_mtime,
+        "arrays": {},
+    }
+    position = _aligned(16 + HEADER_SLOT)
+    for name, array in columns.items():
+        header["arrays"][name] = {"dtype": array.dtype.str, "offset": position, "length": len(array)}
+        position = _aligned(position + array.nbytes)
+    header_bytes = json.dumps(header).encode().ljust(HEADER_SLOT)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(8, "little"))
+        f.write(header_bytes)
+        for name, array in columns.items():
+            f.seek(header["arrays"][name]["offset"])
+            f.write(array.tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        if f.read(8) != MAGIC:
+            raise ValueError(f"{path} is not an ECOTREE artifact")
+        length = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(length))
+    if header["format_version"] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported ECOTREE format version {header['format_version']}")
+    return header
+
+
+class FlatTreeEnsemble:
+    """Pure-NumPy predictor over a memory-mapped ECOTREE artifact."""
+
+    def __init__(self, path):
+        self.path = path
+        self.header = read_header(path)
+        arrays = {
+            name: np.memmap(path, dtype=spec["dtype"], mode="r", offset=spec["offset"], shape=(spec["length"],))
+            for name, spec in self.header["arrays"].items()
+        }
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.missing_left = arrays["missing_left"].view(bool)
+        self.children = arrays["children"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+
+        self.base = self.header["base"]
+        self.scale = self.header["scale"]
+        self.max_depth = self.header["max_depth"]
+        self.n_features_in_ = self.header["n_features"]
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        n_samples, n_features = X.shape
+        flat_X = X.ravel()
+        row_start = (np.arange(n_samples) * n_features)[:, None]
+        has_nan = np.isnan(flat_X).any()
+
+        # Every (sample, tree) pair moves down one level per step
+        node = np.broadcast_to(self.roots, (n_samples, len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            x = flat_X[row_start + self.feature[node]]
+            go_right = ~(x <= self.threshold[node])
+            if has_nan:
+                go_right &= ~(np.isnan(x) & self.missing_left[node])
+            node = self.children[2 * node + go_right]
+
+        return self.base + self.scale * self.value[node].sum(axis=1)
@@ -0,0 +1,321 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+from ml.tariffs import hourly_tariffs
+
+# ₹ per kWh for ending the horizon below the battery's target charge. Far above
+# any tariff: arbitrage must pay for itself within the horizon, not by draining.
+TARGET_PENALTY = 1000.0
+
+# Demo unit used until a battery reports telemetry (the old hard-coded numbers)
+DEFAULT_BATTERY = {
+    "capacity_kwh": 100.0,  # Powerwall-sized commercial unit
+    "soc_kwh": 30.0,
+    "max_charge_kw": 10.0,
+    "max_discharge_kw": 10.0,
+    "efficiency": 0.90,  # Round trip
+    "reserve_kwh": 10.0,  # Never discharge below this (backup for outages)
+    "rooms": 10,  # Rooms whose load it can serve
+    "weekday_occupancy": 5,
+    "weekend_occupancy": 0,
+}
+CONFIG_FIELDS = [name for name in DEFAULT_BATTERY if name != "soc_kwh"]
+
+
+def check_battery(battery):
+    """Raises ValueError for a configuration the DP can't plan (telemetry is checked field by field first)."""
+    if not battery["capacity_kwh"] > 0:
+        raise ValueError("capacity_kwh must be > 0")
+    if not (battery["max_charge_kw"] > 0 and battery["max_discharge_kw"] > 0):
+        raise ValueError("max_charge_kw and max_discharge_kw must be > 0")
+    if not 0 < battery["efficiency"] <= 1:
+        raise ValueError("efficiency must be in (0, 1]")
+    if not 0 <= battery["reserve_kwh"] <= battery["capacity_kwh"]:
+        raise ValueError("reserve_kwh must be between 0 and capacity_kwh")
+    if not np.isfinite(battery["soc_kwh"]):
+        raise ValueError("soc_kwh is not a number")
+
+
+def _column(value, n):
+    return np.broadcast_to(np.asarray(value, dtype=np.float64), (n,)).copy()
+
+
+def grid_exchange(energy, efficiency):
+    """Grid kWh drawn to charge and kWh delivered to the load, for energy into (+) / out of (-) the battery."""
+    one_way = np.sqrt(efficiency)
+    return np.maximum(energy, 0) / one_way, np.maximum(-energy, 0) * one_way
+
+
+def battery_policy(load, tariffs, capacity, target, max_charge, max_discharge, efficiency, reserve, soc_bins=40):
+    """
+    Backward pass of the DP. Returns (policy, moves, step): moves[policy[t, n, soc_bin]]
+    is the number of bins battery n should move in hour t, step its bin size in kWh.
+
+    load: (N, H); tariffs: (H,) or one row per battery (N, H); the rest (N,) or scalars.
+    Policies don't depend on the starting charge, so many independent horizons
+    (e.g. every day of a year) can be solved as one batch.
+    """
+    load = np.atleast_2d(np.asarray(load, dtype=np.float64))
+    n, horizon = load.shape
+    tariffs = np.broadcast_to(np.asarray(tariffs, dtype=np.float64), (n, horizon))
+    capacity, target, max_charge, max_discharge, efficiency, reserve = (
+        _column(v, n) for v in (capacity, target, max_charge, max_discharge, efficiency, reserve))
+
+    step = capacity / soc_bins  # kWh per bin, per battery
+    # No battery moves more than its whole range in an hour, however high its rating
+    max_move = min(soc_bins, int(np.ceil(np.max(np.maximum(max_charge, max_discharge) / step))))
+    moves = np.arange(-max_move, max_move + 1)  # Bins per hour
+    states = np.arange(soc_bins + 1)
+    nxt = states[:, None] + moves[None, :]  # (B+1, A)
+    nxt_clipped = np.clip(nxt, 0, soc_bins)
+
+    # Per-battery feasibility of every (state, move): rating, range, reserve
+    delta = moves[None, :] * step[:, None]  # (N, A) kWh into the battery
+    allowed = (delta <= max_charge[:, None] + 1e-9) & (-delta <= max_discharge[:, None] + 1e-9)
+    reserve_bin = np.ceil(reserve / step - 1e-9)
+    valid = allowed[:, None, :] & ((nxt >= 0) & (nxt <= soc_bins))[None, :, :]  # (N, B+1, A)
+    valid &= ~((moves[None, None, :] < 0) & (nxt[None, :, :] < reserve_bin[:, None, None]))
+
+    grid_draw, delivered = grid_exchange(delta, efficiency[:, None])
+
+    value = TARGET_PENALTY * np.maximum(0.0, target[:, None] - states[None, :] * step[:, None])  # (N, B+1)
+    policy = np.zeros((horizon, n, soc_bins + 1), dtype=np.int32)
+    for t in range(horizon - 1, -1, -1):
+        grid = np.maximum(0.0, load[:, t, None] + grid_draw - delivered)  # (N, A)
+        cost = (grid * tariffs[:, t, None])[:, None, :] + value[:, nxt_clipped]  # (N, B+1, A)
+        cost = np.where(valid, cost, np.inf)
+        best = np.argmin(cost, axis=2)
+        policy[t] = best
+        value = np.take_along_axis(cost, best[:, :, None], axis=2)[:, :, 0]
+    return policy, moves, step
+
+
+def max_moves(capacity, max_charge, max_discharge, soc_bins=40):
+    """Bins each battery can move per hour: the size of its action space."""
+    step = np.asarray(capacity, dtype=np.float64) / soc_bins
+    rate = np.maximum(max_charge, max_discharge)
+    return np.minimum(soc_bins, np.ceil(rate / step)).astype(np.int64)
+
+
+def optimize_battery_schedules(load, tariffs, capacity, soc, max_charge, max_discharge, efficiency, reserve,
+                               target=None, soc_bins=40):
+    """
+    optimize_battery_schedule_batch() per group of batteries with the same action
+    space, so one battery with a high rating for its size doesn't widen everyone's.
+    Same arguments and result.
+    """
+    load = np.atleast_2d(np.asarray(load, dtype=np.float64))
+    n = len(load)
+    columns = [_column(v, n) for v in (capacity, soc, max_charge, max_discharge, efficiency, reserve)]
+    target = None if target is None else _column(target, n)
+    moves = max_moves(columns[0], columns[2], columns[3], soc_bins)
+    groups = np.unique(moves)
+    if len(groups) == 1:
+        return optimize_battery_schedule_batch(load, tariffs, *columns, target=target, soc_bins=soc_bins)
+
+    result = {}
+    for group in groups:
+        rows = np.flatnonzero(moves == group)
+        part = optimize_battery_schedule_batch(load[rows], tariffs, *(column[rows] for column in columns),
+                                               target=None if target is None else target[rows],
+                                               soc_bins=soc_bins)
+        for name, values in part.items():
+            if name not in result:
+                result[name] = np.empty((n,) + values.shape[1:])
+            result[name][rows] = values
+    return result
+
+
+def optimize_battery_schedule_batch(load, tariffs, capacity, soc, max_charge, max_discharge, efficiency, reserve,
+                                    target=None, soc_bins=40):
+    """
+    Cheapest hourly charge/discharge plan for N batteries at once: a backward DP over
+    SoC bins, vectorized over batteries x bins x actions.
+
+    load:    (N, H) kWh the site draws each hour; discharging can offset it, never export
+    tariffs: (H,) ₹/kWh
+    other arguments: (N,) or scalars, in kWh / kW. soc is rounded to the nearest bin;
+    target defaults to that starting charge.
+
+    An action moves the SoC by a whole number of bins per hour, limited by the
+    charger/inverter rating. Charging draws delta/sqrt(eff) from the grid,
+    discharging delivers delta*sqrt(eff).
+    """
+    load = np.atleast_2d(np.asarray(load, dtype=np.float64))
+    n, horizon = load.shape
+    tariffs = np.asarray(tariffs, dtype=np.float64)
+    capacity, soc, efficiency = (_column(v, n) for v in (capacity, soc, efficiency))
+
+    start_bin = np.clip(np.round(soc / capacity * soc_bins), 0, soc_bins).astype(np.int64)
+    target = start_bin * capacity / soc_bins if target is None else target
+    policy, moves, step = battery_policy(load, tariffs, capacity, target, max_charge, max_discharge, efficiency,
+                                         reserve, soc_bins)
+
+    # --- FORWARD PASS from each battery's current SoC ---
+    rows = np.arange(n)
+    state = start_bin
+    soc_path = np.zeros((n, horizon + 1))
+    soc_path[:, 0] = state * step
+    energy = np.zeros((n, horizon))  # kWh into (+) / out of (-) the battery
+    grid_cost = np.zeros(n)
+    for t in range(horizon):
+        move = moves[policy[t, rows, state]]
+        energy[:, t] = move * step
+        draw, out = grid_exchange(energy[:, t], efficiency)
+        grid_cost += np.maximum(0.0, load[:, t] + draw - out) * tariffs[t]
+        state = state + move
+        soc_path[:, t + 1] = state * step
+
+    return {
+        "energy": energy,
+        "soc": soc_path,
+        "cost": grid_cost,
+        "no_battery_cost": (load * tariffs).sum(axis=1),
+        "charged_kwh": np.maximum(energy, 0).sum(axis=1),
+        "discharged_kwh": np.maximum(-energy, 0).sum(axis=1),
+    }
+
+
+class BatteryFleet:
+    """
+    Tracks each battery's state of charge from telemetry and plans it against the
+    next hours of tariffs and forecast load.
+
+    Plans are cached on (battery config, SoC bin, start hour): telemetry that
+    doesn't move a battery to another SoC bin reuses its plan, and a fleet request
+    solves every stale battery in ONE vectorized DP.
+    """
+
+    def __init__(self, forecast_engine, soc_bins=40, cache_size=4096):
+        self.forecast_engine = forecast_engine
+        self.soc_bins = soc_bins
+        self.cache_size = cache_size
+        self._batteries = {}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_plan_id = 1
+        self.hits = 0
+        self.misses = 0
+
+    # --- TELEMETRY ---
+    def update(self, battery_id, soc_percent=None, soc_kwh=None, power_kw=None, timestamp=None, **config):
+        """
+        Applies one telemetry reading. A reported SoC (percent or kWh) wins; otherwise
+        power_kw (+ charging, - discharging) is integrated since the last reading.
+        config overrides capacity/ratings/reserve etc. for this battery. Raises
+        ValueError (and changes nothing) when the result isn't a plannable battery.
+        """
+        timestamp = timestamp or datetime.now()
+        with self._lock:
+            battery = dict(self._batteries.get(battery_id) or dict(DEFAULT_BATTERY, updated=timestamp))
+            battery.update({k: v for k, v in config.items() if k in CONFIG_FIELDS and v is not None})
+            check_battery(battery)
+
+            if soc_percent is not None:
+                battery["soc_kwh"] = battery["capacity_kwh"] * soc_percent / 100
+            elif soc_kwh is not None:
+                battery["soc_kwh"] = soc_kwh
+            elif power_kw is not None:
+                hours = max(0.0, (timestamp - battery["updated"]).total_seconds() / 3600)
+                one_way = battery["efficiency"] ** 0.5
+                stored = power_kw * hours * (one_way if power_kw > 0 else 1 / one_way)
+                battery["soc_kwh"] += stored
+            battery["soc_kwh"] = min(max(battery["soc_kwh"], 0.0), battery["capacity_kwh"])
+            battery["updated"] = timestamp
+            self._batteries[battery_id] = battery
+            return dict(battery)
+
+    def get(self, battery_id):
+        with self._lock:
+            battery = self._batteries.get(battery_id)
+            return dict(battery) if battery else None
+
+    def battery_ids(self):
+        with self._lock:
+            return list(self._batteries)
+
+    # --- PLANNING ---
+    def plan(self, battery_ids, hours=24, start=None):
+        """
+        One plan per battery. A battery that can't be planned gets {"error": ...}
+        instead of failing the batch it was solved with.
+        """
+        start = (start or datetime.now()).replace(minute=0, second=0, microsecond=0)
+        batteries = [self.get(battery_id) or dict(DEFAULT_BATTERY) for battery_id in battery_ids]
+        keys, errors = [], {}
+        for i, battery in enumerate(batteries):
+            try:
+                check_battery(battery)
+            except ValueError as e:
+                errors[i] = {"error": str(e)}
+                keys.append(None)
+                continue
+            soc_bin = round(battery["soc_kwh"] / battery["capacity_kwh"] * self.soc_bins)
+            keys.append((start.isoformat(), hours, soc_bin) + tuple(battery[name] for name in CONFIG_FIELDS))
+
+        plans = [errors.get(i) for i in range(len(batteries))]
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key is not None and key in self._cache:
+                    self._cache.move_to_end(key)
+                    plans[i] = self._cache[key]
+            self.hits += sum(p is not None for p in plans) - len(errors)
+        missing = [i for i, p in enumerate(plans) if p is None]
+        if not missing:
+            return plans
+
+        solved = self._solve([batteries[i] for i in missing], hours, start)
+        with self._lock:
+            self.misses += len(missing)
+            for i, plan in zip(missing, solved):
+                plans[i] = self._cache[keys[i]] = plan
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return plans
+
+    def _solve(self, batteries, hours, start):
+        tariffs = hourly_tariffs(hours, start.hour)
+
+        profiles = {}
+        load = np.empty((len(batteries), hours))
+        for i, battery in enumerate(batteries):
+            scenario = (battery["weekday_occupancy"], battery["weekend_occupancy"])
+            if scenario not in profiles:
+                profiles[scenario] = self.forecast_engine.hourly_energy_load(start, hours, *scenario)
+            load[i] = profiles[scenario] * battery["rooms"]
+
+        def field(name):
+            return np.array([battery[name] for battery in batteries], dtype=np.float64)
+
+        result = optimize_battery_schedules(load, tariffs, field("capacity_kwh"), field("soc_kwh"),
+                                            field("max_charge_kw"), field("max_discharge_kw"),
+                                            field("efficiency"), field("reserve_kwh"), soc_bins=self.soc_bins)
+
+        hour_labels = [(start.hour + h) % 24 for h in range(hours)]
+        plans = []
+        for i, battery in enumerate(batteries):
+            with self._lock:
+                plan_id = self._next_plan_id
+                self._next_plan_id += 1
+            plans.append({
+                "plan_id": plan_id,
+                "start": start,
+                "capacity_kwh": battery["capacity_kwh"],
+                "hour_of_day": hour_labels,
+                "tariffs": tariffs,
+                "load": load[i],
+                "energy": result["energy"][i],
+                "soc": result["soc"][i],
+                "cost": float(result["cost"][i]),
+                "no_battery_cost": float(result["no_battery_cost"][i]),
+                "charged_kwh": float(result["charged_kwh"][i]),
+                "discharged_kwh": float(result["discharged_kwh"][i]),
+            })
+        return plans
+
+    def stats(self):
+        return {"batteries": len(self._batteries), "cached_plans": len(self._cache),
+                "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,399 @@
+"""
+Reproducible benchmarks for the hot paths.
+
+    python -m ml.benchmarks                          # run, print JSON, compare with the baseline
+    python -m ml.benchmarks --quick                  # smaller run for a quick check
+    python -m ml.benchmarks --sizes 1000,1000000     # history log sizes to test
+    python -m ml.benchmarks --save-baseline          # record this machine's numbers as the baseline
+
+Every result reports throughput (ops/s), p50/p99 latency (ms) and the process's
+peak RSS (MB) after it ran. Exit status is 1 when a result regresses by more than
+--tolerance against the baseline, so CI can gate on it. Inputs are seeded, so runs
+on the same machine are comparable.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from ml.records import AlertRecord, WATER_ALERT, ENERGY_ALERT, DRIP_ALERT
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "benchmarks_baseline.json")
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+
+
+# --- MEASUREMENT ---
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # bytes on macOS, KB on Linux
+
+
+def summarize(latencies_ns, wall_seconds, ops=None):
+    latencies_ms = np.asarray(latencies_ns, dtype=np.float64) / 1e6
+    ops = ops or len(latencies_ms)
+    return {
+        "n": int(ops),
+        "ops_per_sec": round(ops / wall_seconds, 1),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 4),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 4),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def measure(fn, n, warmup=10):
+    for _ in range(min(warmup, n)):
+        fn()
+    latencies = np.empty(n, dtype=np.int64)
+    start = time.perf_counter()
+    for i in range(n):
+        t0 = time.perf_counter_ns()
+        fn()
+        latencies[i] = time.perf_counter_ns() - t0
+    return summarize(latencies, time.perf_counter() - start)
+
+
+# --- BENCHMARKS ---
+def bench_predict(main, n):
+    brain = main.brain
+    brain.ensure_loaded()
+    rng = np.random.default_rng(0)
+    hours = rng.integers(0, 24, n)
+    occupancy = rng.integers(0, 100, n)
+    lux = rng.uniform(0, 900, n)
+
+    results = {}
+    counter = itertools.count()
+    results["predict_demand.cached"] = measure(lambda: brain.predict_demand(10, 25, 450.0), n)
+
+    def uncached():
+        k = next(counter) % n
+        brain._predict_batch_uncached(hours[k:k + 1], occupancy[k:k + 1], lux[k:k + 1])
+    results["predict_demand.uncached"] = measure(uncached, n)
+
+    batch = measure(lambda: brain._predict_batch_uncached(hours, occupancy, lux), 20, warmup=2)
+    batch["rows_per_sec"] = round(batch["ops_per_sec"] * n, 1)
+    results[f"predict_demand_batch.uncached.{n}"] = batch
+    return results
+
+
+def _asgi_client(app):
+    try:
+        import httpx
+    except ImportError:
+        raise RuntimeError("The HTTP benchmarks need httpx (pip install httpx)")
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+
+def bench_ingest(main, n, concurrency):
+    rng = random.Random(0)
+    payloads = [{
+        "room_id": f"Room {rng.randrange(500)}",
+        "occupancy": rng.randrange(60),
+        "light_lux": rng.uniform(0, 800),
+        "water_flow": rng.choice([0.0, 0.5, 3.0, 12.0]),
+        "energy_load": rng.uniform(0, 8),
+    } for _ in range(n)]
+
+    async def run():
+        latencies = []
+        async with _asgi_client(main.app) as client:
+            async def worker(chunk):
+                for payload in chunk:
+                    t0 = time.perf_counter_ns()
+                    response = await client.post("/sensor/ingest", json=payload)
+                    latencies.append(time.perf_counter_ns() - t0)
+                    response.raise_for_status()
+
+            await worker(payloads[:20])  # Warm up the client and the threadpool
+            latencies.clear()
+            start = time.perf_counter()
+            await asyncio.gather(*(worker(payloads[w::concurrency]) for w in range(concurrency)))
+            return summarize(latencies, time.perf_counter() - start)
+
+    return {f"ingest.concurrency_{concurrency}": asyncio.run(run())}
+
+
+def bench_wire(main, n, batch=1000):
+    """Decoding and scoring one gateway batch: JSON + pydantic vs a binary frame (ml/wire.py)."""
+    from typing import List
+    from pydantic import TypeAdapter
+    from ml.wire import encode_frame, decode_frame
+
+    rng = random.Random(0)
+    start = datetime.now().replace(microsecond=0)
+    rows = [{
+        "room_id": f"Room {rng.randrange(500)}",
+        "timestamp": (start + timedelta(seconds=i)).isoformat(),
+        "occupancy": rng.randrange(60),
+        "light_lux": round(rng.uniform(0, 800), 1),
+        "water_flow": rng.choice([0.0, 0.5, 3.0, 12.0]),
+        "energy_load": round(rng.uniform(0, 8), 2),
+    } for i in range(batch)]
+    body = json.dumps(rows).encode()
+    frame = encode_frame(*([row[name] for row in rows] for name in
+                           ("room_id", "occupancy", "light_lux", "water_flow", "energy_load")),
+                         times=[start + timedelta(seconds=i) for i in range(batch)])
+    readings = TypeAdapter(List[main.SensorReading])
+    runs = max(5, n // 20)
+
+    results = {}
+    for name, fn, size in (
+        ("json", lambda: main.process_readings(readings.validate_json(body)), len(body)),
+        ("frame", lambda: main.process_frame(decode_frame(frame)), len(frame)),
+    ):
+        decode = readings.validate_json if name == "json" else decode_frame
+        results[f"wire.decode_{name}.{batch}"] = measure(lambda: decode(body if name == "json" else frame), runs)
+        results[f"wire.ingest_{name}.{batch}"] = measure(fn, runs, warmup=1)
+        for key in (f"wire.decode_{name}.{batch}", f"wire.ingest_{name}.{batch}"):
+            results[key]["rows_per_sec"] = round(results[key]["ops_per_sec"] * batch, 1)
+            results[key]["bytes_per_reading"] = round(size / batch, 1)
+    return results
+
+
+def bench_sharding(main, n, batch=10_000, shard_counts=(2, 4)):
+    """
+    Scoring and end-to-end frame ingest in this process vs ShardPool (ECOCORE_SHARDS).
+    Shards only parallelize scoring, so the gain is bounded by its share of ingest
+    and by the cores available (meta.cpu_count); single.* is the per-reading pipe cost.
+    """
+    from ml.room_state import RoomStateEngine
+    from ml.scoring import score_batch
+    from ml.sharding import ShardPool
+    from ml.wire import encode_frame, decode_frame
+
+    main.brain.ensure_loaded()
+    rng = np.random.default_rng(0)
+    columns = (np.array([f"Room {i}" for i in rng.integers(0, 2000, batch)]), rng.integers(0, 24, batch),
+               rng.integers(0, 60, batch), rng.uniform(0, 800, batch), rng.choice([0.0, 0.5, 3.0, 12.0], batch),
+               rng.uniform(0, 8, batch))
+    single = tuple(column[:1] for column in columns)
+    frame = encode_frame(columns[0], *columns[2:])
+    runs = max(5, n // 100)
+
+    def score_inprocess(cols):
+        return score_batch(main.brain, room_state, *cols)
+
+    def ingest():
+        main.process_frame(decode_frame(frame))
+
+    results = {}
+    room_state = RoomStateEngine(**main.ROOM_STATE_OPTIONS)
+    results[f"sharding.score.inprocess.{batch}"] = measure(lambda: score_inprocess(columns), runs, warmup=2)
+    results[f"sharding.ingest.inprocess.{batch}"] = measure(ingest, runs, warmup=1)
+    results["sharding.single.inprocess"] = measure(lambda: score_inprocess(single), n)
+
+    saved = main.shards
+    for count in shard_counts:
+        pool = ShardPool(count, **main.ROOM_STATE_OPTIONS)
+        pool.start()
+        try:
+            main.shards = pool
+            results[f"sharding.score.shards_{count}.{batch}"] = measure(lambda: pool.score(*columns), runs, warmup=2)
+            results[f"sharding.ingest.shards_{count}.{batch}"] = measure(ingest, runs, warmup=1)
+            results[f"sharding.single.shards_{count}"] = measure(lambda: pool.score(*single), n)
+        finally:
+            main.shards = saved
+            pool.stop()
+
+    for name, result in results.items():
+        if not name.startswith("sharding.single"):
+            result["rows_per_sec"] = round(result["ops_per_sec"] * batch, 1)
+        kind = name.split(".")[1]
+        reference = results[f"sharding.{kind}.inprocess" + ("" if kind == "single" else f".{batch}")]
+        result["speedup"] = round(result["ops_per_sec"] / reference["ops_per_sec"], 2)
+    return results
+
+
+def bench_forecast(main, n):
+    engine = main.forecast_engine
+    results = {}
+    for days, resolution in ((30, "daily"), (365, "hourly")):
+        def cold():
+            engine._cache.clear()
+            engine.forecast(days=days, resolution=resolution)
+        results[f"forecast.{resolution}_{days}d.cold"] = measure(cold, max(5, n // 20), warmup=1)
+        results[f"forecast.{resolution}_{days}d.cached"] = measure(
+            lambda: engine.forecast(days=days, resolution=resolution), n)
+    return results
+
+
+def fill_history(store, size):
+    """size alerts spread over the last 30 days, 50 rooms, 3 types."""
+    store.clear_history()
+    now = datetime.now()
+    step = timedelta(days=30) / size
+    types = [WATER_ALERT, ENERGY_ALERT, DRIP_ALERT]
+    for i in range(size):
+        store.append("alerts", AlertRecord(i + 1, now - timedelta(days=30) + step * i, f"Room {i % 50}", types[i % 3],
+                                           1.0, 1.2, 12, 0.06, 90.0))
+    store.flush()
+
+
+def bench_history(main, sizes, n):
+    results = {}
+
+    async def run(size):
+        async with _asgi_client(main.app) as client:
+            async def timed(url, headers=None, expect=200):
+                t0 = time.perf_counter_ns()
+                response = await client.get(url, headers=headers)
+                elapsed = time.perf_counter_ns() - t0
+                assert response.status_code == expect, (url, response.status_code)
+                return elapsed, response
+
+            cases = {
+                "latest_100": "/api/history/alerts?limit=100",
+                "room_filter_100": "/api/history/alerts?limit=100&room_id=Room%207",
+                "time_window_1d": "/api/history/alerts?limit=1000&since="
+                                  + (datetime.now() - timedelta(days=1)).isoformat(),
+            }
+            for name, url in cases.items():
+                for _ in range(5):
+                    await timed(url)  # Warm up
+                latencies = []
+                start = time.perf_counter()
+                for _ in range(n):
+                    elapsed, response = await timed(url)
+                    latencies.append(elapsed)
+                results[f"history.{name}.{size}"] = summarize(latencies, time.perf_counter() - start)
+
+            # Deep pagination: follow X-Next-Cursor through up to 20 pages, several times
+            latencies = []
+            start = time.perf_counter()
+            for _ in range(max(1, n // 20)):
+                url = cases["latest_100"]
+                for _ in range(20):
+                    elapsed, response = await timed(url)
+                    latencies.append(elapsed)
+                    cursor = response.headers.get("X-Next-Cursor")
+                    if not cursor:
+                        break
+                    url = f"{cases['latest_100']}&cursor={cursor}"
+            results[f"history.cursor_pages.{size}"] = summarize(latencies, time.perf_counter() - start)
+
+            # Conditional GET: the poll that finds nothing new
+            _, response = await timed(cases["latest_100"])
+            etag = {"If-None-Match": response.headers["ETag"]}
+            for _ in range(5):
+                await timed(cases["latest_100"], headers=etag, expect=304)
+            latencies = []
+            start = time.perf_counter()
+            for _ in range(n):
+                elapsed, _ = await timed(cases["latest_100"], headers=etag, expect=304)
+                latencies.append(elapsed)
+            results[f"history.etag_304.{size}"] = summarize(latencies, time.perf_counter() - start)
+
+    for size in sizes:
+        t0 = time.perf_counter()
+        fill_history(main.store, size)
+        print(f"  filled {size:,} alerts in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+        asyncio.run(run(size))
+    main.store.clear_history()
+    return results
+
+
+# --- BASELINE ---
+P99_NOISE_MS = 0.05  # p99 shifts below this are timer/scheduler noise, not regressions
+
+
+def compare(results, baseline, tolerance):
+    """Flags results slower than the baseline by more than tolerance (throughput or p99)."""
+    regressions, report = [], {}
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        throughput = current["ops_per_sec"] / previous["ops_per_sec"]
+        p99 = current["p99_ms"] / previous["p99_ms"] if previous["p99_ms"] else 1.0
+        report[name] = {"throughput_ratio": round(throughput, 3), "p99_ratio": round(p99, 3)}
+        slower_p99 = p99 > 1 + tolerance and current["p99_ms"] - previous["p99_ms"] > P99_NOISE_MS
+        if throughput < 1 - tolerance or slower_p99:
+            regressions.append(name)
+    return report, regressions
+
+
+def run_all(sizes, n, concurrency, only=None):
+    random.seed(0)
+    t0 = time.perf_counter()
+    import ml.main as main  # Import cost is part of the cold-start picture
+    import_seconds = time.perf_counter() - t0
+
+    suites = {
+        "predict": lambda: bench_predict(main, n),
+        "ingest": lambda: bench_ingest(main, n, concurrency),
+        "wire": lambda: bench_wire(main, n),
+        "sharding": lambda: bench_sharding(main, n),
+        "forecast": lambda: bench_forecast(main, n),
+        "history": lambda: bench_history(main, sizes, max(10, n // 10)),
+    }
+    results = {}
+    for name, suite in suites.items():
+        if only and name not in only:
+            continue
+        print(f"Running {name} benchmarks...", file=sys.stderr)
+        results.update(suite())
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "import_seconds": round(import_seconds, 3),
+            "sizes": sizes,
+            "n": n,
+            "concurrency": concurrency,
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EcoCore hot-path benchmarks")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="History log sizes")
+    parser.add_argument("-n", type=int, default=2000, help="Operations per benchmark")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent ingest clients")
+    parser.add_argument("--only", default=None, help="Comma-separated: predict,ingest,wire,sharding,forecast,history")
+    parser.add_argument("--quick", action="store_true", help="n=200 and sizes 1000,10000")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown (0.25 = 25%%)")
+    parser.add_argument("--out", default=None, help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    n = args.n
+    if args.quick:
+        sizes, n = [1_000, 10_000], 200
+    report = run_all(sizes, n, args.concurrency, args.only.split(",") if args.only else None)
+
+    regressions = []
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            report["comparison"], regressions = compare(report["results"], json.load(f), args.tolerance)
+        report["regressions"] = regressions
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    for name in regressions:
+        print(f"REGRESSION: {name} {report['comparison'][name]}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
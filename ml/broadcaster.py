@@ -0,0 +1,106 @@
+import asyncio
+import json
+from collections import deque
+
+from fastapi.encoders import jsonable_encoder
+
+
+class Broadcaster:
+    """
+    Single fan-out point for live updates (Server-Sent Events).
+
+    Every event is serialized ONCE and the same frame is handed to all
+    subscriber queues. publish() is thread-safe, so sync routes running in the
+    threadpool and the ingest workers can both call it.
+    """
+
+    def __init__(self, max_queue=1000, replay_size=512):
+        self.max_queue = max_queue
+        self._subscribers = set()
+        self._recent = deque(maxlen=replay_size)  # For Last-Event-ID resume
+        self._next_id = 1
+        self._loop = None
+
+        self.published = 0
+        self.dropped_subscribers = 0
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+
+    def stop(self):
+        # Wake every stream so it can finish
+        for queue in list(self._subscribers):
+            self._close(queue)
+        self._loop = None
+
+    # --- PUBLISHING ---
+    def publish(self, event, data):
+        if self._loop is None:
+            return  # No server running (scripts, imports)
+        payload = json.dumps(jsonable_encoder(data))
+        try:
+            self._loop.call_soon_threadsafe(self._fan_out, event, payload)
+        except RuntimeError:
+            pass  # Loop already closed during shutdown
+
+    def _fan_out(self, event, payload):
+        event_id = self._next_id
+        self._next_id += 1
+        frame = f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n"
+        self._recent.append((event_id, frame))
+        self.published += 1
+
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait((event_id, frame))
+            except asyncio.QueueFull:
+                # Slow consumer: cut it off, the browser reconnects and resumes via Last-Event-ID
+                self.dropped_subscribers += 1
+                self._close(queue)
+
+    def _close(self, queue):
+        self._subscribers.discard(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    # --- SUBSCRIBING ---
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.max_queue)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    async def stream(self, last_event_id=None, keepalive=15.0):
+        """Yields SSE frames until the client goes away (or falls too far behind)."""
+        queue = self.subscribe()
+        try:
+            last_sent = 0
+            if last_event_id is not None:
+                for event_id, frame in list(self._recent):
+                    if event_id > last_event_id:
+                        last_sent = event_id
+                        yield frame
+
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is None:
+                    break
+                event_id, frame = item
+                if event_id > last_sent:  # Skip anything already replayed
+                    yield frame
+        finally:
+            self.unsubscribe(queue)
+
+    def stats(self):
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "dropped_subscribers": self.dropped_subscribers
+        }
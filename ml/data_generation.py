@@ -1,97 +1,125 @@
+import argparse
+import os
+
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 
-def generate_synthetic_data(days=30):
+from ml.tariffs import derc_tariff
+
+READINGS_PER_DAY = 96  # 15-minute intervals (Standard for Smart Meters)
+
+
+def room_ids(rooms, rooms_per_building=50):
+    return np.array([f"B{r // rooms_per_building + 1:02d}-R{r % rooms_per_building + 1:03d}"
+                     for r in range(rooms)])
+
+
+def generate_chunk(timestamps, rooms, rng, leak_rate=0.001, drip_rate=0.049, ids=None):
     """
-    Generates a Research-Grade synthetic dataset for 'EcoCore'.
+    Vectorized core: one row per (timestamp, room), all columns drawn as arrays.
 
     STATISTICAL BASES:
     1. Occupancy: Modeled on UCI Occupancy Detection Dataset (correlated with Light/Time).
     2. Water Flow: Modeled on AMPds (Almanac of Minutely Power) flow rates.
     3. Tariffs: Official DERC (Delhi Electricity Regulatory Commission) Commercial ToU.
     """
-    # Start date: 30 days ago from now
-    start_date = datetime.now() - timedelta(days=days)
-    # Create 15-minute intervals (Standard for Smart Meters)
-    timestamps = [start_date + timedelta(minutes=15 * i) for i in range(days * 96)]
-
-    data = []
-
-    print(f"Generating {len(timestamps)} data points based on DERC & UCI patterns...")
-
-    for ts in timestamps:
-        hour = ts.hour
-        is_weekend = ts.weekday() >= 5
-
-        # --- 1. SIMULATING SENSORS (Occupancy & Light) ---
-        # Logic: UCI dataset shows Occupancy is highly correlated with Light (Lux) & Time.
-
-        if 8 <= hour <= 18 and not is_weekend:
-            # Daytime (Classes/Office): Bright light, High probability of people
-            light_lux = np.random.normal(450, 50)  # Mean 450 Lux (Standard Office)
-            occupancy_prob = 0.95
-        elif 19 <= hour <= 23:
-            # Evening (Dorms/Study): Dimmer light, Medium probability
-            light_lux = np.random.normal(200, 100)  # Mean 200 Lux
-            occupancy_prob = 0.70
-        else:
-            # Night: Dark, Low probability (Janitors/Security only)
-            light_lux = max(0.0, float(np.random.normal(0, 10)))  # Near 0 Lux
-            occupancy_prob = 0.05
-
-        # Determine actual Occupancy (0 or 1) based on the probability
-        occupancy = 1 if np.random.random() < occupancy_prob else 0
-
-        # --- 2. SIMULATING WATER DEMAND ---
-        # Logic: Water usage exists mostly when occupied, but leaks happen when empty.
-
-        water_flow = 0.0
-        if occupancy == 1:
-            # Active Usage: Random spikes (Sinks, Toilets, Showers)
-            event_roll = np.random.random()
-            if event_roll < 0.15:  # 15% chance of usage in this 15-min block
-                water_flow = np.random.uniform(5, 12)  # Standard tap flow (L/min)
-            elif event_roll < 0.02:
-                water_flow = np.random.uniform(15, 25)  # High flow (Shower/Cleaning)
-        else:
-            # Passive Waste: "Phantom Leaks"
-            # 1% chance of a burst pipe (8.5L) or 5% chance of a drip (0.5L)
-            leak_roll = np.random.random()
-            if leak_roll < 0.001:
-                water_flow = 8.5  # CRITICAL LEAK
-            elif leak_roll < 0.05:
-                water_flow = 0.5  # Slow Drip
-
-        # --- 3. SIMULATING ENERGY TARIFFS (Delhi DERC Data) ---
-        # Source: DERC Commercial Tariff Order 2025-26
-        # Base Rate: Approx ₹8.50 / kWh
-
-        base_rate = 8.50
-
-        # Peak Hours (Surcharge +20%): 2 PM-5 PM & 10 PM-1 AM
-        if (14 <= hour < 17) or (22 <= hour < 25):
-            tariff = base_rate * 1.20
-
-        # Off-Peak Hours (Rebate -20%): Midnight - 6 AM
-        elif 0 <= hour < 6:
-            tariff = base_rate * 0.80
-
-        # Standard Hours: All other times
-        else:
-            tariff = base_rate
-
-        # Append row
-        data.append({
-            "timestamp": ts,
-            "hour": hour,
-            "light_lux": round(max(0.0, light_lux), 1),
-            "occupancy": occupancy,
-            "water_flow": round(water_flow, 2),
-            "tariff": round(tariff, 2)
-        })
-
-    df = pd.DataFrame(data)
+    ts = np.repeat(timestamps, rooms)
+    n = len(ts)
+    hour = ((ts - ts.astype("datetime64[D]")) // np.timedelta64(1, "h")).astype(np.int8)
+    is_weekend = ((ts.astype("datetime64[D]").view("int64") - 4) % 7) >= 5  # 1970-01-01 was a Thursday
+
+    # --- 1. SIMULATING SENSORS (Occupancy & Light) ---
+    # Logic: UCI dataset shows Occupancy is highly correlated with Light (Lux) & Time.
+    daytime = (hour >= 8) & (hour <= 18) & ~is_weekend  # Classes/Office: bright, people likely
+    evening = (hour >= 19) & (hour <= 23)  # Dorms/Study: dimmer, medium probability
+    noise = rng.standard_normal(n)
+    light_lux = np.select([daytime, evening], [450 + 50 * noise, 200 + 100 * noise], 10 * noise)
+    occupancy_prob = np.select([daytime, evening], [0.95, 0.70], 0.05)  # Night: janitors/security only
+
+    occupancy = (rng.random(n) < occupancy_prob).astype(np.int8)
+
+    # --- 2. SIMULATING WATER DEMAND ---
+    # Logic: Water usage exists mostly when occupied, but leaks happen when empty.
+    roll = rng.random(n)
+    occupied = occupancy == 1
+    water_flow = np.zeros(n)
+    # Active Usage: 2% High flow (Shower/Cleaning), 13% Standard tap flow (L/min)
+    shower = occupied & (roll < 0.02)
+    tap = occupied & (roll >= 0.02) & (roll < 0.15)
+    water_flow[shower] = rng.uniform(15, 25, shower.sum())
+    water_flow[tap] = rng.uniform(5, 12, tap.sum())
+    # Passive Waste: "Phantom Leaks" - burst pipe (8.5L) or slow drip (0.5L)
+    water_flow[~occupied & (roll < leak_rate)] = 8.5  # CRITICAL LEAK
+    water_flow[~occupied & (roll >= leak_rate) & (roll < leak_rate + drip_rate)] = 0.5  # Slow Drip
+
+    # --- 3. SIMULATING ENERGY TARIFFS (Delhi DERC Data) ---
+    tariff = derc_tariff(hour)
+
+    columns = {
+        "timestamp": ts,
+        "hour": hour,
+        "light_lux": np.round(np.maximum(0.0, light_lux), 1),
+        "occupancy": occupancy,
+        "water_flow": np.round(water_flow, 2),
+        "tariff": tariff,
+    }
+    if ids is not None:
+        columns["room_id"] = np.tile(ids, len(timestamps))
+    return pd.DataFrame(columns)
+
+
+def iter_synthetic_chunks(days=30, rooms=1, start=None, seed=None, leak_rate=0.001, drip_rate=0.049,
+                          rooms_per_building=50, chunk_rows=1_000_000):
+    """Yields DataFrames of at most ~chunk_rows rows, in time order."""
+    # Start date: `days` ago from now
+    start = np.datetime64(start or datetime.now() - timedelta(days=days), "us")
+    steps = days * READINGS_PER_DAY
+    steps_per_chunk = max(1, chunk_rows // rooms)
+    rng = np.random.default_rng(seed)
+    ids = room_ids(rooms, rooms_per_building) if rooms > 1 else None
+
+    for first in range(0, steps, steps_per_chunk):
+        step = np.arange(first, min(first + steps_per_chunk, steps))
+        timestamps = start + step * np.timedelta64(15, "m")
+        yield generate_chunk(timestamps, rooms, rng, leak_rate, drip_rate, ids)
+
+
+def write_synthetic_dataset(path, **options):
+    """Streams chunks to CSV or Parquet (pyarrow), so memory stays at one chunk."""
+    rows = 0
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Writing Parquet requires pyarrow (pip install pyarrow)")
+        writer = None
+        for chunk in iter_synthetic_chunks(**options):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            writer = writer or pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            rows += len(chunk)
+        if writer:
+            writer.close()
+    else:
+        if os.path.exists(path):
+            os.remove(path)
+        for chunk in iter_synthetic_chunks(**options):
+            chunk.to_csv(path, mode="a", header=rows == 0, index=False)
+            rows += len(chunk)
+    return rows
+
+
+def generate_synthetic_data(days=30, **options):
+    """
+    Generates a Research-Grade synthetic dataset for 'EcoCore' and saves it as
+    ecocore_research_data.csv. Returns it as one DataFrame, so keep this for small
+    sets and use write_synthetic_dataset for large ones.
+    """
+    print(f"Generating {days * READINGS_PER_DAY * options.get('rooms', 1)} data points based on DERC & UCI patterns...")
+
+    df = pd.concat(iter_synthetic_chunks(days=days, **options), ignore_index=True)
     filename = "ecocore_research_data.csv"
     df.to_csv(filename, index=False)
 
@@ -99,5 +127,22 @@ def generate_synthetic_data(days=30):
     print(f"Summary: {days} days of data generated.")
     return df
 
+
 if __name__ == "__main__":
-    generate_synthetic_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Synthetic EcoCore sensor data")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--rooms", type=int, default=1)
+    parser.add_argument("--rooms-per-building", type=int, default=50)
+    parser.add_argument("--leak-rate", type=float, default=0.001, help="Burst-pipe probability per empty reading")
+    parser.add_argument("--drip-rate", type=float, default=0.049, help="Slow-drip probability per empty reading")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--out", default=None, help=".csv or .parquet; streams in chunks when given")
+    args = parser.parse_args()
+
+    options = dict(rooms=args.rooms, rooms_per_building=args.rooms_per_building, seed=args.seed,
+                   leak_rate=args.leak_rate, drip_rate=args.drip_rate)
+    if args.out:
+        rows = write_synthetic_dataset(args.out, days=args.days, **options)
+        print(f"Success! {rows:,} rows saved to '{args.out}'")
+    else:
+        generate_synthetic_data(args.days, **options)
@@ -0,0 +1,122 @@
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import numpy as np
+
+from ml.scoring import expected_energy_load
+from ml.tariffs import PUMP_KWH_PER_LITER, derc_tariff
+
+MONTHLY_BUDGET = 5000  # ₹ per 30 days
+
+
+class ForecastEngine:
+    """
+    Vectorized budget forecast. All days x hours of the horizon are scored with
+    ONE predict call (on the distinct model inputs only), and results are cached
+    on (start date, model version, scenario) since nothing else changes them.
+    """
+
+    def __init__(self, brain, cache_size=64):
+        self.brain = brain
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def forecast(self, days=30, resolution="daily", weekday_occupancy=50, weekend_occupancy=0,
+                 weekday_lux=500, active_hours=(8, 18), rooms=1, start=None):
+        start = start or date.today()
+        scenario = (days, resolution, weekday_occupancy, weekend_occupancy, weekday_lux,
+                    tuple(active_hours), rooms)
+        key = (start.isoformat(), getattr(self.brain, "model_version", 0), scenario)
+
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+
+        if resolution == "hourly":
+            result = self._forecast_hourly(start, days, weekday_occupancy, weekend_occupancy, weekday_lux,
+                                           active_hours)
+        else:
+            result = self._forecast_daily(start, days, weekday_occupancy, weekend_occupancy, weekday_lux)
+
+        # The model has no room feature, so every room shares one profile
+        result = {name: values * rooms for name, values in result.items()}
+        result["dates"] = [start + timedelta(days=d) for d in range(1, days + 1)]
+
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def _day_flags(self, start, days):
+        # Forecast starts tomorrow, like the original loop (range(1, days + 1))
+        weekdays = (start.weekday() + np.arange(1, days + 1)) % 7
+        return weekdays >= 5
+
+    def _predict_unique(self, hours, occupancy, lux):
+        """Score only the distinct (hour, occupancy, lux) rows, then broadcast back."""
+        features = np.column_stack((hours.ravel(), occupancy.ravel(), lux.ravel()))
+        unique, inverse = np.unique(features, axis=0, return_inverse=True)
+        predictions = np.asarray(self.brain.predict_demand_batch(unique[:, 0], unique[:, 1], unique[:, 2]))
+        return predictions[inverse.ravel()].reshape(hours.shape)
+
+    def _hourly_profile(self, start, hours, weekday_occupancy, weekend_occupancy, weekday_lux, active_hours):
+        """(hour of day, occupancy, lux) for each of the next `hours` hours from start (a datetime)."""
+        offset = start.hour + np.arange(hours)
+        hour_of_day = (offset % 24).astype(np.float64)
+        is_weekend = (start.weekday() + offset // 24) % 7 >= 5
+        active = (hour_of_day >= active_hours[0]) & (hour_of_day <= active_hours[1])
+
+        occupancy = np.where(active, np.where(is_weekend, weekend_occupancy, weekday_occupancy), 0)
+        lux = np.where(active & ~is_weekend, weekday_lux, 0)
+        return hour_of_day, occupancy.astype(np.float64), lux.astype(np.float64)
+
+    def hourly_demand(self, start, hours=24, weekday_occupancy=50, weekend_occupancy=0, weekday_lux=500,
+                      active_hours=(8, 18)):
+        """Predicted litres per room for each of the next `hours` hours."""
+        profile = self._hourly_profile(start, hours, weekday_occupancy, weekend_occupancy, weekday_lux, active_hours)
+        return self._predict_unique(*profile) * 60  # L/min -> L per hour
+
+    def hourly_energy_load(self, start, hours=24, weekday_occupancy=5, weekend_occupancy=0, active_hours=(8, 18)):
+        """Expected kWh per room for each of the next `hours` hours (same formula as ingest)."""
+        _, occupancy, _ = self._hourly_profile(start, hours, weekday_occupancy, weekend_occupancy, 0, active_hours)
+        return expected_energy_load(occupancy)
+
+    def _forecast_daily(self, start, days, weekday_occupancy, weekend_occupancy, weekday_lux):
+        """
+        Legacy model: sample 10 AM as the representative peak hour, assume 10 active
+        hours a day and an average ₹8.50 rate (50% peak / 50% off-peak).
+        """
+        is_weekend = self._day_flags(start, days)
+        occupancy = np.where(is_weekend, weekend_occupancy, weekday_occupancy).astype(np.float64)
+        lux = np.where(is_weekend, 0, weekday_lux).astype(np.float64)
+        hours = np.full(days, 10.0)
+
+        hourly_flow = self._predict_unique(hours, occupancy, lux)
+        daily_water = hourly_flow * 60 * 10
+        daily_cost = daily_water * PUMP_KWH_PER_LITER * 8.50
+        return {"daily_water": daily_water, "daily_cost": daily_cost}
+
+    def _forecast_hourly(self, start, days, weekday_occupancy, weekend_occupancy, weekday_lux, active_hours):
+        """Every hour of every day scored and priced at its own DERC tariff."""
+        is_weekend = self._day_flags(start, days)[:, None]
+        hours = np.broadcast_to(np.arange(24, dtype=np.float64), (days, 24))
+        active = (hours >= active_hours[0]) & (hours <= active_hours[1])
+
+        occupancy = np.where(active, np.where(is_weekend, weekend_occupancy, weekday_occupancy), 0)
+        lux = np.where(active & ~is_weekend, weekday_lux, 0)
+
+        flow = self._predict_unique(hours, occupancy.astype(np.float64), lux.astype(np.float64))
+        water = flow * 60  # L/min -> L per hour
+        cost = water * PUMP_KWH_PER_LITER * derc_tariff(hours)
+        return {"daily_water": water.sum(axis=1), "daily_cost": cost.sum(axis=1)}
+
+    def stats(self):
+        return {"entries": len(self._cache), "hits": self.hits, "misses": self.misses}
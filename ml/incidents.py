@@ -0,0 +1,116 @@
+import threading
+import time
+
+from ml.records import AlertRecord, ACTIVE, RESOLVED
+
+# --- INCIDENTS ---
+# A leak reported every few seconds is one event, not thousands of alerts. Breaches
+# are folded into one open incident per (room_id, alert type):
+#
+#   first breach      -> incident opens: ONE alert (status ACTIVE) is recorded and pushed
+#   later breaches    -> running aggregates only (duration, waste, peak deviation)
+#   quiet_period with -> incident closes: ONE alert (status RESOLVED) with the totals
+#   no breach
+#
+# Every breach is still scored and answered (callers get the incident's current
+# view), but only these two transitions reach the store, the stream and the
+# actuators.
+#
+# Each breach's alert projects an hour of waste at its current excess, so an
+# incident's waste is that projection integrated over the time between
+# consecutive breaches (gaps capped at quiet_period).
+
+
+class Incident:
+    __slots__ = ("opening", "last", "last_seen", "breaches", "wasted", "savings", "probability", "peak",
+                 "peak_observed")
+
+    def __init__(self, alert):
+        self.opening = alert
+        self.last = alert
+        self.last_seen = time.monotonic()
+        self.breaches = 1
+        self.wasted = 0.0
+        self.savings = 0.0
+        self.probability = alert.probability
+        self.peak = alert.observed - alert.expected
+        self.peak_observed = alert.observed
+
+    def add(self, alert, max_gap):
+        hours = min(max((alert.time - self.last.time).total_seconds(), 0.0), max_gap) / 3600
+        self.wasted += self.last.wasted * hours  # The previous excess lasted until this reading
+        self.savings += self.last.savings * hours
+        self.last = alert
+        self.last_seen = time.monotonic()
+        self.breaches += 1
+        self.probability = max(self.probability, alert.probability)
+        if alert.observed - alert.expected > self.peak:
+            self.peak = alert.observed - alert.expected
+            self.peak_observed = alert.observed
+
+    def record(self, id, status):
+        """The incident as one alert: the current view (ACTIVE) or its closing alert (RESOLVED)."""
+        opening, last = self.opening, self.last
+        closed = status == RESOLVED
+        return AlertRecord(id, last.time, opening.room_id, opening.code, opening.expected,
+                           self.peak_observed if closed else last.observed,
+                           self.wasted if closed else last.wasted, self.savings if closed else last.savings,
+                           self.probability, last.run, last.pattern, opening.action, status,
+                           incident=opening.id, started=opening.time, breaches=self.breaches, peak=self.peak)
+
+
+class IncidentEngine:
+    """
+    Open incidents keyed by (room_id, alert type). breach() is called for every
+    alerting reading (any thread); sweep() closes incidents that have been quiet
+    for quiet_period seconds (of arrival time, so replayed timestamps can't close
+    them early). next_id allocates alert IDs, only for transitions.
+    """
+
+    def __init__(self, next_id, quiet_period=300.0):
+        self.next_id = next_id
+        self.quiet_period = quiet_period
+        self._open = {}
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.closed = 0
+        self.breaches = 0
+
+    def breach(self, alert):
+        """
+        alert: an AlertRecord for one reading (id unset). Returns (record, opened):
+        the opening alert to record when this breach opened an incident, else the
+        open incident's current view (not to be recorded).
+        """
+        key = (alert.room_id, alert.code)
+        with self._lock:
+            self.breaches += 1
+            incident = self._open.get(key)
+            if incident is None:
+                alert.id = alert.incident = self.next_id()
+                alert.started, alert.breaches, alert.peak = alert.time, 1, alert.observed - alert.expected
+                alert.status = ACTIVE
+                self._open[key] = Incident(alert)
+                self.opened += 1
+                return alert, True
+            incident.add(alert, self.quiet_period)
+            return incident.record(incident.opening.id, ACTIVE), False
+
+    def sweep(self, force=False):
+        """Closes quiet incidents (all of them with force=True). Returns their closing alerts."""
+        now = time.monotonic()
+        with self._lock:
+            quiet = [key for key, incident in self._open.items()
+                     if force or now - incident.last_seen >= self.quiet_period]
+            closing = [self._open.pop(key) for key in quiet]
+            self.closed += len(closing)
+        return [incident.record(self.next_id(), RESOLVED) for incident in closing]
+
+    def open_incidents(self):
+        with self._lock:
+            incidents = list(self._open.values())
+        return [incident.record(incident.opening.id, ACTIVE) for incident in incidents]
+
+    def stats(self):
+        return {"open": len(self._open), "opened": self.opened, "closed": self.closed, "breaches": self.breaches,
+                "quiet_period": self.quiet_period}
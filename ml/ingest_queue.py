@@ -0,0 +1,78 @@
+import asyncio
+
+
+class IngestPipeline:
+    """
+    Non-blocking ingest: endpoints enqueue readings and return immediately,
+    a pool of asyncio workers drains the queue in micro-batches.
+
+    process_batch(readings) is the (sync, CPU-bound) scoring function. It runs in
+    a worker thread so the event loop keeps accepting requests during inference.
+    """
+
+    def __init__(self, process_batch, max_queue=10_000, workers=4, max_batch=256):
+        self.process_batch = process_batch
+        self.max_queue = max_queue
+        self.workers = workers
+        self.max_batch = max_batch
+
+        self.queue = None
+        self._tasks = []
+
+        # Counters
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Finish what is already queued, then cancel the workers."""
+        if self.queue is None:
+            return
+        await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, reading):
+        """Returns False (instead of blocking) when the queue is full, so callers can answer 429."""
+        try:
+            self.queue.put_nowait(reading)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.accepted += 1
+        return True
+
+    async def _worker(self):
+        while True:
+            batch = [await self.queue.get()]
+            # Drain whatever else is already waiting, up to max_batch
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            try:
+                await asyncio.to_thread(self.process_batch, batch)
+                self.processed += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                print(f"Ingest worker failed on a batch of {len(batch)}: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "max_queue": self.max_queue,
+            "workers": self.workers,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed
+        }
@@ -1,16 +1,103 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import RedirectResponse
-from pydantic import BaseModel
-from typing import Optional
+from fastapi.responses import JSONResponse, RedirectResponse, PlainTextResponse
+from pydantic import AfterValidator, BaseModel, Field, model_validator
+from typing import Annotated, List, Optional
 from datetime import datetime, timedelta
 from ml.analytics import EcoBrain
+from ml.ingest_queue import IngestPipeline
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+from ml.storage import open_store, decode_cursor
+from ml.rollups import nest, total
+from ml.incidents import IncidentEngine
+from ml.archive import TelemetryArchive, hour_of_day
+from ml.wire import decode_frame, FrameError
+from ml.broadcaster import Broadcaster
+from fastapi.responses import StreamingResponse
+from fastapi import Header, Query
+from ml.forecast import ForecastEngine, MONTHLY_BUDGET
+from ml.pump_scheduler import PumpPlanner, check_tank
+from ml.battery import BatteryFleet
+from ml.actuators import open_dispatcher
+from ml.records import (AlertRecord, PumpRecord, BatteryRecord, render, dumps, WATER_ALERT, DRIP_ALERT,
+                        ENERGY_ALERT, LEAK_ALERT, OVERRIDE_ALERT, AUTO_CUTOFF, EXECUTED, MANUAL, SPIKE,
+                        SUSTAINED)
+from ml.twin import DigitalTwin, SCENARIO_DEFAULTS
+from ml.training import BackgroundTrainer
+from ml.room_state import RoomStateEngine
+from ml.scoring import score_batch
+from ml.sharding import ShardPool
+from ml.metrics import REGISTRY, MetricsMiddleware, profiler
+import asyncio
+import os
 import random
-
-app = FastAPI(title="EcoCore OS", version="1.0")
-brain = EcoBrain()
+import zlib
+import numpy as np
+
+COMPACTION_INTERVAL = 3600  # seconds between retention/compaction passes
+INCIDENT_SWEEP_INTERVAL = 5  # seconds between checks for incidents gone quiet
+
+async def compaction_loop():
+    while True:
+        await asyncio.sleep(COMPACTION_INTERVAL)
+        await asyncio.to_thread(store.compact)
+        await asyncio.to_thread(archive.compact)
+
+async def incident_loop():
+    while True:
+        await asyncio.sleep(INCIDENT_SWEEP_INTERVAL)
+        await asyncio.to_thread(close_quiet_incidents)
+
+@asynccontextmanager
+async def lifespan(app):
+    if shards:
+        # Shards memory-map the artifact this writes, so it must exist first
+        await asyncio.to_thread(brain.ensure_loaded)
+        await asyncio.to_thread(shards.start)
+    else:
+        asyncio.get_running_loop().run_in_executor(None, brain.ensure_loaded)
+    broadcaster.start()
+    await ingest_pipeline.start()
+    await actuators.start()
+    compaction_task = asyncio.create_task(compaction_loop())
+    incident_task = asyncio.create_task(incident_loop())
+    yield
+    compaction_task.cancel()
+    incident_task.cancel()
+    broadcaster.stop()
+    trainer.shutdown()
+    twin.shutdown()
+    if shards:
+        shards.stop()
+    await ingest_pipeline.stop()
+    close_quiet_incidents(force=True)  # Open incidents live in memory: record how far they got
+    await actuators.stop()
+    store.close()
+    archive.close()
+
+app = FastAPI(title="EcoCore OS", version="1.0", lifespan=lifespan)
+# lazy: the model is memory-mapped in the background, so static/dashboard routes serve immediately
+brain = EcoBrain(cache_size=50_000, lux_resolution=10.0, lazy=True)
+forecast_engine = ForecastEngine(brain)
+pump_planner = PumpPlanner(forecast_engine)
+battery_fleet = BatteryFleet(forecast_engine)
+# Rolling per-room baselines: tells a persistent drip from a one-off spike
+ROOM_STATE_OPTIONS = {"capacity": 16_384}
+room_state = RoomStateEngine(**ROOM_STATE_OPTIONS)
+
+# ECOCORE_SHARDS=N scores readings in N processes routed by room_id (each owns
+# its rooms' baselines). Unset/1: everything runs in this process.
+SHARD_COUNT = int(os.environ.get("ECOCORE_SHARDS", "1"))
+shards = ShardPool(SHARD_COUNT, **ROOM_STATE_OPTIONS) if SHARD_COUNT > 1 else None
+
+def score_readings(*columns):
+    if shards:
+        return shards.score(*columns)
+    return score_batch(brain, room_state, *columns)
+
+trainer = BackgroundTrainer(brain, on_swap=shards.reload_model if shards else None)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,27 +106,92 @@ app.add_middleware(
     allow_methods=["*"],  # Allows all methods (GET, POST, etc.)
     allow_headers=["*"],  # Allows all headers
 )
+app.add_middleware(MetricsMiddleware)  # Latency per route, see /metrics
 
 app.mount("/static", StaticFiles(directory="website/static"), name="static")
 templates = Jinja2Templates(directory="website/templates")
 
 # --- DATABASES ---
-alerts_log = []  # Stores Alert History
-pump_history_log = []  # Stores Pumping History
-battery_history_log = []  # Stores Battery Charging History
-room_status_db = {}  # Real-time Room Status
+# Alert, Pumping & Battery History plus Real-time Room Status.
+# ECOCORE_STORE=sqlite:///path/to/ecocore.db shares one store between workers.
+store = open_store(flush_interval=1.0,
+                   retention_days={"alerts": 90, "pumping": 365, "battery": 365})
+
+# Raw readings, columnar and memory-mapped (retraining, analytics and replay read them back).
+# ECOCORE_ARCHIVE=/path/to/dir puts it elsewhere, e.g. on a shared volume for several workers.
+archive = TelemetryArchive(os.environ.get("ECOCORE_ARCHIVE", os.path.join(os.path.dirname(__file__), "telemetry")),
+                           flush_interval=1.0, retention_days=365)
+twin = DigitalTwin(brain, archive=archive)
+
+# Live updates for dashboards/phones (see /api/stream)
+broadcaster = Broadcaster()
+
+# Valves and breakers over Modbus TCP. ECOCORE_ACTUATORS=/path/to/devices.json maps
+# rooms to controller coils; rooms without a mapping are only logged.
+def actuation_result(room_id):
+    update_room_status(room_id, store.get_room_status(room_id) or {})
+
+actuators = open_dispatcher(on_result=actuation_result)
+
+# --- METRICS (see /metrics) ---
+INGEST_READINGS = REGISTRY.counter("ecocore_ingest_readings_total", "Sensor readings received", ["path"])
+INGEST_SECONDS = REGISTRY.histogram("ecocore_ingest_seconds", "Time to score and record readings", ["path"])
+ALERTS_RAISED = REGISTRY.counter("ecocore_alerts_total", "Alerts recorded, by type", ["type"])
+OPTIMIZER_SECONDS = REGISTRY.histogram("ecocore_optimizer_seconds", "Optimizer run time", ["optimizer"])
+HISTORY_SECONDS = REGISTRY.histogram("ecocore_history_query_seconds", "History store query time", ["log"])
+
+def next_alert_id():
+    # Allocated by the store, so IDs never collide between threads or workers
+    return store.next_alert_id()
+
+# Which supply an AUTO_CUTOFF alert shuts off
+CUTOFF_UTILITY = {WATER_ALERT: "WATER", DRIP_ALERT: "WATER", ENERGY_ALERT: "POWER"}
+
+def record_alert(alert):
+    """ Stores an AlertRecord and returns its display dict (for responses and room status). """
+    ALERTS_RAISED.inc(alert.type)
+    store.append("alerts", alert)
+    rendered = alert.render()
+    broadcaster.publish("alert", rendered)
+    return rendered
+
+# Repeated breaches of one room and type are one incident: only its opening and
+# closing alerts are recorded. ECOCORE_INCIDENT_QUIET_SECONDS: breach-free time that closes it.
+INCIDENT_QUIET_PERIOD = float(os.environ.get("ECOCORE_INCIDENT_QUIET_SECONDS", "300"))
+incidents = IncidentEngine(next_alert_id, quiet_period=INCIDENT_QUIET_PERIOD)
+
+def raise_alert(alert):
+    """ One alerting reading. Returns the display dict of its incident (recorded only when it opens). """
+    record, opened = incidents.breach(alert)
+    rendered = record_alert(record) if opened else record.render()
+    if alert.action == AUTO_CUTOFF and alert.code in CUTOFF_UTILITY:
+        # Every breach, not just the opening one: a failed or hand-undone cutoff is sent again,
+        # and the dispatcher drops it while the coil is known to be off
+        actuators.command(alert.room_id, CUTOFF_UTILITY[alert.code], False)
+    return rendered
+
+def close_quiet_incidents(force=False):
+    for alert in incidents.sweep(force):
+        record_alert(alert)
+
+def record_history(log, record):
+    store.append(log, record)
+    broadcaster.publish(log, record.render())
+
+def update_room_status(room_id, status):
+    # What the valves/breakers acknowledged wins over what the reading assumed
+    status = {**status, **actuators.room_status(room_id)}
+    store.set_room_status(room_id, status)
+    broadcaster.publish("room_status", {"room_id": room_id, **status})
 
 def seed_demo_data():
     """ Generates 31 days of history. """
     now = datetime.now()
-    alerts_log.clear()
-    pump_history_log.clear()
-    battery_history_log.clear()
+    store.clear_history()
 
     for i in range(31):
         # Go back 'i' days
         past_date = now - timedelta(days=30-i) # Start 30 days ago, end today
-        date_str = past_date.strftime("%Y-%m-%d")
         is_weekend = past_date.weekday() >= 5
 
         # --- 1. Water Pump Data ---
@@ -51,19 +203,9 @@ def seed_demo_data():
         energy_kwh = (daily_water / 1000) * 0.5
         actual_cost = energy_kwh * 6.80  # Off-Peak
         peak_cost = energy_kwh * 10.20   # Peak
-        savings = peak_cost - actual_cost
-
-        pump_history_log.append({
-            "date": date_str,
-            "timestamp": past_date.replace(hour=2, minute=0),
-            "total_water_pumped": f"{int(daily_water)} L",
-            "scheduled_time": "02:00 AM",
-            "duration": f"{round(daily_water/5000, 1)} Hours",
-            "total_cost": round(actual_cost, 2),
-            "peak_cost_comparison": round(peak_cost, 2),
-            "money_saved": f"₹{round(savings, 2)}",
-            "grid_status": "Off-Peak"
-        })
+
+        store.append("pumping", PumpRecord(past_date.replace(hour=2, minute=0), daily_water, actual_cost, peak_cost,
+                                           start_hour=2, duration_hours=daily_water / 5000, optimized=False))
 
         # --- 2. Battery Data ---
         if is_weekend:
@@ -73,33 +215,31 @@ def seed_demo_data():
 
         batt_actual = daily_charge * 6.80
         batt_peak = daily_charge * 10.20
-        batt_savings = batt_peak - batt_actual
-
-        battery_history_log.append({
-            "date": date_str,
-            "timestamp": past_date.replace(hour=1, minute=0),
-            "energy_added": f"{int(daily_charge)} kWh",
-            "initial_charge": "20%",
-            "target_charge": "100%",
-            "total_cost": round(batt_actual, 2),
-            "peak_cost_comparison": round(batt_peak, 2),
-            "money_saved": f"₹{round(batt_savings, 2)}",
-            "grid_status": "Off-Peak"
-        })
+
+        store.append("battery", BatteryRecord(past_date.replace(hour=1, minute=0), 20, 100, daily_charge,
+                                              batt_actual, batt_peak, optimized=False))
 
     # Add a few "Recent" alerts so the table isn't empty
-    alerts_log.append({
-        "id": 101, "time": now - timedelta(hours=3),
-        "type": "CRITICAL_LEAK", "message": "Leak in Restroom 3B",
-        "probable_wastage": "450 Liters", "estimated_savings": "₹22.95",
-        "probability_score": "98.5%", "action": "AUTO_CUTOFF", "status": "RESOLVED"
-    })
-seed_demo_data()
+    store.append("alerts", AlertRecord(next_alert_id(), now - timedelta(hours=3), "Restroom 3B", LEAK_ALERT,
+                                       wasted=450, savings=22.95, probability=98.5))
+
+# A persistent store keeps its history; only seed a fresh one
+if store.is_empty():
+    seed_demo_data()
 
 # --- DATA MODELS ---
+def local_naive(value):
+    """ Aware timestamps ("...Z", "+05:30") become naive local time, like datetime.now() and the binary frames. """
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+# Every timestamp that enters the API is naive local, so readings with and without an offset compare
+LocalDatetime = Annotated[datetime, AfterValidator(local_naive)]
+
 class SensorReading(BaseModel):
     room_id: str
-    timestamp: Optional[datetime] = None
+    timestamp: Optional[LocalDatetime] = None
     occupancy: int
     light_lux: float
     water_flow: float
@@ -119,6 +259,25 @@ def calculate_confidence(value, threshold):
     confidence = min(0.99, 0.7 + (ratio * 0.1))
     return round(confidence * 100, 2)
 
+# Alert builders return AlertRecords without an ID: raise_alert() folds them into incidents
+def alert_pattern(run):
+    return SUSTAINED if run >= room_state.sustain_readings else SPIKE
+
+def build_water_alert(room_id, timestamp, predicted_water_normal, water_flow, wasted_liters, est_cost, prob, run=0):
+    return AlertRecord(None, timestamp, room_id, WATER_ALERT, predicted_water_normal, water_flow,
+                       wasted_liters, est_cost, prob, run, alert_pattern(run))
+
+def build_drip_alert(room_id, timestamp, predicted_water_normal, water_flow, run):
+    """ Small excess that kept coming back: too little for the spike threshold, still a leak. """
+    wasted_liters = (water_flow - predicted_water_normal) * 60
+    est_cost = (wasted_liters / 1000) * 0.5 * 10.20
+    return AlertRecord(None, timestamp, room_id, DRIP_ALERT, predicted_water_normal, water_flow,
+                       wasted_liters, est_cost, min(99.9, 50 + 10 * run), run, SUSTAINED)
+
+def build_energy_alert(room_id, timestamp, expected_energy_load, energy_load, wasted_kwh, est_cost, prob, run=0):
+    return AlertRecord(None, timestamp, room_id, ENERGY_ALERT, expected_energy_load, energy_load,
+                       wasted_kwh, est_cost, prob, run, alert_pattern(run))
+
 # --- CORE ROUTES ---
 @app.get("/")
 def read_root():
@@ -128,240 +287,656 @@ def dashboard(request: Request):
     """Serves the main website dashboard."""
     return templates.TemplateResponse("dashboard.html", {"request": request})
 @app.post("/sensor/ingest")
+@INGEST_SECONDS.timed("single")
 def ingest_sensor_data(data: SensorReading):
     """ Detects Leaks/Waste and triggers Auto-Cutoff. """
+    INGEST_READINGS.inc("single")
     if not data.timestamp: data.timestamp = datetime.now()
-    current_hour = data.timestamp.hour
-
-    # WATER THRESHOLD (AI Predicted)
-    predicted_water_normal = brain.predict_demand(current_hour, data.occupancy, data.light_lux)
-    water_threshold = (predicted_water_normal * 1.5) + 1.0  # Safety buffer
-
-    # ENERGY THRESHOLD (Context Calculated)
-    expected_energy_load = (data.occupancy * 0.2) + 0.2
-    energy_threshold = expected_energy_load * 1.2  # 20% Buffer for spikes
-
-    alert = None
-
-    # --- DYNAMIC WATER LEAK DETECTION ---
-    if data.water_flow > water_threshold:
-        deviation = data.water_flow - predicted_water_normal
-        prob = min(99.9, (deviation / water_threshold) * 100)
-
-        wasted_liters = (data.water_flow - predicted_water_normal) * 60
-        est_cost = (wasted_liters / 1000) * 0.5 * 10.20
-
-        alert = {
-            "id": len(alerts_log) + 1,
-            "time": data.timestamp,
-            "type": "AI_ANOMALY_WATER",
-            "message": f"Abnormal Water Flow! Expected {predicted_water_normal}L, Got {data.water_flow}L.",
-            "probable_wastage": f"{int(wasted_liters)} Liters",
-            "estimated_savings": f"₹{round(est_cost, 2)}",
-            "probability_score": f"{round(prob, 1)}%",
-            "action": "AUTO_CUTOFF",
-            "status": "RESOLVED"
-        }
-        alerts_log.append(alert)
-
-    # --- DYNAMIC ENERGY WASTE DETECTION ---
-    elif data.energy_load > energy_threshold:
-
-        # Calculate Deviation
-        deviation = data.energy_load - expected_energy_load
-
-        # If deviation is small (just noise), ignore. If large (AC left on), Alert.
-        if deviation > 0.5:
-            prob = min(99.9, (deviation / energy_threshold) * 100)
-
-            wasted_kwh = deviation * 1.0
-            est_cost = wasted_kwh * 10.20  # Peak Rate
-
-            alert = {
-                "id": len(alerts_log) + 1,
-                "time": data.timestamp,
-                "type": "AI_ANOMALY_ENERGY",
-                "message": f"Abnormal Energy Spike! Expected {round(expected_energy_load, 1)}kW, Got {data.energy_load}kW.",
-                "probable_wastage": f"{round(wasted_kwh, 2)} kWh",
-                "estimated_savings": f"₹{round(est_cost, 2)}",
-                "probability_score": f"{round(prob, 1)}%",
-                "action": "AUTO_CUTOFF",
-                "status": "RESOLVED"
-            }
-            alerts_log.append(alert)
-
-    room_status_db[data.room_id] = {
-    "pump_on": True,
-    "power_on": True,
-    "last_update": data.timestamp,
-    "latest_alert": alert
-}
 
+    # A batch of one: the same scoring (ml/scoring.py) and alert rules as the batch and binary paths
+    result = ingest_readings([data])["results"][0]
     return {
         "status": "success",
-        "alert": alert,
-        "debug": {
-            "ai_water_normal": predicted_water_normal,
-            "calc_energy_normal": expected_energy_load
-        }
+        "alert": result["alert"],
+        "debug": {name: result[name] for name in ("ai_water_normal", "calc_energy_normal", "water_run", "energy_run")}
     }
 
 
-@app.get("/api/pump/optimize")
-def calculate_pump_schedule():
+def detect_alerts(room_ids, timestamps, hours, occupancy, light_lux, water_flow, energy_load):
     """
-    Calculates best time to pump (Off-Peak).
-    Saves this decision to history.
+    Archives and scores columns of readings with ONE model call and vectorized
+    thresholds, then raises an alert for each row that needs one. Shared by the
+    JSON batch, binary and async ingest paths. Returns (state, {row: alert}).
     """
-    current_time = datetime.now()
-    # We multiply by 60 mins * 8 hours to simulate a full night's buffer fill.
-    predicted_flow_per_min = brain.predict_demand(hour=2, occupancy=0, light_lux=0)
+    archive.append(room_ids, timestamps, occupancy, light_lux, water_flow, energy_load)
+
+    # Thresholds, rolling baselines and alert masks (here, or in the rooms' shards)
+    state = score_readings(room_ids, hours, occupancy, light_lux, water_flow, energy_load)
+    predicted_water_normal = state["predicted_water_normal"]
+    expected_energy_load = state["expected_energy_load"]
+    water_threshold, energy_threshold = state["water_threshold"], state["energy_threshold"]
+    water_mask, drip_mask, energy_mask = state["water_mask"], state["drip_mask"], state["energy_mask"]
+    alert_rows = np.flatnonzero(water_mask | drip_mask | energy_mask)
+
+    water_deviation = water_flow - predicted_water_normal
+    energy_deviation = energy_load - expected_energy_load
+
+    water_prob = np.minimum(99.9, (water_deviation / water_threshold) * 100)
+    wasted_liters = water_deviation * 60
+    water_cost = (wasted_liters / 1000) * 0.5 * 10.20
+
+    energy_prob = np.minimum(99.9, (energy_deviation / energy_threshold) * 100)
+    energy_cost = energy_deviation * 10.20
+
+    alerts = {}
+    for i in alert_rows.tolist():
+        room_id, timestamp = str(room_ids[i]), timestamps[i]
+        if isinstance(timestamp, np.datetime64):  # Binary frames: only alerting rows become datetimes
+            timestamp = timestamp.item()
+        if water_mask[i]:
+            alert = build_water_alert(room_id, timestamp, float(predicted_water_normal[i]), float(water_flow[i]),
+                                      wasted_liters[i], water_cost[i], water_prob[i], state["water_run"][i])
+        elif drip_mask[i]:
+            alert = build_drip_alert(room_id, timestamp, float(predicted_water_normal[i]), float(water_flow[i]),
+                                     int(state["water_run"][i]))
+        else:
+            alert = build_energy_alert(room_id, timestamp, expected_energy_load[i], float(energy_load[i]),
+                                       energy_deviation[i], energy_cost[i], energy_prob[i], state["energy_run"][i])
+        alerts[i] = raise_alert(alert)
+    return state, alerts
 
-    # If the model predicts 0 (unlikely but possible), fallback to a safe base load
-    if predicted_flow_per_min <= 0:
-        predicted_flow_per_min = 20.0  # Safety fallback
+def ingest_readings(readings):
+    """
+    Scores a list of SensorReadings in one pass (see detect_alerts) and updates
+    their rooms' status. Every JSON ingest path goes through here.
+    """
+    if not readings:
+        return {"status": "success", "processed": 0, "alerts_raised": 0, "results": []}
 
-    total_water_needed = predicted_flow_per_min * 60 * 8 # Liters
+    now = datetime.now()
+    timestamps = [r.timestamp or now for r in readings]
+
+    hours = np.fromiter((ts.hour for ts in timestamps), dtype=np.int64, count=len(readings))
+    occupancy = np.fromiter((r.occupancy for r in readings), dtype=np.float64, count=len(readings))
+    light_lux = np.fromiter((r.light_lux for r in readings), dtype=np.float64, count=len(readings))
+    water_flow = np.fromiter((r.water_flow for r in readings), dtype=np.float64, count=len(readings))
+    energy_load = np.fromiter((r.energy_load for r in readings), dtype=np.float64, count=len(readings))
+
+    room_ids = [r.room_id for r in readings]
+    state, raised = detect_alerts(room_ids, timestamps, hours, occupancy, light_lux, water_flow, energy_load)
+    alerts = [raised.get(i) for i in range(len(readings))]
+    predicted_water_normal, expected_energy_load = state["predicted_water_normal"], state["expected_energy_load"]
+
+    # Last reading per room wins: one status update per room, not per reading
+    last_rows = {room_id: i for i, room_id in enumerate(room_ids)}
+    for room_id, i in last_rows.items():
+        update_room_status(room_id, {
+            "pump_on": True,
+            "power_on": True,
+            "last_update": timestamps[i],
+            "latest_alert": alerts[i]
+        })
 
-    energy_needed_kwh = (total_water_needed / 1000) * 0.5
+    return {
+        "status": "success",
+        "processed": len(readings),
+        "alerts_raised": len(raised),
+        "results": [
+            {
+                "room_id": reading.room_id,
+                "alert": alert,
+                "ai_water_normal": float(predicted_water_normal[i]),
+                "calc_energy_normal": float(expected_energy_load[i]),
+                "water_run": int(state["water_run"][i]),
+                "energy_run": int(state["energy_run"][i])
+            }
+            for i, (reading, alert) in enumerate(zip(readings, alerts))
+        ]
+    }
 
-    off_peak_rate = 6.80
-    peak_rate = 10.20
+@INGEST_SECONDS.timed("batch")
+def process_readings(readings):
+    """ Shared by the batch endpoint and the async ingest workers. """
+    return ingest_readings(readings)
 
-    actual_cost = energy_needed_kwh * off_peak_rate
-    potential_peak_cost = energy_needed_kwh * peak_rate
-    savings = potential_peak_cost - actual_cost
+@INGEST_SECONDS.timed("binary")
+def process_frame(frame):
+    """
+    Scores a decoded binary frame straight from its columns. Room status is
+    updated once per room (its last reading), and only alerts are returned.
+    """
+    room_ids = frame.room_ids
+    state, alerts = detect_alerts(room_ids, frame.times, hour_of_day(frame.times).astype(np.int64), frame.occupancy,
+                                  frame.light_lux, frame.water_flow, frame.energy_load)
+
+    # Last reading per room wins: one status update per room, not per reading
+    last_rows = len(frame) - 1 - np.unique(frame.codes[::-1], return_index=True)[1]
+    for i in last_rows.tolist():
+        update_room_status(str(room_ids[i]), {
+            "pump_on": True,
+            "power_on": True,
+            "last_update": frame.times[i].item(),
+            "latest_alert": alerts.get(i)
+        })
 
-    decision = {
-        "date": current_time.strftime("%Y-%m-%d"),
-        "timestamp": current_time,
-        "total_water_pumped": f"{int(total_water_needed)} L",
-        "scheduled_time": "02:00 AM",
-        "duration": f"{round(total_water_needed / 5000, 1)} Hours",
-        "total_cost": f"₹{round(actual_cost, 2)}",
-        "money_saved": f"₹{round(savings, 2)}",
-        "grid_status": "Off-Peak (Optimized)"
+    return {
+        "status": "success",
+        "processed": len(frame),
+        "alerts_raised": len(alerts),
+        "alerts": [{"index": i, **alert} for i, alert in sorted(alerts.items())]
     }
 
-    # Save to History Log
-    pump_history_log.append(decision)
-    return decision
+@app.post("/sensor/ingest/batch")
+def ingest_sensor_batch(readings: List[SensorReading]):
+    """ Bulk version of /sensor/ingest for gateways. """
+    INGEST_READINGS.inc("batch", amount=len(readings))
+    return process_readings(readings)
+
+@app.post("/sensor/ingest/binary")
+async def ingest_sensor_frame(request: Request):
+    """
+    Bulk ingest for high-rate gateways: one struct-packed frame of readings with
+    dictionary-encoded room IDs (layout in ml/wire.py, content type
+    application/vnd.ecocore.readings). Same scoring as /sensor/ingest/batch.
+    """
+    try:
+        frame = decode_frame(await request.body())
+    except FrameError as e:
+        return JSONResponse(status_code=422, content={"detail": str(e)})
+    INGEST_READINGS.inc("binary", amount=len(frame))
+    if not len(frame):
+        return {"status": "success", "processed": 0, "alerts_raised": 0, "alerts": []}
+    return await asyncio.to_thread(process_frame, frame)
+
+# --- ASYNC INGEST ---
+# Readings are queued and scored by background workers, so ingest latency
+# stays flat during bursts. A full queue answers 429 instead of piling up.
+ingest_pipeline = IngestPipeline(process_readings, max_queue=10_000, workers=4, max_batch=256)
+
+@app.post("/sensor/ingest/async", status_code=202)
+async def ingest_sensor_async(data: SensorReading):
+    """ Fire-and-forget ingest. Alerts show up in /api/history/alerts once processed. """
+    if not data.timestamp: data.timestamp = datetime.now()
 
+    if not ingest_pipeline.submit(data):
+        return JSONResponse(status_code=429, headers={"Retry-After": "1"},
+                            content={"status": "rejected", "reason": "Ingest queue full"})
+    INGEST_READINGS.inc("async")
+
+    return {"status": "queued", "queue_depth": ingest_pipeline.queue.qsize()}
+
+@app.get("/api/ingest/queue")
+async def get_ingest_queue_stats():
+    return ingest_pipeline.stats()
+
+
+class TankState(BaseModel):
+    tank_id: str
+    capacity: float = Field(gt=0)  # Liters
+    level: float = Field(ge=0)  # Liters, from the level sensor
+    pump_rate: float = Field(5000.0, gt=0)  # Liters per hour
+    min_level: float = Field(0.0, ge=0)
+    target_level: Optional[float] = Field(None, ge=0)  # Level to end the horizon at (default: current level)
+    rooms: int = Field(1, ge=0)  # Rooms drawing from this tank
+    weekday_occupancy: int = Field(50, ge=0)
+    weekend_occupancy: int = Field(0, ge=0)
+
+    @model_validator(mode="after")
+    def levels_fit_the_tank(self):
+        check_tank(self.capacity, self.level, self.pump_rate, self.min_level, self.target_level)
+        return self
+
+# Demo building tank for the dashboard's /api/pump/optimize (no level telemetry yet)
+DEFAULT_TANK = {"capacity": 20000.0, "level": 8000.0, "pump_rate": 5000.0, "min_level": 2000.0, "rooms": 50}
+last_recorded_pump_plan = None
+
+def tank_dict(tank: TankState):
+    tank = tank.model_dump(exclude={"tank_id"})
+    if tank["target_level"] is None:
+        del tank["target_level"]
+    return tank
+
+def pump_schedule(plan):
+    return [
+        {"hour": f"{hour:02d}:00", "pump_on": bool(on), "tariff": float(rate),
+         "demand_liters": round(float(demand), 1), "tank_level": round(float(level), 1)}
+        for hour, on, rate, demand, level in zip(plan["hour_of_day"], plan["pump_on"], plan["tariffs"],
+                                                 plan["demand"], plan["level"][1:])
+    ]
+
+@app.get("/api/pump/optimize")
+@OPTIMIZER_SECONDS.timed("pump")
+def calculate_pump_schedule(hours: int = Query(24, ge=1, le=48),
+                            capacity: float = Query(DEFAULT_TANK["capacity"], gt=0),
+                            level: float = Query(DEFAULT_TANK["level"], ge=0),
+                            pump_rate: float = Query(DEFAULT_TANK["pump_rate"], gt=0),
+                            min_level: float = Query(DEFAULT_TANK["min_level"], ge=0),
+                            rooms: int = Query(DEFAULT_TANK["rooms"], ge=0)):
+    """
+    Cheapest pump on/off plan for the next hours: predicted demand vs DERC tariffs,
+    within the tank's capacity and minimum level.
+    Saves each NEW plan to history (re-asking within the hour returns the cached one).
+    """
+    global last_recorded_pump_plan
+    try:
+        check_tank(capacity, level, pump_rate, min_level)
+    except ValueError as e:
+        return JSONResponse(status_code=422, content={"detail": str(e)})
+    current_time = datetime.now()
+    tank = {"capacity": capacity, "level": level, "pump_rate": pump_rate, "min_level": min_level, "rooms": rooms}
+    plan = pump_planner.plan([tank], hours)[0]
+
+    on_hours = [hour for hour, on in zip(plan["hour_of_day"], plan["pump_on"]) if on]
+    # Share of pumping hours at the cheapest rate in the horizon
+    on_tariffs = plan["tariffs"][plan["pump_on"]]
+    off_peak_share = float(np.mean(on_tariffs == plan["tariffs"].min())) if on_hours else 1.0
+
+    record = PumpRecord(current_time, plan["pumped_liters"], plan["cost"], plan["on_demand_cost"],
+                        start_hour=int(on_hours[0]) if on_hours else None, duration_hours=len(on_hours),
+                        off_peak_share=off_peak_share, violation_liters=plan["violation_liters"])
+
+    # Save to History Log, once per plan
+    if plan["plan_id"] != last_recorded_pump_plan:
+        last_recorded_pump_plan = plan["plan_id"]
+        record_history("pumping", record)
+    return {**record.render(), "schedule": pump_schedule(plan)}
+
+@app.post("/api/pump/optimize/fleet")
+@OPTIMIZER_SECONDS.timed("pump_fleet")
+def calculate_fleet_pump_schedules(tanks: List[TankState], hours: int = Query(24, ge=1, le=48)):
+    """ Plans many tanks in one vectorized solve; unchanged tanks come from the plan cache. """
+    plans = pump_planner.plan([tank_dict(tank) for tank in tanks], hours)
+    return [
+        {
+            "tank_id": tank.tank_id,
+            "pump_on": plan["pump_on"].astype(int).tolist(),
+            "tank_level": np.round(plan["level"], 1).tolist(),
+            "total_water_pumped": round(plan["pumped_liters"], 1),
+            "total_cost": round(plan["cost"], 2),
+            "money_saved": round(plan["on_demand_cost"] - plan["cost"], 2),
+            "constraint_violation": round(plan["violation_liters"], 1)
+        }
+        for tank, plan in zip(tanks, plans)
+    ]
+
+
+class BatteryTelemetry(BaseModel):
+    battery_id: str = "main"
+    soc_percent: Optional[float] = Field(None, ge=0, le=100)  # From the BMS, when it reports one
+    soc_kwh: Optional[float] = Field(None, ge=0)
+    # + charging / - discharging; integrated when no SoC is sent
+    power_kw: Optional[float] = Field(None, allow_inf_nan=False)
+    timestamp: Optional[LocalDatetime] = None
+    capacity_kwh: Optional[float] = Field(None, gt=0)
+    max_charge_kw: Optional[float] = Field(None, gt=0)
+    max_discharge_kw: Optional[float] = Field(None, gt=0)
+    efficiency: Optional[float] = Field(None, gt=0, le=1)  # Round trip
+    reserve_kwh: Optional[float] = Field(None, ge=0)
+    rooms: Optional[int] = Field(None, ge=0)
+    weekday_occupancy: Optional[int] = Field(None, ge=0)
+    weekend_occupancy: Optional[int] = Field(None, ge=0)
+
+last_recorded_battery_plan = {}
+
+def apply_battery_telemetry(reading: BatteryTelemetry):
+    """ Raises ValueError when the reading would leave the battery unplannable (e.g. reserve above capacity). """
+    battery = battery_fleet.update(**reading.model_dump())
+    return {"battery_id": reading.battery_id, "soc_kwh": round(battery["soc_kwh"], 2),
+            "soc_percent": round(battery["soc_kwh"] / battery["capacity_kwh"] * 100, 1)}
+
+@app.post("/sensor/battery")
+def ingest_battery_telemetry(reading: BatteryTelemetry):
+    """ State of charge from the BMS (or power flow to integrate). """
+    try:
+        return apply_battery_telemetry(reading)
+    except ValueError as e:
+        return JSONResponse(status_code=422, content={"detail": str(e)})
+
+@app.post("/sensor/battery/batch")
+def ingest_battery_telemetry_batch(readings: List[BatteryTelemetry]):
+    """ Readings are applied in order; a rejected one is reported in its place and the rest still apply. """
+    results = []
+    for reading in readings:
+        try:
+            results.append(apply_battery_telemetry(reading))
+        except ValueError as e:
+            results.append({"battery_id": reading.battery_id, "error": str(e)})
+    return results
+
+def battery_schedule(plan):
+    return [
+        {"hour": f"{hour:02d}:00", "action": "CHARGE" if energy > 0 else "DISCHARGE" if energy < 0 else "IDLE",
+         "energy_kwh": round(float(energy), 2), "tariff": float(rate), "load_kwh": round(float(load), 2),
+         "soc_percent": round(float(soc / plan["capacity_kwh"] * 100), 1)}
+        for hour, energy, rate, load, soc in zip(plan["hour_of_day"], plan["energy"], plan["tariffs"],
+                                                 plan["load"], plan["soc"][1:])
+    ]
 
 @app.get("/api/battery/optimize")
-def calculate_battery_schedule():
-    """ ENERGY ARBITRAGE: Charges battery during cheap hours. """
+@OPTIMIZER_SECONDS.timed("battery")
+def calculate_battery_schedule(battery_id: str = "main", hours: int = Query(24, ge=1, le=48)):
+    """
+    ENERGY ARBITRAGE: Charges the battery in cheap hours and discharges it into the
+    forecast load in expensive ones, starting from its last reported state of charge.
+    Saves each NEW plan to history (re-asking within the hour returns the cached one).
+    """
     current_time = datetime.now()
+    plan = battery_fleet.plan([battery_id], hours)[0]
+    if "error" in plan:
+        return JSONResponse(status_code=422, content={"detail": plan["error"]})
+    capacity = plan["capacity_kwh"]
+
+    charge_hours = [hour for hour, energy in zip(plan["hour_of_day"], plan["energy"]) if energy > 0]
+    charge_tariffs = plan["tariffs"][plan["energy"] > 0]
+    off_peak_share = float(np.mean(charge_tariffs == plan["tariffs"].min())) if charge_hours else 1.0
+
+    record = BatteryRecord(current_time, plan["soc"][0] / capacity * 100, plan["soc"].max() / capacity * 100,
+                           plan["charged_kwh"], plan["cost"], plan["no_battery_cost"], battery_id=battery_id,
+                           discharged_kwh=plan["discharged_kwh"],
+                           start_hour=int(charge_hours[0]) if charge_hours else None,
+                           charge_hours=len(charge_hours), off_peak_share=off_peak_share)
+
+    # Save to History, once per plan
+    if plan["plan_id"] != last_recorded_battery_plan.get(battery_id):
+        last_recorded_battery_plan[battery_id] = plan["plan_id"]
+        record_history("battery", record)
+    return {**record.render(), "schedule": battery_schedule(plan)}
+
+@app.get("/api/battery/fleet")
+@OPTIMIZER_SECONDS.timed("battery_fleet")
+def calculate_fleet_battery_schedules(hours: int = Query(24, ge=1, le=48)):
+    """ Plans every battery that has reported telemetry in one vectorized solve. """
+    battery_ids = battery_fleet.battery_ids()
+    plans = battery_fleet.plan(battery_ids, hours)
+    return [
+        {"battery_id": battery_id, "error": plan["error"]} if "error" in plan else
+        {
+            "battery_id": battery_id,
+            "energy_kwh": np.round(plan["energy"], 2).tolist(),
+            "soc_percent": np.round(plan["soc"] / plan["capacity_kwh"] * 100, 1).tolist(),
+            "energy_added": round(plan["charged_kwh"], 1),
+            "energy_discharged": round(plan["discharged_kwh"], 1),
+            "total_cost": round(plan["cost"], 2),
+            "money_saved": round(plan["no_battery_cost"] - plan["cost"], 2)
+        }
+        for battery_id, plan in zip(battery_ids, plans)
+    ]
 
-    # 1. Simulate Battery State
-    battery_capacity = 100.0  # kWh (Powerwall-sized commercial unit)
-    current_charge = 30.0  # kWh (Average based on usage patterns, 30% charged)
-
-    # 2. Calculate Needs
-    energy_needed_kwh = battery_capacity - current_charge  # 70 kWh needed
-
-    # 3. Cost Math (DERC Tariffs)
-    off_peak_rate = 6.80  # Night rate
-    peak_rate = 10.20  # Day rate
-
-    actual_cost = energy_needed_kwh * off_peak_rate
-    potential_peak_cost = energy_needed_kwh * peak_rate
-    savings = potential_peak_cost - actual_cost
-
-    # 4. Schedule (Charge Speed)
-    # Assume 10kW Charger -> 70kWh / 10kW = 7 Hours
-    duration_hours = energy_needed_kwh / 10.0
-
-    decision = {
-        "date": current_time.strftime("%Y-%m-%d"),
-        "timestamp": current_time,
-        "initial_charge": "30%",
-        "target_charge": "100%",
-        "energy_added": f"{energy_needed_kwh} kWh",
-        "scheduled_time": "01:00 AM",
-        "duration": f"{round(duration_hours, 1)} Hours",
-        "total_cost": f"₹{round(actual_cost, 2)}",
-        "money_saved": f"₹{round(savings, 2)}",
-        "grid_status": "Off-Peak (Optimized)"
-    }
+@app.get("/api/forecast/budget")
+def forecast_budget(days: int = Query(30, ge=1, le=365),
+                    resolution: str = Query("daily", pattern="^(daily|hourly)$"),
+                    weekday_occupancy: int = 50, weekend_occupancy: int = 0, rooms: int = 1,
+                    detail: bool = False):
+    """
+    FUTURE FORECASTING: Simulates the next N days (30/90/365) to predict the bill.
+    Used for 'Budget vs Actual' analysis.
 
-    # Save to History
-    battery_history_log.append(decision)
+    resolution=daily samples 10 AM as the representative "Peak Hour" (the original model);
+    resolution=hourly scores all 24 hours of every day at their own DERC tariff.
+    Assumption: Weekends are empty (0 occ), Weekdays are busy (50 occ).
+    """
+    result = forecast_engine.forecast(days=days, resolution=resolution, weekday_occupancy=weekday_occupancy,
+                                      weekend_occupancy=weekend_occupancy, rooms=rooms)
 
-    return decision
+    total_predicted_water = float(result["daily_water"].sum())
+    total_predicted_cost = float(result["daily_cost"].sum())
+    budget = MONTHLY_BUDGET * days / 30
 
-@app.get("/api/forecast/budget")
-def forecast_budget():
+    forecast = {
+        "forecast_period": f"Next {days} Days",
+        "projected_water_usage": f"{int(total_predicted_water):,} Liters",
+        "projected_bill": f"₹{int(total_predicted_cost):,}",
+        "status": "Under Budget" if total_predicted_cost < budget else "Over Budget",
+        "recommendation": "Maintain current schedule" if total_predicted_cost < budget else "Reduce peak pumping"
+    }
+    if detail:
+        forecast["daily"] = [
+            {"date": d.isoformat(), "water_liters": round(float(w), 1), "cost": round(float(c), 2)}
+            for d, w, c in zip(result["dates"], result["daily_water"], result["daily_cost"])
+        ]
+    return forecast
+
+# --- DIGITAL TWIN ---
+
+class TwinScenario(BaseModel):
+    name: str = SCENARIO_DEFAULTS["name"]
+    rooms: int = Field(SCENARIO_DEFAULTS["rooms"], ge=1)
+    tank_capacity: float = Field(SCENARIO_DEFAULTS["tank_capacity"], gt=0)
+    initial_level: float = Field(SCENARIO_DEFAULTS["initial_level"], ge=0)
+    pump_rate: float = Field(SCENARIO_DEFAULTS["pump_rate"], gt=0)
+    min_level: float = Field(SCENARIO_DEFAULTS["min_level"], ge=0)
+    pump_strategy: str = Field(SCENARIO_DEFAULTS["pump_strategy"], pattern="^(optimized|fixed|on_demand)$")
+    fixed_start_hour: int = Field(SCENARIO_DEFAULTS["fixed_start_hour"], ge=0, le=23)
+    refill_level: float = Field(SCENARIO_DEFAULTS["refill_level"], ge=0)
+    battery_capacity: float = Field(SCENARIO_DEFAULTS["battery_capacity"], ge=0)  # 0: no battery
+    battery_soc_percent: float = Field(SCENARIO_DEFAULTS["battery_soc_percent"], ge=0, le=100)
+    battery_max_kw: float = Field(SCENARIO_DEFAULTS["battery_max_kw"], gt=0)
+    battery_efficiency: float = Field(SCENARIO_DEFAULTS["battery_efficiency"], gt=0, le=1)
+    battery_reserve: float = Field(SCENARIO_DEFAULTS["battery_reserve"], ge=0)
+    leak_multiplier: float = Field(SCENARIO_DEFAULTS["leak_multiplier"], gt=0)
+    auto_cutoff: bool = SCENARIO_DEFAULTS["auto_cutoff"]
+    tariff_scale: float = Field(SCENARIO_DEFAULTS["tariff_scale"], gt=0)
+
+MAX_TWIN_SCENARIOS = 64
+
+@app.post("/api/twin/simulate")
+@OPTIMIZER_SECONDS.timed("twin")
+def simulate_scenarios(scenarios: List[TwinScenario],
+                       days: Optional[int] = Query(None, ge=1, le=366),
+                       resolution: str = Query("daily", pattern="^(daily|hourly)$"),
+                       source: str = Query("research", pattern="^(research|archive)$")):
     """
-    FUTURE FORECASTING: Simulates the next 30 days to predict the monthly bill.
-    Used for 'Budget vs Actual' analysis.
+    DIGITAL TWIN: Replays the research history, or the telemetry archive with
+    source=archive (the last `days` days up to the current hour, default all of it), under each "What If"
+    scenario: anomaly rules, pump strategy, tank and battery.
+    Returns tank levels (per day or per hour), shortages and cost per scenario.
     """
-    today = datetime.now()
-    total_predicted_water = 0
-    total_predicted_cost = 0
-
-    # Simulate next 30 days
-    for day in range(1, 31):
-        future_date = today + timedelta(days=day)
-        is_weekend = future_date.weekday() >= 5
-
-        # Assumption: Weekends are empty (0 occ), Weekdays are busy (50 occ)
-        sim_occupancy = 0 if is_weekend else 50
-        sim_light = 0 if is_weekend else 500
-
-        # Ask AI for daily demand (Summing 8 active hours for simplicity)
-        # We sample 10 AM as a representative "Peak Hour" for the model
-        if brain:
-            # AI Available: Ask for prediction
-            hourly_flow = brain.predict_demand(hour=10, occupancy=sim_occupancy, light_lux=sim_light)
-        else:
-            hourly_flow = (sim_occupancy * 0.2) + 2.0
+    if len(scenarios) > MAX_TWIN_SCENARIOS:
+        return JSONResponse(status_code=422, content={"detail": f"At most {MAX_TWIN_SCENARIOS} scenarios per run"})
+    scenarios = scenarios or [TwinScenario()]
+    try:
+        replay = twin.run([scenario.model_dump() for scenario in scenarios], days, source)
+    except ValueError as e:
+        return JSONResponse(status_code=404, content={"detail": str(e)})
+    step = 24 if resolution == "daily" else 1
+    return {
+        "start": replay["start"],
+        "hours": replay["hours"],
+        "resolution": resolution,
+        "scenarios": [
+            {
+                **{k: round(v, 2) if isinstance(v, float) else v for k, v in result.items() if k != "tank_level"},
+                "tank_level": np.round(result["tank_level"][::step], 1).tolist()
+            }
+            for result in replay["scenarios"]
+        ]
+    }
 
-        # Daily Water = Hourly Flow * 10 active hours
-        daily_water = hourly_flow * 60 * 10
-        total_predicted_water += daily_water
+@app.get("/api/twin/stats")
+def get_twin_stats():
+    return twin.stats()
 
-        # Cost Math (Assumes mixed peak/off-peak usage)
-        # 50% Peak (₹10.20), 50% Off-Peak (₹6.80) -> Avg ₹8.50
-        daily_kwh = (daily_water / 1000) * 0.5
-        daily_cost = daily_kwh * 8.50
+# --- TELEMETRY ARCHIVE ---
 
-        total_predicted_cost += daily_cost
+@app.get("/api/archive/stats")
+def get_archive_stats():
+    return archive.stats()
 
+@app.get("/api/archive/rooms/{room_id}")
+def get_room_readings(room_id: str, since: Optional[LocalDatetime] = None, until: Optional[LocalDatetime] = None,
+                      limit: int = Query(1000, ge=1, le=100_000)):
+    """ Raw readings of one room, oldest first (the last `limit` in the window). """
+    readings = archive.read(room_id=room_id, since=since, until=until)
+    rows = slice(max(0, len(readings["time"]) - limit), None)
     return {
-        "forecast_period": "Next 30 Days",
-        "projected_water_usage": f"{int(total_predicted_water):,} Liters",
-        "projected_bill": f"₹{int(total_predicted_cost):,}",
-        "status": "Under Budget" if total_predicted_cost < 5000 else "Over Budget",
-        "recommendation": "Maintain current schedule" if total_predicted_cost < 5000 else "Reduce peak pumping"
+        "room_id": room_id,
+        "count": len(readings["time"][rows]),
+        "time": readings["time"][rows].astype(str).tolist(),
+        "occupancy": readings["occupancy"][rows].tolist(),
+        # float32 on disk: round so 0.3 doesn't come back as 0.30000001192
+        **{name: np.round(readings[name][rows].astype(np.float64), 3).tolist()
+           for name in ("light_lux", "water_flow", "energy_load")}
     }
 
 # --- HISTORY ENDPOINTS ---
+# All history routes are newest first and accept since/until/limit/cursor.
+# Pass the X-Next-Cursor header back as ?cursor= to fetch the next page.
+# Responses carry an ETag: a poll with a matching If-None-Match gets an empty 304.
+# X-Last-Seq is the store's commit sequence: pass it back as ?after_seq= to get
+# only entries stored since (oldest first up to `limit`, then the next X-Last-Seq).
+
+class FastJSONResponse(Response):
+    """ Encoded by records.dumps (orjson when installed), skipping FastAPI's jsonable_encoder pass. """
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
+
+def history_response(request, log, after_seq=None, **query):
+    if query.get("cursor") and after_seq is None:
+        try:
+            decode_cursor(query["cursor"])
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"detail": str(e)})
+
+    # Version is read BEFORE the query, so a concurrent append can only make the ETag stale, never wrong
+    etag = f'"{log}-{store.version(log)}-{zlib.crc32(str(request.query_params).encode())}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    with HISTORY_SECONDS.time(log):
+        if after_seq is not None:
+            query.pop("cursor")
+            entries, last_seq = store.changes(log, after_seq, **query)
+            next_cursor = None
+        else:
+            # Read BEFORE the query: what commits meanwhile shows up in the next delta (again, at worst)
+            last_seq = store.last_seq(log)
+            entries, next_cursor = store.query(log, **query)
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Last-Seq": str(last_seq)}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return FastJSONResponse([render(entry) for entry in entries], headers=headers)
+
 @app.get("/api/history/alerts")
-def get_alert_history():
-    """Returns the full list of alerts for the website dashboard."""
-    return sorted(alerts_log, key=lambda x: x['time'], reverse=True)
+def get_alert_history(request: Request,
+                      since: Optional[LocalDatetime] = None, until: Optional[LocalDatetime] = None,
+                      limit: Optional[int] = Query(None, ge=1), cursor: Optional[str] = None,
+                      type: Optional[str] = None, room_id: Optional[str] = None,
+                      after_seq: Optional[int] = Query(None, ge=0)):
+    """Returns alerts for the website dashboard. after_seq returns only alerts stored since then."""
+    return history_response(request, "alerts", since=since, until=until, limit=limit,
+                            cursor=cursor, type=type, room_id=room_id, after_seq=after_seq)
 
 @app.get("/api/history/pumping")
-def get_pump_history():
+def get_pump_history(request: Request,
+                     since: Optional[LocalDatetime] = None, until: Optional[LocalDatetime] = None,
+                     limit: Optional[int] = Query(None, ge=1), cursor: Optional[str] = None,
+                     after_seq: Optional[int] = Query(None, ge=0)):
     """Returns the history of all pump operations."""
-    return sorted(pump_history_log, key=lambda x: x['timestamp'], reverse=True)
+    return history_response(request, "pumping", since=since, until=until, limit=limit,
+                            cursor=cursor, after_seq=after_seq)
 
 @app.get("/api/history/battery")
-def get_battery_history():
-    return sorted(battery_history_log, key=lambda x: x['timestamp'], reverse=True)
+def get_battery_history(request: Request,
+                        since: Optional[LocalDatetime] = None, until: Optional[LocalDatetime] = None,
+                        limit: Optional[int] = Query(None, ge=1), cursor: Optional[str] = None,
+                        after_seq: Optional[int] = Query(None, ge=0)):
+    return history_response(request, "battery", since=since, until=until, limit=limit,
+                            cursor=cursor, after_seq=after_seq)
+
+# --- ROLLUPS ---
+# Dashboard KPIs: totals kept up to date on every append, so this costs the same
+# with a month of history or years of it.
+
+@app.get("/api/rollups")
+def get_rollups(request: Request, grain: str = Query("daily", pattern="^(hourly|daily|monthly)$"),
+                since: Optional[LocalDatetime] = None, until: Optional[LocalDatetime] = None,
+                limit: Optional[int] = Query(None, ge=1), rooms: bool = False):
+    """
+    Water pumped, kWh, cost, savings and alert counts per hour/day/month (newest
+    first, the last `limit` periods) plus their totals. rooms=true adds alert
+    counts per room.
+    """
+    versions = "-".join(store.version(log) for log in ("alerts", "pumping", "battery"))
+    etag = f'"rollups-{versions}-{zlib.crc32(str(request.query_params).encode())}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    buckets = store.rollups(grain, since, until)[-limit if limit else None:][::-1]
+
+    def shape(metrics):
+        shaped = nest(metrics)
+        if not rooms:
+            del shaped["alerts"]["by_room"]
+        return shaped
+
+    return FastJSONResponse({
+        "grain": grain,
+        "totals": shape(total(buckets)),
+        "periods": [{"period": period, **shape(metrics)} for period, metrics in buckets]
+    }, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+@app.get("/api/brain/cache")
+def get_prediction_cache_stats():
+    """Hit/miss counters of the EcoBrain prediction cache."""
+    if not brain.cache:
+        return {"enabled": False}
+    return {"enabled": True, **brain.cache.stats()}
+
+@app.get("/api/rooms/state")
+def get_room_state_stats():
+    """Size and counters of the per-room rolling baselines (summed over shards)."""
+    return shards.stats() if shards else room_state.stats()
+
+@app.get("/api/rooms/{room_id}/baseline")
+def get_room_baseline(room_id: str):
+    baseline = shards.baseline(room_id) if shards else room_state.room(room_id)
+    if baseline is None:
+        return JSONResponse(status_code=404, content={"detail": "No readings for this room yet"})
+    return baseline
+
+@app.post("/api/brain/retrain", status_code=202)
+def retrain_model(incremental: bool = False, source: str = Query("research", pattern="^(research|archive)$")):
+    """
+    Retrains on the research data, or on the raw readings in the telemetry archive
+    (source=archive), in a background process (chunked, bounded memory).
+    incremental=true adds trees to the current model instead of starting over.
+    The new model is hot-swapped in when training finishes.
+    """
+    if source == "archive":
+        archive.flush()  # Include what is still buffered
+    source_path = archive.path if source == "archive" else None
+    if not trainer.start(source_path=source_path, incremental=incremental):
+        return JSONResponse(status_code=409, content={"status": "busy", "training": trainer.status})
+    return {"status": "started", "training": trainer.status}
+
+@app.get("/api/brain/retrain")
+def retrain_status():
+    return trainer.status
 
 @app.get("/api/status/{room_id}")
 def get_room_status(room_id: str):
 
-    room = room_status_db.get(room_id, {
+    room = store.get_room_status(room_id) or {
         "pump_on": False,
         "power_on": False
-    })
+    }
 
     return room
 
 
+@app.get("/api/incidents")
+def get_open_incidents():
+    """ Incidents still open, with their running totals (these are not in the alert history yet). """
+    open_incidents = [alert.render() for alert in incidents.open_incidents()]
+    return FastJSONResponse({**incidents.stats(), "incidents": open_incidents})
+
+@app.get("/api/actuators/stats")
+def actuator_stats():
+    return actuators.stats()
+
 # --- MANUAL OVERRIDE ---
 
 @app.post("/api/control/override")
@@ -373,35 +948,101 @@ def manual_override(cmd: OverrideCommand):
     timestamp = datetime.now()
 
     # Log the override action
-    log_entry = {
-        "id": len(alerts_log) + 1,
-        "time": timestamp,
-        "type": "MANUAL_OVERRIDE",
-        "message": f"{cmd.user} forced {cmd.utility} {cmd.action} in {cmd.room_id}.",
-        "probability_score": "100% (User Action)", # Manual is always 100%
-        "action": "EXECUTED",
-        "status": "MANUAL"
-    }
-    alerts_log.append(log_entry)
+    log_entry = record_alert(AlertRecord(next_alert_id(), timestamp, cmd.room_id, OVERRIDE_ALERT,
+                                         action=EXECUTED, status=MANUAL, user=cmd.user, utility=cmd.utility,
+                                         command=cmd.action))
+
+    # Send it to the room's controller; acknowledgement updates the room status again
+    on = {"ON": True, "FORCE_ON": True, "OFF": False, "FORCE_OFF": False}.get(cmd.action)
+    actuation = actuators.command(cmd.room_id, cmd.utility, on) if on is not None else "INVALID"
 
     # Update real-time status to reflect user command
-    if cmd.room_id in room_status_db:
+    room = store.get_room_status(cmd.room_id)
+    if room is not None:
         if cmd.action == "ON" and cmd.utility == "WATER":
-            room_status_db[cmd.room_id]['pump_on'] = True
+            room['pump_on'] = True
         
         elif cmd.action == "OFF" and cmd.utility == "WATER":
-            room_status_db[cmd.room_id]['pump_on'] = False
+            room['pump_on'] = False
 
         elif cmd.action == "ON" and cmd.utility == "POWER": 
-            room_status_db[cmd.room_id]['power_on'] = True
+            room['power_on'] = True
 
         elif cmd.action == "OFF" and cmd.utility == "POWER":
         
-            room_status_db[cmd.room_id]['power_on'] = False
-        
+            room['power_on'] = False
 
-    return {
+        update_room_status(cmd.room_id, room)
+
+    result = {
         "status": "success",
         "message": f"Command {cmd.action} sent to {cmd.utility} Controller.",
+        "actuation": actuation,
         "override_log": log_entry
-    }
\ No newline at end of file
+    }
+    broadcaster.publish("override", result)
+    return result
+
+
+# --- OBSERVABILITY ---
+# Gauges are read at scrape time, so they cost nothing between scrapes
+REGISTRY.gauge("ecocore_ingest_queue_depth", "Readings waiting for the async workers",
+               lambda: ingest_pipeline.stats()["queue_depth"])
+REGISTRY.gauge("ecocore_ingest_queue_rejected_total", "Async readings refused with 429",
+               lambda: ingest_pipeline.rejected, kind="counter")
+REGISTRY.gauge("ecocore_history_entries", "Entries per history log",
+               lambda: {(log,): size for log, size in store.sizes().items()}, ["log"])
+REGISTRY.gauge("ecocore_prediction_cache_hits_total", "EcoBrain cache hits",
+               lambda: brain.cache.hits, kind="counter")
+REGISTRY.gauge("ecocore_prediction_cache_misses_total", "EcoBrain cache misses",
+               lambda: brain.cache.misses, kind="counter")
+REGISTRY.gauge("ecocore_model_version", "Bumped on every model (re)load", lambda: brain.model_version)
+REGISTRY.gauge("ecocore_rooms_tracked", "Rooms with a rolling baseline",
+               lambda: (shards.stats() if shards else room_state.stats())["rooms"])
+REGISTRY.gauge("ecocore_incidents_open", "Alert incidents not yet closed", lambda: incidents.stats()["open"])
+REGISTRY.gauge("ecocore_alert_breaches_total", "Alerting readings, folded into incidents",
+               lambda: incidents.breaches, kind="counter")
+REGISTRY.gauge("ecocore_actuator_writes_in_flight", "Coils with a write awaiting acknowledgement",
+               lambda: actuators.stats()["in_flight"])
+REGISTRY.gauge("ecocore_batteries_tracked", "Batteries reporting telemetry",
+               lambda: battery_fleet.stats()["batteries"])
+REGISTRY.gauge("ecocore_stream_subscribers", "Open /api/stream connections",
+               lambda: broadcaster.stats()["subscribers"])
+REGISTRY.gauge("ecocore_profiler_running", "1 while the sampling profiler is on", lambda: int(profiler.running))
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus text exposition format."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/debug/profiler/start")
+def start_profiler(interval_ms: float = Query(5.0, ge=1.0, le=1000.0)):
+    """Starts the sampling profiler (every thread, every interval_ms). Off by default."""
+    if not profiler.start(interval_ms / 1000):
+        return JSONResponse(status_code=409, content={"status": "already running", **profiler.status()})
+    return profiler.status()
+
+@app.post("/debug/profiler/stop")
+def stop_profiler():
+    return profiler.stop()
+
+@app.get("/debug/profiler")
+def get_profile(limit: Optional[int] = Query(None, ge=1)):
+    """Collapsed stacks ("frame;frame;frame count"), ready for flamegraph.pl or speedscope."""
+    return PlainTextResponse(profiler.collapsed(limit))
+
+
+# --- LIVE UPDATES ---
+
+@app.get("/api/stream")
+async def live_stream(last_event_id: Optional[int] = Header(None)):
+    """
+    Server-Sent Events: alert, room_status, override, pumping and battery events
+    are pushed as they happen, replacing the 3-second polling loop.
+    """
+    return StreamingResponse(broadcaster.stream(last_event_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/stream/stats")
+async def live_stream_stats():
+    return broadcaster.stats()
\ No newline at end of file
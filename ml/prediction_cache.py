@@ -0,0 +1,143 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+
+class PredictionCache:
+    """
+    LRU memo of EcoBrain predictions on a quantized (hour, occupancy, lux-bin) grid.
+    Sensor inputs are small discrete values, so most readings hit an existing cell.
+    """
+
+    def __init__(self, max_entries=50_000, lux_resolution=10.0):
+        self.max_entries = max_entries
+        self.lux_resolution = float(lux_resolution)
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._warm_grid = None  # Remembered so a model swap can re-warm the same grid
+
+        # Scrapeable counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, hour, occupancy, light_lux):
+        return int(hour), int(occupancy), int(round(light_lux / self.lux_resolution))
+
+    def bin_lux(self, lux_bin):
+        """Representative lux value for a bin (what the model is actually asked)."""
+        return lux_bin * self.lux_resolution
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_compute(self, hour, occupancy, light_lux, predict_batch):
+        key = self.key(hour, occupancy, light_lux)
+        value = self.get(key)
+        if value is None:
+            value = float(predict_batch([key[0]], [key[1]], [self.bin_lux(key[2])])[0])
+            self.put(key, value)
+        return value
+
+    def get_or_compute_batch(self, hours, occupancies, light_luxes, predict_batch):
+        """
+        Cached lookups for a batch: each distinct cell is looked up once, under one
+        lock acquisition, and all misses are scored in ONE predict_batch call.
+        """
+        rows = {}
+        for i, key in enumerate(self.key(h, o, l) for h, o, l in zip(hours, occupancies, light_luxes)):
+            rows.setdefault(key, []).append(i)
+
+        values, missing = {}, []
+        with self._lock:
+            for key, idx in rows.items():
+                value = self._entries.get(key)
+                if value is None:
+                    missing.append(key)
+                    self.misses += len(idx)
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += len(idx)
+                    values[key] = value
+
+        if missing:
+            predictions = predict_batch([k[0] for k in missing], [k[1] for k in missing],
+                                        [self.bin_lux(k[2]) for k in missing])
+            computed = dict(zip(missing, (float(value) for value in predictions)))
+            values.update(computed)
+            with self._lock:
+                for key, value in computed.items():
+                    self._entries[key] = value
+                    self._entries.move_to_end(key)  # Another thread may have added it meanwhile
+                self._evict()
+
+        results = np.empty(sum(len(idx) for idx in rows.values()))
+        for key, idx in rows.items():
+            results[idx] = values[key]
+        return results
+
+    def warm(self, predict_batch, max_occupancy=100, max_lux=1000.0, now=None):
+        """
+        Precomputes the grid for the hours around `now` with one batched predict call:
+        the previous hour (late readings), the current one and as many following hours
+        as fit in max_entries. Readings for other hours are cached as they arrive.
+        """
+        self._warm_grid = (max_occupancy, max_lux)
+
+        lux_bins = np.arange(0, int(max_lux / self.lux_resolution) + 1)
+        per_hour = (max_occupancy + 1) * len(lux_bins)
+        current = (now or datetime.now()).hour
+        fit = min(24, max(1, self.max_entries // per_hour))
+        start = current - 1 if fit > 1 else current
+        warm_hours = [(start + k) % 24 for k in range(fit)]
+
+        hours, occupancies, bins = np.meshgrid(warm_hours, np.arange(max_occupancy + 1), lux_bins, indexing="ij")
+        hours, occupancies, bins = hours.ravel(), occupancies.ravel(), bins.ravel()
+        if len(hours) > self.max_entries:  # Not even one hour fits: keep the current hour's low end
+            hours, occupancies, bins = (a[:self.max_entries] for a in (hours, occupancies, bins))
+
+        predictions = predict_batch(hours, occupancies, bins * self.lux_resolution)
+        with self._lock:
+            self._entries.clear()
+            for h, o, b, value in zip(hours.tolist(), occupancies.tolist(), bins.tolist(), predictions.tolist()):
+                self._entries[(h, o, b)] = value
+
+    def rebuild(self, predict_batch):
+        """Called when the underlying model is swapped: drop stale entries, re-warm (around now) if we were warm."""
+        with self._lock:
+            self._entries.clear()
+        if self._warm_grid is not None:
+            self.warm(predict_batch, *self._warm_grid)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "lux_resolution": self.lux_resolution,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
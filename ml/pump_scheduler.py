@@ -0,0 +1,221 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+from ml.tariffs import PUMP_KWH_PER_LITER, hourly_tariffs
+
+# Soft-constraint price (₹ per litre) for dipping under the tank's minimum level,
+# overflowing it, or ending the horizon below target. Far above any tariff, so the
+# DP only accepts it when no plan can avoid it, and then picks the smallest violation.
+VIOLATION_PENALTY = 1000.0
+
+
+def check_tank(capacity, level, pump_rate, min_level, target_level=None):
+    """Raises ValueError for levels the DP can't plan (the API's field constraints cover signs)."""
+    if not np.isfinite([capacity, level, pump_rate, min_level]).all():
+        raise ValueError("Tank parameters must be finite numbers")
+    if not min_level <= level <= capacity:
+        raise ValueError("Tank levels must satisfy min_level <= level <= capacity")
+    if target_level is not None and not 0 <= target_level <= capacity:
+        raise ValueError("target_level must be between 0 and capacity")
+
+
+def _column(value, n_tanks):
+    return np.broadcast_to(np.asarray(value, dtype=np.float64), (n_tanks,))[:, None]
+
+
+def _transition(level, demand, on, pump_rate, min_level, capacity):
+    raw = level + on * pump_rate - demand
+    violation = np.maximum(0.0, min_level - raw) + np.maximum(0.0, raw - capacity)
+    return np.clip(raw, 0.0, capacity), violation
+
+
+def pump_policy(demand, tariffs, capacity, pump_rate, min_level, target_level, level_bins=200,
+                kwh_per_liter=PUMP_KWH_PER_LITER):
+    """
+    Backward pass of the DP: policy[t, tank, level_bin] is True where pumping in hour t
+    is cheapest. Also returns each tank's bin size in litres (bins = floor(level / step)).
+
+    demand: (T, H); tariffs: (H,) or one row per tank (T, H); the rest (T,) or scalars.
+    Policies don't depend on the starting level, so a caller can solve many
+    independent horizons (e.g. every day of a year) as one batch of "tanks".
+    """
+    demand = np.atleast_2d(np.asarray(demand, dtype=np.float64))
+    n_tanks, horizon = demand.shape
+    tariffs = np.broadcast_to(np.asarray(tariffs, dtype=np.float64), (n_tanks, horizon))
+    capacity, pump_rate, min_level = (_column(v, n_tanks) for v in (capacity, pump_rate, min_level))
+    target_level = np.minimum(_column(target_level, n_tanks), capacity)
+
+    step = capacity / level_bins
+    levels = step * np.arange(level_bins + 1)  # (T, B+1)
+    rows = np.arange(n_tanks)[:, None]
+
+    value = VIOLATION_PENALTY * np.maximum(0.0, target_level - levels)
+    policy = np.zeros((horizon, n_tanks, level_bins + 1), dtype=bool)
+    for t in range(horizon - 1, -1, -1):
+        costs = []
+        for on in (0, 1):
+            nxt, violation = _transition(levels, demand[:, t, None], on, pump_rate, min_level, capacity)
+            nxt_bin = np.minimum(np.floor(nxt / step + 1e-9).astype(np.int64), level_bins)
+            energy_cost = on * pump_rate * kwh_per_liter * tariffs[:, t, None]
+            costs.append(energy_cost + VIOLATION_PENALTY * violation + value[rows, nxt_bin])
+        policy[t] = costs[1] < costs[0]  # Ties: leave the pump off
+        value = np.minimum(costs[0], costs[1])
+    return policy, step[:, 0]
+
+
+def optimize_pump_schedules(demand, tariffs, capacity, initial_level, pump_rate, min_level,
+                            target_level=None, level_bins=200, kwh_per_liter=PUMP_KWH_PER_LITER):
+    """
+    Cheapest hourly pump on/off plan for T tanks at once (backward DP over tank level).
+
+    demand:  (T, H) litres drawn from each tank in each hour
+    tariffs: (H,) ₹/kWh for each hour
+    capacity, initial_level, pump_rate (L/h), min_level, target_level: (T,) or scalars.
+    target_level (default: initial_level) is the level the tank must end the horizon at,
+    so the plan can't save money by simply draining the tank.
+
+    Every tank's level is discretized into level_bins steps; the DP rounds levels
+    DOWN, so its plan never promises more water than the real tank holds. Cost is
+    O(T * H * level_bins) array work.
+    """
+    demand = np.atleast_2d(np.asarray(demand, dtype=np.float64))
+    n_tanks, horizon = demand.shape
+    tariffs = np.asarray(tariffs, dtype=np.float64)
+
+    capacity, initial_level, pump_rate, min_level = (
+        _column(v, n_tanks) for v in (capacity, initial_level, pump_rate, min_level))
+    target_level = initial_level[:, 0] if target_level is None else target_level
+    policy, step = pump_policy(demand, tariffs, capacity[:, 0], pump_rate[:, 0], min_level[:, 0],
+                               target_level, level_bins, kwh_per_liter)
+
+    # --- FORWARD PASS: follow the policy from the real starting levels ---
+    pump_on = np.zeros((n_tanks, horizon), dtype=bool)
+    level_path = np.zeros((n_tanks, horizon + 1))
+    level = np.minimum(initial_level[:, 0], capacity[:, 0])
+    level_path[:, 0] = level
+    violation_total = np.zeros(n_tanks)
+    for t in range(horizon):
+        bins = np.minimum(np.floor(level / step + 1e-9).astype(np.int64), level_bins)
+        on = policy[t, np.arange(n_tanks), bins]
+        nxt, violation = _transition(level[:, None], demand[:, t, None], on[:, None], pump_rate, min_level, capacity)
+        level = nxt[:, 0]
+        violation_total += violation[:, 0]
+        pump_on[:, t] = on
+        level_path[:, t + 1] = level
+
+    pumped = pump_on * pump_rate  # Litres per hour
+    energy_kwh = pumped * kwh_per_liter
+    cost = (energy_kwh * tariffs).sum(axis=1)
+    # Reference: the same water bought when it is used, i.e. at the demand-weighted tariff
+    total_demand = demand.sum(axis=1)
+    demand_rate = np.where(total_demand > 0, (demand * tariffs).sum(axis=1) / np.maximum(total_demand, 1e-9),
+                           tariffs.mean())
+    on_demand_cost = pumped.sum(axis=1) * kwh_per_liter * demand_rate
+
+    return {
+        "pump_on": pump_on,
+        "level": level_path,
+        "pumped_liters": pumped.sum(axis=1),
+        "energy_kwh": energy_kwh.sum(axis=1),
+        "cost": cost,
+        "on_demand_cost": on_demand_cost,
+        "violation_liters": violation_total,
+    }
+
+
+class PumpPlanner:
+    """
+    Plans tanks against the next hours of predicted demand and DERC tariffs.
+
+    Demand comes from ForecastEngine.hourly_demand (one EcoBrain batch for the
+    whole horizon). Plans are cached per tank on (start hour, model version, tank
+    parameters); a fleet request solves all cache misses in ONE vectorized DP.
+    """
+
+    def __init__(self, forecast_engine, cache_size=4096, level_bins=200):
+        self.forecast_engine = forecast_engine
+        self.level_bins = level_bins
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._next_plan_id = 1
+
+    def plan(self, tanks, hours=24, start=None):
+        """
+        tanks: dicts with capacity, level, pump_rate, min_level, rooms and optional
+        target_level / weekday_occupancy / weekend_occupancy. Returns one plan per tank.
+        """
+        start = (start or datetime.now()).replace(minute=0, second=0, microsecond=0)
+        model_version = getattr(self.forecast_engine.brain, "model_version", 0)
+        keys = [(start.isoformat(), hours, model_version, tuple(sorted(tank.items()))) for tank in tanks]
+
+        plans = [None] * len(tanks)
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    plans[i] = self._cache[key]
+            self.hits += sum(p is not None for p in plans)
+        missing = [i for i, p in enumerate(plans) if p is None]
+        if not missing:
+            return plans
+
+        with self._lock:
+            self.misses += len(missing)
+        solved = self._solve([tanks[i] for i in missing], hours, start)
+        with self._lock:
+            for i, plan in zip(missing, solved):
+                plans[i] = self._cache[keys[i]] = plan
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return plans
+
+    def _solve(self, tanks, hours, start):
+        tariffs = hourly_tariffs(hours, start.hour)
+
+        # Tanks share a demand profile per occupancy scenario: predict each scenario once
+        profiles = {}
+        demand = np.empty((len(tanks), hours))
+        for i, tank in enumerate(tanks):
+            scenario = (tank.get("weekday_occupancy", 50), tank.get("weekend_occupancy", 0))
+            if scenario not in profiles:
+                profiles[scenario] = self.forecast_engine.hourly_demand(start, hours, *scenario)
+            demand[i] = profiles[scenario] * tank["rooms"]
+
+        def field(name, default=None):
+            return np.array([tank.get(name, default) for tank in tanks], dtype=np.float64)
+
+        targets = [tank.get("target_level", tank["level"]) for tank in tanks]
+        result = optimize_pump_schedules(demand, tariffs, field("capacity"), field("level"), field("pump_rate"),
+                                         field("min_level", 0.0), targets, self.level_bins)
+
+        hour_labels = [(start.hour + h) % 24 for h in range(hours)]
+        plans = []
+        for i in range(len(tanks)):
+            with self._lock:
+                plan_id = self._next_plan_id  # Changes only when a plan is recomputed
+                self._next_plan_id += 1
+            plans.append({
+                "plan_id": plan_id,
+                "start": start,
+                "hours": hours,
+                "pump_on": result["pump_on"][i],
+                "level": result["level"][i],
+                "demand": demand[i],
+                "tariffs": tariffs,
+                "hour_of_day": hour_labels,
+                "pumped_liters": float(result["pumped_liters"][i]),
+                "energy_kwh": float(result["energy_kwh"][i]),
+                "cost": float(result["cost"][i]),
+                "on_demand_cost": float(result["on_demand_cost"][i]),
+                "violation_liters": float(result["violation_liters"][i]),
+            })
+        return plans
+
+    def stats(self):
+        return {"entries": len(self._cache), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,254 @@
+import json
+from datetime import datetime
+
+try:
+    import orjson
+except ImportError:  # Optional: the stdlib encoder is used instead
+    orjson = None
+
+# --- HISTORY RECORDS ---
+# Alerts, pumping and battery history are kept as small __slots__ objects holding
+# numbers and enum codes, not dicts of preformatted strings. ~3x less memory per
+# entry, aggregations read the numbers directly, and the display strings
+# ("₹22.95", "450 Liters", "98.5%") are built by render() only when a response
+# needs them.
+
+ALERT_TYPES = ("AI_ANOMALY_WATER", "SUSTAINED_LEAK", "AI_ANOMALY_ENERGY", "CRITICAL_LEAK", "MANUAL_OVERRIDE")
+ALERT_ACTIONS = ("AUTO_CUTOFF", "EXECUTED")
+ALERT_STATUSES = ("RESOLVED", "MANUAL", "ACTIVE")
+PATTERNS = ("SPIKE", "SUSTAINED")
+
+WATER_ALERT, DRIP_ALERT, ENERGY_ALERT, LEAK_ALERT, OVERRIDE_ALERT = range(len(ALERT_TYPES))
+AUTO_CUTOFF, EXECUTED = range(len(ALERT_ACTIONS))
+RESOLVED, MANUAL, ACTIVE = range(len(ALERT_STATUSES))
+SPIKE, SUSTAINED = range(len(PATTERNS))
+
+
+def _money(value):
+    return f"₹{round(value, 2)}"
+
+
+def _percent(value):
+    return f"{round(value, 1):g}%"
+
+
+def _clock(hour):
+    return datetime(2000, 1, 1, hour).strftime("%I:%M %p")
+
+
+def _grid_status(optimized, off_peak_share):
+    if not optimized:
+        return "Off-Peak"
+    if off_peak_share == 1.0:
+        return "Off-Peak (Optimized)"
+    return f"Optimized ({round(off_peak_share * 100)}% Off-Peak)"
+
+
+class Record:
+    """Common interface the stores rely on: time, id, room_id, type, a JSON row and render()."""
+    __slots__ = ()
+    id = room_id = type = None
+    _datetimes = ("time",)  # Slots stored as epoch seconds
+
+    def to_row(self):
+        """Plain values in slot order (datetimes as epoch seconds), for the SQLite store."""
+        return [value.timestamp() if isinstance(value, datetime) else value
+                for value in (getattr(self, name) for name in self.__slots__)]
+
+    @classmethod
+    def from_row(cls, row):
+        """Inverse of to_row; slots added after the row was written are None."""
+        record = cls.__new__(cls)
+        for i, name in enumerate(cls.__slots__):
+            value = row[i] if i < len(row) else None
+            if name in cls._datetimes and value is not None:
+                value = datetime.fromtimestamp(value)
+            setattr(record, name, value)
+        return record
+
+    def render(self):
+        raise NotImplementedError
+
+
+class AlertRecord(Record):
+    """
+    One alert. expected/observed are the model's normal and the measured reading
+    (L/min or kW), wasted is litres (kWh for energy), savings ₹, probability %.
+
+    Alerts that belong to an incident (see ml.incidents) carry its opening alert's
+    ID in `incident`: the opening alert projects an hour of waste, the closing one
+    reports what was wasted between the first and last breach, over `breaches`
+    readings since `started`, with the largest excess over normal in `peak`.
+    """
+    __slots__ = ("id", "time", "room_id", "code", "expected", "observed", "wasted", "savings", "probability",
+                 "run", "pattern", "action", "status", "user", "utility", "command", "incident", "started",
+                 "breaches", "peak")
+    _datetimes = ("time", "started")
+
+    def __init__(self, id, time, room_id, code, expected=0.0, observed=0.0, wasted=0.0, savings=0.0,
+                 probability=0.0, run=0, pattern=None, action=AUTO_CUTOFF, status=RESOLVED, user=None,
+                 utility=None, command=None, incident=None, started=None, breaches=None, peak=None):
+        self.id = id
+        self.time = time
+        self.room_id = room_id
+        self.code = code
+        self.expected = float(expected)
+        self.observed = float(observed)
+        self.wasted = float(wasted)
+        self.savings = float(savings)
+        self.probability = float(probability)
+        self.run = int(run)
+        self.pattern = pattern
+        self.action = action
+        self.status = status
+        self.user = user
+        self.utility = utility
+        self.command = command
+        self.incident = incident
+        self.started = started
+        self.breaches = breaches
+        self.peak = peak
+
+    @property
+    def type(self):
+        return ALERT_TYPES[self.code]
+
+    @property
+    def closes_incident(self):
+        return self.incident is not None and self.incident != self.id
+
+    def message(self):
+        if self.code == WATER_ALERT:
+            return f"Abnormal Water Flow! Expected {self.expected}L, Got {self.observed}L."
+        if self.code == DRIP_ALERT:
+            return (f"Persistent Slow Leak! {self.observed}L/min over {self.run} readings, "
+                    f"expected {round(self.expected, 2)}L.")
+        if self.code == ENERGY_ALERT:
+            return f"Abnormal Energy Spike! Expected {round(self.expected, 1)}kW, Got {self.observed}kW."
+        if self.code == OVERRIDE_ALERT:
+            return f"{self.user} forced {self.utility} {self.command} in {self.room_id}."
+        return f"Leak in {self.room_id}"
+
+    def render(self):
+        alert = {"id": self.id, "time": self.time, "room_id": self.room_id, "type": self.type,
+                 "message": self.message()}
+        if self.code == OVERRIDE_ALERT:
+            alert["probability_score"] = "100% (User Action)"  # Manual is always 100%
+        else:
+            if self.code == ENERGY_ALERT:
+                alert["probable_wastage"] = f"{round(self.wasted, 2)} kWh"
+            elif self.code == DRIP_ALERT and not self.closes_incident:
+                alert["probable_wastage"] = f"{int(self.wasted)} Liters/hour"
+            else:
+                alert["probable_wastage"] = f"{int(self.wasted)} Liters"
+            alert["estimated_savings"] = _money(self.savings)
+            alert["probability_score"] = _percent(self.probability)
+        if self.pattern is not None:
+            alert["pattern"] = PATTERNS[self.pattern]
+        alert["action"] = ALERT_ACTIONS[self.action]
+        alert["status"] = ALERT_STATUSES[self.status]
+        if self.incident is not None:
+            unit = "kW" if self.code == ENERGY_ALERT else "L/min"
+            alert["incident_id"] = self.incident
+            alert["started"] = self.started
+            alert["duration"] = f"{round((self.time - self.started).total_seconds() / 60, 1):g} min"
+            alert["breaches"] = self.breaches
+            alert["peak_deviation"] = f"{round(self.peak, 2)} {unit}"
+        return alert
+
+
+class PumpRecord(Record):
+    """One pumping run: litres, ₹ cost vs the on-demand (or all-peak) cost, when and how long."""
+    __slots__ = ("time", "pumped_liters", "cost", "peak_cost", "start_hour", "duration_hours", "optimized",
+                 "off_peak_share", "violation_liters")
+
+    def __init__(self, time, pumped_liters, cost, peak_cost, start_hour=None, duration_hours=0.0,
+                 optimized=True, off_peak_share=1.0, violation_liters=None):
+        self.time = time
+        self.pumped_liters = float(pumped_liters)
+        self.cost = float(cost)
+        self.peak_cost = float(peak_cost)
+        self.start_hour = start_hour
+        self.duration_hours = float(duration_hours)
+        self.optimized = optimized
+        self.off_peak_share = float(off_peak_share)
+        self.violation_liters = None if violation_liters is None else float(violation_liters)
+
+    def render(self):
+        entry = {
+            "date": self.time.strftime("%Y-%m-%d"),
+            "timestamp": self.time,
+            "total_water_pumped": f"{int(self.pumped_liters)} L",
+            "scheduled_time": _clock(self.start_hour) if self.start_hour is not None else "Not needed",
+            "duration": f"{round(self.duration_hours, 1):g} Hours",
+            "total_cost": round(self.cost, 2),
+            "peak_cost_comparison": round(self.peak_cost, 2),
+            "money_saved": _money(self.peak_cost - self.cost),
+            "grid_status": _grid_status(self.optimized, self.off_peak_share),
+        }
+        if self.violation_liters is not None:
+            entry["constraint_violation"] = f"{int(self.violation_liters)} L"
+        return entry
+
+
+class BatteryRecord(Record):
+    """One battery plan: SoC %, kWh in/out, ₹ cost vs the same load without the battery."""
+    __slots__ = ("time", "battery_id", "initial_soc", "target_soc", "charged_kwh", "discharged_kwh", "cost",
+                 "peak_cost", "start_hour", "charge_hours", "optimized", "off_peak_share")
+
+    def __init__(self, time, initial_soc, target_soc, charged_kwh, cost, peak_cost, battery_id=None,
+                 discharged_kwh=None, start_hour=None, charge_hours=None, optimized=True, off_peak_share=1.0):
+        self.time = time
+        self.battery_id = battery_id
+        self.initial_soc = float(initial_soc)
+        self.target_soc = float(target_soc)
+        self.charged_kwh = float(charged_kwh)
+        self.discharged_kwh = None if discharged_kwh is None else float(discharged_kwh)
+        self.cost = float(cost)
+        self.peak_cost = float(peak_cost)
+        self.start_hour = start_hour
+        self.charge_hours = charge_hours
+        self.optimized = optimized
+        self.off_peak_share = float(off_peak_share)
+
+    def render(self):
+        entry = {"date": self.time.strftime("%Y-%m-%d"), "timestamp": self.time}
+        if self.battery_id is not None:
+            entry["battery_id"] = self.battery_id
+        entry["initial_charge"] = f"{round(self.initial_soc)}%"
+        entry["target_charge"] = f"{round(self.target_soc)}%"
+        entry["energy_added"] = f"{round(self.charged_kwh, 1):g} kWh"
+        if self.discharged_kwh is not None:
+            entry["energy_discharged"] = f"{round(self.discharged_kwh, 1):g} kWh"
+        if self.charge_hours is not None:
+            entry["scheduled_time"] = _clock(self.start_hour) if self.start_hour is not None else "Not needed"
+            entry["duration"] = f"{self.charge_hours} Hours"
+        entry["total_cost"] = round(self.cost, 2)
+        entry["peak_cost_comparison"] = round(self.peak_cost, 2)
+        entry["money_saved"] = _money(self.peak_cost - self.cost)
+        entry["grid_status"] = _grid_status(self.optimized, self.off_peak_share)
+        return entry
+
+
+LOG_RECORDS = {"alerts": AlertRecord, "pumping": PumpRecord, "battery": BatteryRecord}
+
+
+def render(entry):
+    """Display dict of a record (entries written before records existed are already dicts)."""
+    return entry.render() if isinstance(entry, Record) else entry
+
+
+# --- JSON ---
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, "item"):  # NumPy scalars
+        return value.item()
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def dumps(obj):
+    """JSON bytes; orjson when it is installed (several times faster), else the stdlib encoder."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
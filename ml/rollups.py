@@ -0,0 +1,115 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from ml.records import AlertRecord, PumpRecord, BatteryRecord, ENERGY_ALERT, OVERRIDE_ALERT
+from ml.tariffs import PUMP_KWH_PER_LITER
+
+# --- ROLLUPS ---
+# Hourly/daily/monthly totals the dashboard needs (savings, costs, alert counts),
+# kept up to date as each record is appended instead of being re-aggregated from
+# the full histories on every refresh. A record adds a handful of numbers to one
+# bucket per grain: O(1), whatever the history size.
+#
+# Buckets are {metric: value}; metric names are "section.field" or
+# "section.group.key" (e.g. "alerts.by_room.Room 101") and nest that way in
+# responses. Rollups outlive the raw history's retention window.
+
+GRAINS = {"hourly": "%Y-%m-%dT%H", "daily": "%Y-%m-%d", "monthly": "%Y-%m"}
+RETENTION_DAYS = {"hourly": 14, "daily": 731, "monthly": None}  # None: kept forever
+
+
+def period_keys(time):
+    """(grain, period) of every bucket a record at `time` falls in; periods sort as strings."""
+    return [(grain, time.strftime(fmt)) for grain, fmt in GRAINS.items()]
+
+
+def contributions(record):
+    """(metric, amount) pairs a record adds to its buckets."""
+    if isinstance(record, PumpRecord):
+        return [("pumping.runs", 1), ("pumping.water_liters", record.pumped_liters),
+                ("pumping.kwh", record.pumped_liters * PUMP_KWH_PER_LITER), ("pumping.cost", record.cost),
+                ("pumping.savings", record.peak_cost - record.cost)]
+    if isinstance(record, BatteryRecord):
+        return [("battery.runs", 1), ("battery.charged_kwh", record.charged_kwh),
+                ("battery.discharged_kwh", record.discharged_kwh or 0.0), ("battery.cost", record.cost),
+                ("battery.savings", record.peak_cost - record.cost)]
+    if isinstance(record, AlertRecord):
+        # An incident counts once, when it opens; its waste is what its closing alert
+        # measured (the opening one only projects an hour of it)
+        metrics = []
+        if not record.closes_incident:
+            metrics += [("alerts.total", 1), (f"alerts.by_type.{record.type}", 1),
+                        (f"alerts.by_room.{record.room_id}", 1)]
+        if record.code == OVERRIDE_ALERT or (record.incident is not None and not record.closes_incident):
+            return metrics
+        metrics.append(("alerts.wasted_kwh" if record.code == ENERGY_ALERT else "alerts.wasted_liters",
+                        record.wasted))
+        metrics.append(("alerts.estimated_savings", record.savings))
+        return metrics
+    return []  # Entries stored as dicts before records existed
+
+
+def retention_cutoffs(now=None):
+    """{grain: oldest period to keep} for grains with a retention window."""
+    now = now or datetime.now()
+    return {grain: (now - timedelta(days=days)).strftime(GRAINS[grain])
+            for grain, days in RETENTION_DAYS.items() if days}
+
+
+def period_bounds(grain, since, until):
+    """Inclusive (first, last) period strings of a since/until window ("" and "~" when open)."""
+    fmt = GRAINS[grain]
+    return since.strftime(fmt) if since else "", until.strftime(fmt) if until else "~"
+
+
+class Rollups:
+    """In-memory rollups for MemoryStore (SQLiteStore keeps them in a table)."""
+
+    def __init__(self):
+        self._buckets = {grain: defaultdict(lambda: defaultdict(float)) for grain in GRAINS}
+
+    def add(self, record):
+        metrics = contributions(record)
+        for grain, period in period_keys(record.time):
+            bucket = self._buckets[grain][period]
+            for metric, amount in metrics:
+                bucket[metric] += amount
+
+    def query(self, grain, since=None, until=None):
+        """[(period, {metric: value})], oldest first."""
+        lo, hi = period_bounds(grain, since, until)
+        buckets = self._buckets[grain]
+        return [(period, dict(buckets[period])) for period in sorted(buckets) if lo <= period <= hi]
+
+    def prune(self, cutoffs):
+        for grain, cutoff in cutoffs.items():
+            buckets = self._buckets[grain]
+            for period in [p for p in buckets if p < cutoff]:
+                del buckets[period]
+
+    def clear(self):
+        for buckets in self._buckets.values():
+            buckets.clear()
+
+
+def nest(metrics):
+    """{"alerts.by_type.X": 2, ...} -> {"alerts": {"by_type": {"X": 2}}}, values rounded for display."""
+    out = {"pumping": {}, "battery": {}, "alerts": {"total": 0, "by_type": {}, "by_room": {}}}
+    for metric, value in metrics.items():
+        value = int(value) if value == int(value) else round(value, 2)
+        section, _, rest = metric.partition(".")
+        group, _, key = rest.partition(".")
+        if key:
+            out[section].setdefault(group, {})[key] = value
+        else:
+            out[section][group] = value
+    return out
+
+
+def total(buckets):
+    """Sum of [(period, metrics)] into one metrics dict."""
+    summed = defaultdict(float)
+    for _, metrics in buckets:
+        for metric, value in metrics.items():
+            summed[metric] += value
+    return summed
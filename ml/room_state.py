@@ -0,0 +1,154 @@
+import threading
+
+import numpy as np
+
+
+class RoomStateEngine:
+    """
+    Per-room rolling baselines for the ingest path.
+
+    Every room owns one slot in a set of fixed NumPy columns: an EWMA and EW
+    variance of how far water/energy sit above their expected value, plus a
+    counter of consecutive abnormal readings. Updates are O(1) per reading and a
+    room costs the same ~30 bytes whether it has sent ten readings or ten million,
+    so 10k+ rooms fit comfortably in one process.
+
+    The run counters are what tell a persistent slow drip (small excess, reading
+    after reading) from a one-off spike (large excess, once).
+    """
+
+    def __init__(self, capacity=1024, alpha=0.05, z_threshold=3.0, sustain_readings=4,
+                 water_floor=0.25, energy_floor=0.5):
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.sustain_readings = sustain_readings
+        self.water_floor = water_floor  # L/min above the model that always counts (drip size)
+        self.energy_floor = energy_floor  # kW above the formula, same as the legacy noise gate
+
+        self._slots = {}
+        self._lock = threading.Lock()
+        self._allocate(capacity)
+
+        self.updates = 0
+        self.sustained_events = 0
+
+    def _allocate(self, capacity):
+        old = getattr(self, "_columns", None)
+        self._columns = {
+            "water_mean": np.zeros(capacity, dtype=np.float32),
+            "water_var": np.zeros(capacity, dtype=np.float32),
+            "energy_mean": np.zeros(capacity, dtype=np.float32),
+            "energy_var": np.zeros(capacity, dtype=np.float32),
+            "water_run": np.zeros(capacity, dtype=np.uint16),
+            "energy_run": np.zeros(capacity, dtype=np.uint16),
+            "count": np.zeros(capacity, dtype=np.uint32),
+        }
+        if old is not None:
+            for name, column in old.items():
+                self._columns[name][:len(column)] = column
+        self.capacity = capacity
+
+    def _slot_array(self, room_ids):
+        if isinstance(room_ids, np.ndarray):
+            # Columnar batches (binary frames): one dict lookup per distinct room
+            rooms, inverse = np.unique(room_ids, return_inverse=True)
+            return self._slot_array(rooms.tolist())[inverse]
+        slots = np.empty(len(room_ids), dtype=np.int64)
+        for i, room_id in enumerate(room_ids):
+            slot = self._slots.get(room_id)
+            if slot is None:
+                slot = self._slots[room_id] = len(self._slots)
+                if slot >= self.capacity:
+                    self._allocate(self.capacity * 2)
+            slots[i] = slot
+        return slots
+
+    # --- UPDATE ---
+    def update(self, room_ids, water_excess, energy_excess):
+        """
+        Folds one reading per entry into its room's state and returns per-reading
+        arrays: z-scores against the baseline BEFORE this reading, run lengths
+        after it, and *_sustained flags that are True exactly when a run reaches
+        sustain_readings (one flag per episode, not one per reading).
+        """
+        water_excess = np.asarray(water_excess, dtype=np.float64)
+        energy_excess = np.asarray(energy_excess, dtype=np.float64)
+        n = len(water_excess)
+        out = {name: np.zeros(n) for name in ("water_z", "energy_z", "water_baseline", "energy_baseline")}
+        out.update({name: np.zeros(n, dtype=np.int64) for name in ("water_run", "energy_run")})
+
+        with self._lock:
+            slots = self._slot_array(room_ids)
+
+            # A batch may hold several readings for one room; they must be applied in
+            # order, so split it into rounds where each room appears at most once.
+            order = np.argsort(slots, kind="stable")
+            sorted_slots = slots[order]
+            group_start = np.r_[0, np.flatnonzero(np.diff(sorted_slots)) + 1]
+            group_size = np.diff(np.r_[group_start, n])
+            rank = np.arange(n) - np.repeat(group_start, group_size)
+
+            for r in range(int(rank.max()) + 1 if n else 0):
+                rows = order[rank == r]
+                s = slots[rows]
+                self._update_signal("water", self.water_floor, s, rows, water_excess[rows], out)
+                self._update_signal("energy", self.energy_floor, s, rows, energy_excess[rows], out)
+                self._columns["count"][s] += 1
+
+            self.updates += n
+
+        out["water_sustained"] = out["water_run"] == self.sustain_readings
+        out["energy_sustained"] = out["energy_run"] == self.sustain_readings
+        self.sustained_events += int(out["water_sustained"].sum() + out["energy_sustained"].sum())
+        return out
+
+    def _update_signal(self, kind, floor, s, rows, x, out):
+        mean = self._columns[f"{kind}_mean"]
+        var = self._columns[f"{kind}_var"]
+        run = self._columns[f"{kind}_run"]
+
+        m = mean[s].astype(np.float64)
+        v = var[s].astype(np.float64)
+        std = np.sqrt(v) + 1e-6
+        z = (x - m) / std
+        warm = self._columns["count"][s] >= self.sustain_readings
+
+        # Abnormal: above the absolute floor AND (once warmed up) outside the room's own band
+        abnormal = (x > floor) & (~warm | (x > m + self.z_threshold * std))
+        run[s] = np.where(abnormal, np.minimum(run[s].astype(np.int64) + 1, 65535), 0)
+
+        # Only normal readings move the baseline, so a drip can't teach itself to be normal
+        normal = ~abnormal
+        diff = x[normal] - m[normal]
+        increment = self.alpha * diff
+        mean[s[normal]] = m[normal] + increment
+        var[s[normal]] = (1 - self.alpha) * (v[normal] + diff * increment)
+
+        out[f"{kind}_z"][rows] = z
+        out[f"{kind}_run"][rows] = run[s]
+        out[f"{kind}_baseline"][rows] = m
+
+    # --- INSPECTION ---
+    def room(self, room_id):
+        slot = self._slots.get(room_id)
+        if slot is None:
+            return None
+        c = self._columns
+        return {
+            "readings": int(c["count"][slot]),
+            "water_baseline": round(float(c["water_mean"][slot]), 3),
+            "water_std": round(float(np.sqrt(c["water_var"][slot])), 3),
+            "water_run": int(c["water_run"][slot]),
+            "energy_baseline": round(float(c["energy_mean"][slot]), 3),
+            "energy_std": round(float(np.sqrt(c["energy_var"][slot])), 3),
+            "energy_run": int(c["energy_run"][slot]),
+        }
+
+    def stats(self):
+        return {
+            "rooms": len(self._slots),
+            "capacity": self.capacity,
+            "state_bytes": sum(column.nbytes for column in self._columns.values()),
+            "updates": self.updates,
+            "sustained_events": self.sustained_events,
+        }
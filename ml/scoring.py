@@ -0,0 +1,43 @@
+import numpy as np
+
+
+def expected_energy_load(occupancy):
+    """Context-calculated normal load (kW) for a room with this many people."""
+    return (occupancy * 0.2) + 0.2
+
+
+def score_batch(brain, room_state, room_ids, hours, occupancy, light_lux, water_flow, energy_load):
+    """
+    The numeric half of ingest: thresholds, rolling baselines and alert masks for a
+    batch, as arrays. Building/recording alerts is left to the caller, so this runs
+    the same in the API process and in a shard process (see ml/sharding.py).
+    """
+    # WATER THRESHOLD (AI Predicted) - one predict call for the whole batch
+    predicted_water_normal = np.asarray(brain.predict_demand_batch(hours, occupancy, light_lux), dtype=np.float64)
+    water_threshold = (predicted_water_normal * 1.5) + 1.0
+
+    # ENERGY THRESHOLD (Context Calculated)
+    expected_load = expected_energy_load(occupancy)
+    energy_threshold = expected_load * 1.2
+
+    # ROLLING BASELINE (per room) - readings for the same room are applied in order
+    water_deviation = water_flow - predicted_water_normal
+    energy_deviation = energy_load - expected_load
+    state = room_state.update(room_ids, water_deviation, energy_deviation)
+
+    # Same precedence as the single reading path: water spike, then drip, then energy
+    water_mask = water_flow > water_threshold
+    drip_mask = ~water_mask & state["water_sustained"]
+    energy_mask = ~water_mask & ~drip_mask & (energy_load > energy_threshold) & (energy_deviation > 0.5)
+
+    return {
+        "predicted_water_normal": predicted_water_normal,
+        "water_threshold": water_threshold,
+        "expected_energy_load": expected_load,
+        "energy_threshold": energy_threshold,
+        "water_mask": water_mask,
+        "drip_mask": drip_mask,
+        "energy_mask": energy_mask,
+        "water_run": state["water_run"],
+        "energy_run": state["energy_run"],
+    }
@@ -0,0 +1,167 @@
+import multiprocessing
+import os
+import threading
+import zlib
+
+import numpy as np
+
+# --- SHARDED SCORING ---
+# Readings are routed by a stable hash of room_id to a fixed set of worker
+# processes. Each shard owns its rooms' rolling baselines (RoomStateEngine) and
+# its own EcoBrain, which memory-maps the same .ecotree artifact, so N shards
+# share one copy of the model in the page cache. The API process keeps the store
+# (alerts, history, room status) and gathers shard state for queries.
+#
+# Only scoring is parallel: archiving, alert building and store writes stay in the
+# API process, and a single reading pays one pipe round trip. So shards pay off for
+# large batches on a machine with cores to spare; measure before enabling them:
+#   python -m ml.benchmarks --only sharding   (speedup vs in-process, per shard count)
+
+
+def shard_of(room_id, n_shards):
+    # crc32, not hash(): str hashes are salted per process
+    return zlib.crc32(room_id.encode()) % n_shards
+
+
+def _shard_main(conn, shard_id, room_options):
+    """Runs in the shard process: answers (op, args) messages until "stop"."""
+    from ml.analytics import EcoBrain
+    from ml.room_state import RoomStateEngine
+    from ml.scoring import score_batch
+
+    brain = EcoBrain(cache_size=50_000, lux_resolution=10.0)
+    room_state = RoomStateEngine(**room_options)
+
+    while True:
+        op, args = conn.recv()
+        if op == "stop":
+            break
+        try:
+            if op == "score":
+                result = score_batch(brain, room_state, *args)
+            elif op == "reload":
+                brain.load_model()
+                result = brain.model_version
+            elif op == "baseline":
+                result = room_state.room(args)
+            elif op == "stats":
+                result = {"shard": shard_id, "pid": os.getpid(), "model_version": brain.model_version,
+                          **room_state.stats()}
+            else:
+                raise ValueError(f"Unknown shard op {op!r}")
+            conn.send(("ok", result))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+    conn.close()
+
+
+class ShardPool:
+    """Fixed set of scoring processes; thread-safe, batches fan out to all shards at once."""
+
+    def __init__(self, n_shards, **room_options):
+        self.n_shards = n_shards
+        self.room_options = room_options
+        self._context = multiprocessing.get_context("spawn")
+        self._processes = [None] * n_shards
+        self._conns = [None] * n_shards
+        self._locks = [threading.Lock() for _ in range(n_shards)]
+        self.restarts = 0
+
+    def start(self):
+        for i in range(self.n_shards):
+            self._spawn(i)
+
+    def _spawn(self, i):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_shard_main, args=(child_conn, i, self.room_options),
+                                        name=f"ecocore-shard-{i}", daemon=True)
+        process.start()
+        child_conn.close()
+        self._processes[i], self._conns[i] = process, parent_conn
+
+    def stop(self):
+        for i, (process, conn) in enumerate(zip(self._processes, self._conns)):
+            if process is None:
+                continue
+            with self._locks[i]:
+                try:
+                    conn.send(("stop", None))
+                except (BrokenPipeError, OSError):
+                    pass
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+            self._processes[i] = self._conns[i] = None
+
+    # --- MESSAGING ---
+    def _call(self, requests):
+        """Sends {shard: (op, args)} to every shard first, then collects the replies."""
+        shards = sorted(requests)  # Fixed lock order: concurrent callers can't deadlock
+        for i in shards:
+            self._locks[i].acquire()
+        try:
+            for i in shards:
+                if not self._processes[i].is_alive():
+                    # Crashed shard: replace it; its rooms re-learn their baselines
+                    self.restarts += 1
+                    self._spawn(i)
+                self._conns[i].send(requests[i])
+            replies = {}
+            for i in shards:
+                status, result = self._conns[i].recv()
+                if status != "ok":
+                    raise RuntimeError(f"Shard {i} failed: {result}")
+                replies[i] = result
+            return replies
+        finally:
+            for i in shards:
+                self._locks[i].release()
+
+    # --- OPERATIONS ---
+    def score(self, room_ids, hours, occupancy, light_lux, water_flow, energy_load):
+        """Same contract as ml.scoring.score_batch, partitioned by room and reassembled in order."""
+        columns = (np.asarray(hours), np.asarray(occupancy), np.asarray(light_lux),
+                   np.asarray(water_flow), np.asarray(energy_load))
+        if isinstance(room_ids, np.ndarray):  # Columnar batches: hash each distinct room once
+            rooms, inverse = np.unique(room_ids, return_inverse=True)
+            owner = np.fromiter((shard_of(r, self.n_shards) for r in rooms.tolist()), dtype=np.int64,
+                                count=len(rooms))[inverse]
+        else:
+            owner = np.fromiter((shard_of(r, self.n_shards) for r in room_ids), dtype=np.int64,
+                                count=len(room_ids))
+
+        rows = {i: np.flatnonzero(owner == i) for i in np.unique(owner).tolist()}
+        requests = {
+            i: ("score", (room_ids[idx] if isinstance(room_ids, np.ndarray) else [room_ids[j] for j in idx],)
+                + tuple(column[idx] for column in columns))
+            for i, idx in rows.items()
+        }
+        replies = self._call(requests)
+
+        merged = {}
+        for i, idx in rows.items():
+            for name, values in replies[i].items():
+                if name not in merged:
+                    merged[name] = np.empty(len(room_ids), dtype=values.dtype)
+                merged[name][idx] = values
+        return merged
+
+    def baseline(self, room_id):
+        i = shard_of(room_id, self.n_shards)
+        return self._call({i: ("baseline", room_id)})[i]
+
+    def reload_model(self):
+        """Called after a retrain so every shard picks up the new artifact."""
+        return self._call({i: ("reload", None) for i in range(self.n_shards)})
+
+    def stats(self):
+        shards = self._call({i: ("stats", None) for i in range(self.n_shards)})
+        per_shard = [shards[i] for i in range(self.n_shards)]
+        return {
+            "shards": self.n_shards,
+            "restarts": self.restarts,
+            "rooms": sum(s["rooms"] for s in per_shard),
+            "updates": sum(s["updates"] for s in per_shard),
+            "sustained_events": sum(s["sustained_events"] for s in per_shard),
+            "per_shard": per_shard,
+        }
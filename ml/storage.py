@@ -0,0 +1,562 @@
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from ml.records import LOG_RECORDS
+from ml.rollups import Rollups, contributions, period_keys, retention_cutoffs, period_bounds
+
+# Each history log and the field that holds its event time (as rendered)
+LOG_TIME_FIELDS = {
+    "alerts": "time",
+    "pumping": "timestamp",
+    "battery": "timestamp",
+}
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, "item"):  # NumPy scalars
+        return value.item()
+    raise TypeError(f"Cannot store {type(value).__name__}")
+
+
+def _decode_times(entry, log):
+    """Entries stored as rendered dicts, before history records existed."""
+    field = LOG_TIME_FIELDS.get(log)
+    if field and isinstance(entry.get(field), str):
+        entry[field] = datetime.fromisoformat(entry[field])
+    return entry
+
+
+# Pagination cursors are the (time, seq) position of the last entry returned
+def encode_cursor(key):
+    return f"{key[0]!r}:{key[1]}"
+
+
+def decode_cursor(cursor):
+    """Raises ValueError for anything encode_cursor() can't have produced."""
+    try:
+        epoch, seq = cursor.split(":")
+        key = float(epoch), int(seq)
+    except (AttributeError, ValueError):
+        raise ValueError(f"Malformed cursor: {cursor!r}") from None
+    if key[0] != key[0] or key[0] in (float("inf"), float("-inf")):
+        raise ValueError(f"Malformed cursor: {cursor!r}")
+    return key
+
+
+class TimeIndexedLog:
+    """
+    One history log of records kept sorted by (time, seq), plus the same entries in
+    append (seq) order for change polling. In-order appends are O(1); range scans,
+    cursors and change polls are O(log n) bisects.
+    """
+
+    def __init__(self):
+        self._keys = []  # (epoch, seq), sorted
+        self._entries = []
+        self._seqs = []  # seq, ascending: the order entries were committed in
+        self._seq_entries = []
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _insert(keys, values, key, value):
+        if not keys or key >= keys[-1]:
+            keys.append(key)
+            values.append(value)
+        else:  # Late/out-of-order entry
+            i = bisect.bisect_right(keys, key)
+            keys.insert(i, key)
+            values.insert(i, value)
+
+    def append(self, entry):
+        self._seq += 1
+        key = (entry.time.timestamp(), self._seq)
+        self._insert(self._keys, self._entries, key, (key, entry))
+        self._seqs.append(self._seq)
+        self._seq_entries.append((key, entry))
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    @staticmethod
+    def _wanted(entry, room_id, type):
+        return (room_id is None or entry.room_id == room_id) and (type is None or entry.type == type)
+
+    def scan(self, since=None, until=None, cursor=None, limit=None, room_id=None, type=None):
+        """Newest first. Returns (entries, next_cursor)."""
+        lo = bisect.bisect_left(self._keys, (since.timestamp(),)) if since else 0
+        hi = bisect.bisect_right(self._keys, (until.timestamp(), float("inf"))) if until else len(self._keys)
+        if cursor:
+            hi = min(hi, bisect.bisect_left(self._keys, decode_cursor(cursor)))
+
+        results = []
+        for i in range(hi - 1, lo - 1, -1):
+            key, entry = self._entries[i]
+            if not self._wanted(entry, room_id, type):
+                continue
+            results.append(entry)
+            if limit is not None and len(results) >= limit:
+                return results, encode_cursor(key)
+        return results, None
+
+    def changes(self, after_seq, limit=None, room_id=None, type=None, since=None, until=None):
+        """
+        Entries appended after after_seq, the oldest `limit` of them, newest first.
+        Returns (entries, last_seq): pass last_seq back to get the ones after these.
+        """
+        results, last_seq = [], self._seq
+        start = bisect.bisect_right(self._seqs, after_seq)
+        for seq, (key, entry) in zip(self._seqs[start:], self._seq_entries[start:]):
+            if ((since is not None and key[0] < since.timestamp()) or
+                    (until is not None and key[0] > until.timestamp()) or
+                    not self._wanted(entry, room_id, type)):
+                continue
+            results.append(entry)
+            if limit is not None and len(results) >= limit:
+                last_seq = seq
+                break
+        return results[::-1], max(last_seq, after_seq)
+
+    def prune(self, cutoff):
+        """Drops entries older than cutoff (epoch seconds). Returns how many were removed."""
+        removed = bisect.bisect_left(self._keys, (cutoff,))
+        if removed:
+            del self._keys[:removed]
+            del self._entries[:removed]
+            # Rare operation: rebuild the seq order from what is left
+            self._seq_entries = sorted(self._entries, key=lambda kv: kv[0][1])
+            self._seqs = [key[1] for key, _ in self._seq_entries]
+        return removed
+
+    def clear(self):
+        self._keys, self._entries, self._seqs, self._seq_entries = [], [], [], []
+
+
+class MemoryStore:
+    """
+    Default backend: in-process time-indexed logs, rollups and a dict of room status.
+    Not shared between workers and lost on restart.
+    """
+
+    def __init__(self, retention_days=None):
+        self.retention_days = retention_days or {}
+        self._logs = {log: TimeIndexedLog() for log in LOG_TIME_FIELDS}
+        self._versions = {log: 0 for log in LOG_TIME_FIELDS}
+        self._boot_id = uuid.uuid4().hex[:8]  # Versions restart at 0, ETags must not collide
+        self._rollups = Rollups()
+        self._rooms = {}
+        self._lock = threading.Lock()
+        self._next_id = 1
+
+    # --- WRITES ---
+    def append(self, log, entry):
+        with self._lock:
+            self._logs[log].append(entry)
+            self._rollups.add(entry)
+            self._versions[log] += 1
+
+    def set_room_status(self, room_id, status):
+        self._rooms[room_id] = status
+
+    def next_alert_id(self):
+        with self._lock:
+            alert_id = self._next_id
+            self._next_id += 1
+            return alert_id
+
+    # --- READS ---
+    def query(self, log, since=None, until=None, cursor=None, limit=None, room_id=None, type=None):
+        """Newest first. Returns (entries, next_cursor); next_cursor is None on the last page."""
+        with self._lock:
+            return self._logs[log].scan(since, until, cursor, limit, room_id, type)
+
+    def changes(self, log, after_seq, limit=None, room_id=None, type=None, since=None, until=None):
+        """Entries committed after after_seq (see TimeIndexedLog.changes). Returns (entries, last_seq)."""
+        with self._lock:
+            return self._logs[log].changes(after_seq, limit, room_id, type, since, until)
+
+    def last_seq(self, log):
+        """Commit sequence of the log's newest entry; a starting point for changes()."""
+        with self._lock:
+            return self._logs[log].last_seq
+
+    def rollups(self, grain, since=None, until=None):
+        """[(period, {metric: value})] for one grain (see ml.rollups), oldest first."""
+        with self._lock:
+            return self._rollups.query(grain, since, until)
+
+    def version(self, log):
+        """Changes whenever the log changes; used for ETags."""
+        return f"{self._boot_id}.{self._versions[log]}"
+
+    def get_room_status(self, room_id):
+        return self._rooms.get(room_id)
+
+    def sizes(self):
+        """Entries per log."""
+        return {log: len(entries) for log, entries in self._logs.items()}
+
+    def is_empty(self):
+        return not any(len(entries) for entries in self._logs.values())
+
+    # --- MAINTENANCE ---
+    def clear_history(self):
+        with self._lock:
+            for log, entries in self._logs.items():
+                entries.clear()
+                self._versions[log] += 1
+            self._rollups.clear()
+
+    def compact(self):
+        """Drops entries older than each log's retention window, and expired rollup buckets."""
+        for log, days in self.retention_days.items():
+            cutoff = (datetime.now() - timedelta(days=days)).timestamp()
+            with self._lock:
+                if self._logs[log].prune(cutoff):
+                    self._versions[log] += 1
+        with self._lock:
+            self._rollups.prune(retention_cutoffs())
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteStore:
+    """
+    Embedded SQLite backend in WAL mode, safe to share between uvicorn workers.
+
+    Writes are buffered and flushed by a background thread every flush_interval
+    seconds (or once batch_size rows are pending). Room status updates are
+    coalesced so only the latest status per room is written. Records are stored
+    as JSON arrays of their fields (see Record.to_row). Rollup deltas are summed
+    in memory and added to the rollups table in the same transaction as the rows.
+    A batch stays pending until its transaction commits, so a failed flush (say,
+    "database is locked" under several workers) is retried on the next tick.
+
+    History, rollup and version reads see committed rows only, the same in every
+    worker (at most flush_interval behind); call flush() to read your own writes.
+    """
+
+    ALERT_ID_BLOCK = 100  # IDs reserved per round-trip to the counters table
+
+    def __init__(self, path, flush_interval=1.0, batch_size=500, retention_days=None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.retention_days = retention_days or {}
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.RLock()
+        self._pending_rows = []
+        self._pending_rooms = {}
+        self._pending_rollups = {}  # (grain, period, metric) -> delta
+        self._id_block = iter(())
+
+        self._create_schema()
+
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="sqlite-flusher", daemon=True)
+        self._flusher.start()
+
+    def _create_schema(self):
+        new_rollups = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rollups'").fetchone() is None
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS history (
+                    seq      INTEGER PRIMARY KEY AUTOINCREMENT,
+                    log      TEXT NOT NULL,
+                    time     REAL NOT NULL,
+                    room_id  TEXT,
+                    type     TEXT,
+                    entry_id INTEGER,
+                    payload  TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_history_time ON history (log, time, seq);
+                CREATE INDEX IF NOT EXISTS idx_history_room ON history (log, room_id, time);
+                CREATE INDEX IF NOT EXISTS idx_history_type ON history (log, type, time);
+                DROP INDEX IF EXISTS idx_history_entry;
+
+                CREATE TABLE IF NOT EXISTS rollups (
+                    grain  TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    metric TEXT NOT NULL,
+                    value  REAL NOT NULL,
+                    PRIMARY KEY (grain, period, metric)
+                ) WITHOUT ROWID;
+
+                CREATE TABLE IF NOT EXISTS room_status (
+                    room_id TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS counters (
+                    name  TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO counters (name, value) VALUES ('alert_id', 0);
+            """)
+            self._conn.executemany("INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)",
+                                   [(f"version:{log}",) for log in LOG_TIME_FIELDS])
+        if new_rollups:
+            self.rebuild_rollups()  # Database from before rollups existed
+
+    # --- WRITES ---
+    def append(self, log, entry):
+        row = (log, entry.time.timestamp(), entry.room_id, entry.type, entry.id,
+               json.dumps(entry.to_row(), default=_encode))
+        with self._lock:
+            self._pending_rows.append(row)
+            self._add_rollups(entry)
+            if len(self._pending_rows) >= self.batch_size:
+                try:
+                    self.flush()
+                except sqlite3.Error as e:
+                    print(f"SQLite flush failed, retrying from the flusher: {e}")  # The row stays pending
+
+    def _add_rollups(self, entry):
+        metrics = contributions(entry)
+        for grain, period in period_keys(entry.time):
+            for metric, amount in metrics:
+                key = (grain, period, metric)
+                self._pending_rollups[key] = self._pending_rollups.get(key, 0.0) + amount
+
+    def set_room_status(self, room_id, status):
+        with self._lock:
+            self._pending_rooms[room_id] = json.dumps(status, default=_encode)
+
+    def next_alert_id(self):
+        """
+        IDs are reserved in blocks from a shared counter, so they stay unique across
+        workers. They identify alerts but don't order them: rows from several workers
+        commit in their own flushes, so poll for changes by seq (changes()), not by ID.
+        """
+        with self._lock:
+            alert_id = next(self._id_block, None)
+            if alert_id is None:
+                with self._conn:
+                    top = self._conn.execute(
+                        "UPDATE counters SET value = value + ? WHERE name = 'alert_id' RETURNING value",
+                        (self.ALERT_ID_BLOCK,)).fetchone()[0]
+                self._id_block = iter(range(top - self.ALERT_ID_BLOCK + 1, top + 1))
+                alert_id = next(self._id_block)
+            return alert_id
+
+    def flush(self):
+        with self._lock:
+            if not self._pending_rows and not self._pending_rooms:
+                return
+            rows, rooms, rollups = self._pending_rows, self._pending_rooms, self._pending_rollups
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO history (log, time, room_id, type, entry_id, payload) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", rows)
+                self._bump_versions({row[0] for row in rows})
+                self._conn.executemany(
+                    "INSERT INTO rollups (grain, period, metric, value) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (grain, period, metric) DO UPDATE SET value = value + excluded.value",
+                    [(*key, value) for key, value in rollups.items()])
+                self._conn.executemany(
+                    "INSERT INTO room_status (room_id, payload) VALUES (?, ?) "
+                    "ON CONFLICT (room_id) DO UPDATE SET payload = excluded.payload", rooms.items())
+            # Only once committed: if the transaction fails, everything stays pending for the next flush
+            self._pending_rows, self._pending_rooms, self._pending_rollups = [], {}, {}
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"SQLite flush failed: {e}")
+
+    def _bump_versions(self, logs):
+        self._conn.executemany("UPDATE counters SET value = value + 1 WHERE name = ?",
+                               [(f"version:{log}",) for log in logs])
+
+    # --- READS ---
+    def _filters(self, log, since, until, room_id, type):
+        where, params = ["log = ?"], [log]
+        if since is not None:
+            where.append("time >= ?")
+            params.append(since.timestamp())
+        if until is not None:
+            where.append("time <= ?")
+            params.append(until.timestamp())
+        if room_id is not None:
+            where.append("room_id = ?")
+            params.append(room_id)
+        if type is not None:
+            where.append("type = ?")
+            params.append(type)
+        return where, params
+
+    def _decode(self, log, payloads):
+        record = LOG_RECORDS[log]
+        entries = []
+        for payload in payloads:
+            values = json.loads(payload)
+            entries.append(record.from_row(values) if isinstance(values, list) else _decode_times(values, log))
+        return entries
+
+    def query(self, log, since=None, until=None, cursor=None, limit=None, room_id=None, type=None):
+        """Newest first. Returns (entries, next_cursor); next_cursor is None on the last page."""
+        where, params = self._filters(log, since, until, room_id, type)
+        if cursor:
+            epoch, seq = decode_cursor(cursor)
+            where.append("(time < ? OR (time = ? AND seq < ?))")
+            params += [epoch, epoch, seq]
+
+        sql = f"SELECT time, seq, payload FROM history WHERE {' AND '.join(where)} ORDER BY time DESC, seq DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        entries = self._decode(log, (payload for _, _, payload in rows))
+        next_cursor = encode_cursor(rows[-1][:2]) if limit is not None and len(rows) == limit else None
+        return entries, next_cursor
+
+    def changes(self, log, after_seq, limit=None, room_id=None, type=None, since=None, until=None):
+        """
+        Entries committed after after_seq, the oldest `limit` of them, newest first.
+        Returns (entries, last_seq). seq is the AUTOINCREMENT key: SQLite has one
+        writer at a time, so it grows in commit order across every worker.
+        """
+        with self._lock:
+            upto = self._last_seq()  # Rows committed after this come in the next poll
+            where, params = self._filters(log, since, until, room_id, type)
+            where.append("seq > ? AND seq <= ?")
+            params += [after_seq, upto]
+            sql = f"SELECT seq, payload FROM history WHERE {' AND '.join(where)} ORDER BY seq"
+            if limit is not None:
+                sql += " LIMIT ?"
+                params.append(limit)
+            rows = self._conn.execute(sql, params).fetchall()
+        last_seq = rows[-1][0] if limit is not None and len(rows) == limit else upto
+        return self._decode(log, (payload for _, payload in reversed(rows))), max(last_seq, after_seq)
+
+    def _last_seq(self):
+        # Highest seq ever assigned (kept by AUTOINCREMENT, so deletes never move it back)
+        row = self._conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'history'").fetchone()
+        return row[0] if row else 0
+
+    def last_seq(self, log):
+        """Commit sequence to start polling changes() from (shared by all logs in one database)."""
+        with self._lock:
+            return self._last_seq()
+
+    def rollups(self, grain, since=None, until=None):
+        """[(period, {metric: value})] for one grain (see ml.rollups), oldest first."""
+        lo, hi = period_bounds(grain, since, until)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT period, metric, value FROM rollups WHERE grain = ? AND period BETWEEN ? AND ? "
+                "ORDER BY period", (grain, lo, hi)).fetchall()
+        buckets = {}
+        for period, metric, value in rows:
+            buckets.setdefault(period, {})[metric] = value
+        return list(buckets.items())
+
+    def version(self, log):
+        """Shared through the counters table, so every worker hands out the same ETag."""
+        with self._lock:
+            return str(self._conn.execute("SELECT value FROM counters WHERE name = ?",
+                                          (f"version:{log}",)).fetchone()[0])
+
+    def get_room_status(self, room_id):
+        with self._lock:
+            payload = self._pending_rooms.get(room_id)
+            if payload is None:
+                row = self._conn.execute(
+                    "SELECT payload FROM room_status WHERE room_id = ?", (room_id,)).fetchone()
+                payload = row[0] if row else None
+        return json.loads(payload) if payload else None
+
+    def sizes(self):
+        """Entries per log (a count over the (log, time) index, so keep it off hot paths)."""
+        self.flush()
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT log, COUNT(*) FROM history GROUP BY log").fetchall())
+        return {log: counts.get(log, 0) for log in LOG_TIME_FIELDS}
+
+    def is_empty(self):
+        self.flush()
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM history LIMIT 1").fetchone() is None
+
+    # --- MAINTENANCE ---
+    def clear_history(self):
+        with self._lock:
+            self._pending_rows = []
+            self._pending_rollups = {}
+            with self._conn:
+                self._conn.execute("DELETE FROM history")
+                self._conn.execute("DELETE FROM rollups")
+                self._bump_versions(LOG_TIME_FIELDS)
+
+    def rebuild_rollups(self):
+        """Recomputes the rollups table from the stored history (one pass, for upgrades)."""
+        self.flush()
+        with self._lock:
+            rollups, self._pending_rollups = self._pending_rollups, {}
+            for log, payload in self._conn.execute("SELECT log, payload FROM history"):
+                values = json.loads(payload)
+                if isinstance(values, list):
+                    self._add_rollups(LOG_RECORDS[log].from_row(values))
+            rebuilt, self._pending_rollups = self._pending_rollups, rollups
+            with self._conn:
+                self._conn.execute("DELETE FROM rollups")
+                self._conn.executemany("INSERT INTO rollups (grain, period, metric, value) VALUES (?, ?, ?, ?)",
+                                       [(*key, value) for key, value in rebuilt.items()])
+
+    def compact(self):
+        """Applies retention windows, then returns freed pages to the OS."""
+        self.flush()
+        with self._lock:
+            with self._conn:
+                for log, days in self.retention_days.items():
+                    cutoff = time.time() - days * 86400
+                    self._conn.execute("DELETE FROM history WHERE log = ? AND time < ?", (log, cutoff))
+                self._bump_versions(self.retention_days)
+                self._conn.executemany("DELETE FROM rollups WHERE grain = ? AND period < ?",
+                                       retention_cutoffs().items())
+            self._conn.execute("PRAGMA incremental_vacuum")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        self._stop.set()
+        self._flusher.join()
+        self.flush()
+        self._conn.close()
+
+
+def open_store(url=None, **options):
+    """
+    "memory" (default) or "sqlite:///path/to/ecocore.db".
+    Read from ECOCORE_STORE when no url is given.
+    """
+    url = url or os.environ.get("ECOCORE_STORE", "memory")
+    if url == "memory":
+        return MemoryStore(retention_days=options.get("retention_days"))
+    if url.startswith("sqlite:///"):
+        return SQLiteStore(url[len("sqlite:///"):], **options)
+    raise ValueError(f"Unknown store: {url}")
@@ -0,0 +1,23 @@
+import numpy as np
+
+# Source: DERC (Delhi Electricity Regulatory Commission) Commercial ToU Tariff Order 2025-26
+BASE_RATE = 8.50  # ₹ / kWh
+PEAK_MULTIPLIER = 1.20  # 2 PM-5 PM & 10 PM-1 AM
+OFF_PEAK_MULTIPLIER = 0.80  # Midnight - 6 AM
+
+# Pump efficiency used throughout: 0.5 kWh per 1000 Liters lifted
+PUMP_KWH_PER_LITER = 0.5 / 1000
+
+
+def derc_tariff(hours):
+    """Vectorized ToU rate (₹/kWh) for an array of hours of day."""
+    hours = np.asarray(hours)
+    peak = ((hours >= 14) & (hours < 17)) | (hours >= 22)
+    off_peak = hours < 6
+    return np.round(np.where(peak, BASE_RATE * PEAK_MULTIPLIER,
+                             np.where(off_peak, BASE_RATE * OFF_PEAK_MULTIPLIER, BASE_RATE)), 2)
+
+
+def hourly_tariffs(hours=24, start_hour=0):
+    """Tariff vector for the next `hours` hours starting at start_hour."""
+    return derc_tariff((np.arange(hours) + start_hour) % 24)
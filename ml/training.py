@@ -0,0 +1,159 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from ml.artifact import export_model
+
+FEATURES = ["hour", "occupancy", "light_lux"]
+TARGET = "water_flow"
+
+# Explicit dtypes: no type inference, and half the memory of pandas' float64/int64 defaults
+DTYPES = {"hour": np.int8, "occupancy": np.int32, "light_lux": np.float32, "water_flow": np.float32}
+
+# Upper bound on boosting iterations (trees): keeps the artifact and prediction latency bounded
+# however many incremental refits a long-running server does
+MAX_ITERS = 500
+
+
+def iter_chunks(path, chunksize=500_000):
+    """
+    Yields (X, y) NumPy chunks from a CSV or Parquet file, or a telemetry archive
+    directory (ml/archive.py), without loading it whole.
+    """
+    if os.path.isdir(path):
+        from ml.archive import ArchiveReader, hour_of_day
+        # Segment columns are memory-mapped: only the chunk being stacked is in RAM
+        for batch in ArchiveReader(path).scan(columns=["time", "occupancy", "light_lux", "water_flow"]):
+            for start in range(0, len(batch["time"]), chunksize):
+                rows = slice(start, start + chunksize)
+                X = np.column_stack((hour_of_day(batch["time"][rows]), batch["occupancy"][rows],
+                                     batch["light_lux"][rows])).astype(np.float64)
+                yield X, batch["water_flow"][rows].astype(np.float64)
+    elif path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Reading Parquet training data requires pyarrow (pip install pyarrow)")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=FEATURES + [TARGET]):
+            df = batch.to_pandas().astype(DTYPES)
+            yield df[FEATURES].to_numpy(np.float64), df[TARGET].to_numpy(np.float64)
+    else:
+        import pandas as pd
+        for df in pd.read_csv(path, usecols=FEATURES + [TARGET], dtype=DTYPES, chunksize=chunksize):
+            yield df[FEATURES].to_numpy(np.float64), df[TARGET].to_numpy(np.float64)
+
+
+def new_model(initial_iters=100):
+    from sklearn.ensemble import HistGradientBoostingRegressor
+    # Histogram-based boosting: bins features once per fit, so cost is ~linear in rows.
+    # warm_start lets every chunk (or every later refit) add trees on top of the existing ones.
+    return HistGradientBoostingRegressor(max_iter=initial_iters, learning_rate=0.1, max_depth=3,
+                                         early_stopping=False, warm_start=True)
+
+
+def train_streaming(source_path, model=None, chunksize=500_000, initial_iters=100, iters_per_chunk=20,
+                    max_iters=MAX_ITERS):
+    """
+    Fits chunk by chunk: the first chunk grows initial_iters trees, every later chunk adds
+    iters_per_chunk more, up to max_iters in all (chunks after that are not fitted).
+    Memory is bounded by one chunk. Pass an existing (warm-start) model to refit
+    incrementally on new data; one already at max_iters is retrained from scratch.
+    """
+    if model is None or not getattr(model, "warm_start", False) or model.max_iter >= max_iters:
+        model = new_model(min(initial_iters, max_iters))
+        fitted = False
+    else:
+        fitted = True
+
+    rows = 0
+    for X, y in iter_chunks(source_path, chunksize):
+        if fitted:
+            if model.max_iter >= max_iters:
+                print(f"Training stopped at {max_iters} iterations; later chunks were not fitted")
+                break
+            model.max_iter = min(model.max_iter + iters_per_chunk, max_iters)
+        model.fit(X, y)
+        fitted = True
+        rows += len(y)
+
+    if not fitted:
+        raise ValueError(f"No training rows in {source_path}")
+    return model, rows
+
+
+def save_atomically(model, model_path):
+    import joblib
+    # Write next to the target, then rename: readers never see a half-written file
+    tmp_path = f"{model_path}.{os.getpid()}.tmp"
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, model_path)
+
+
+def _train_job(source_path, model_path, artifact_path, incremental, chunksize, iters_per_chunk):
+    """Runs in the training process."""
+    import joblib
+    base = None
+    if incremental and os.path.exists(model_path):
+        base = joblib.load(model_path)
+    model, rows = train_streaming(source_path, base, chunksize, iters_per_chunk=iters_per_chunk)
+    save_atomically(model, model_path)
+    # Flatten here too, so the server only has to memory-map the result
+    export_model(model, artifact_path, source_mtime=os.path.getmtime(model_path))
+    return rows
+
+
+class BackgroundTrainer:
+    """
+    Retrains EcoBrain in a separate process so the API keeps serving, then
+    hot-swaps the new model in when the job finishes.
+    """
+
+    def __init__(self, brain, on_swap=None):
+        self.brain = brain
+        self.on_swap = on_swap  # e.g. tell shard processes to reload too
+        self._executor = None
+        self._lock = threading.Lock()
+        self.status = {"state": "idle"}
+
+    def start(self, source_path=None, incremental=False, chunksize=500_000, iters_per_chunk=20):
+        with self._lock:
+            if self.status["state"] == "running":
+                return False
+            if self._executor is None:
+                # spawn: the training process must not inherit the server's threads and sockets
+                self._executor = ProcessPoolExecutor(max_workers=1,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+
+            source_path = source_path or self.brain.data_path
+            self.status = {"state": "running", "source": source_path, "incremental": incremental,
+                           "started": time.time()}
+            future = self._executor.submit(_train_job, source_path, self.brain.model_path,
+                                           self.brain.artifact_path, incremental, chunksize, iters_per_chunk)
+            future.add_done_callback(self._finished)
+            return True
+
+    def _finished(self, future):
+        status = dict(self.status)
+        status["seconds"] = round(time.time() - status["started"], 2)
+        try:
+            status["rows"] = future.result()
+            self.brain.load_model()  # Picks up the fresh artifact
+            if self.on_swap:
+                self.on_swap()
+            status["state"] = "done"
+            status["model_version"] = self.brain.model_version
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self._executor = None  # Start a fresh pool next time
+            status["state"] = "failed"
+            status["error"] = str(e)
+        self.status = status
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,426 @@
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from ml.archive import hour_of_day
+from ml.battery import battery_policy, grid_exchange
+from ml.pump_scheduler import pump_policy
+from ml.scoring import expected_energy_load
+from ml.tariffs import PUMP_KWH_PER_LITER, derc_tariff
+
+# --- DIGITAL TWIN ---
+# Replays recorded readings (ecocore_research_data.csv shape) through the ingest
+# anomaly rules, a pump strategy, the tank model and the battery planner, with
+# the constraints of a "what if" scenario. Per-reading work (rules, cutoffs,
+# hourly aggregation) is array work over the whole replay, and the day-ahead
+# pump/battery DPs for every day are solved as one batch; only the tank and SoC
+# recurrences step through time, vectorized over scenarios, so a batch of
+# scenarios costs little more than one. Batches are spread over a process pool.
+
+SCENARIO_DEFAULTS = {
+    "name": "baseline",
+    "rooms": 50,  # Rooms served; the history is replayed per room and scaled
+    # Tank & pump (defaults: the dashboard's demo tank)
+    "tank_capacity": 20000.0,
+    "initial_level": 8000.0,
+    "pump_rate": 5000.0,
+    "min_level": 2000.0,
+    "pump_strategy": "optimized",  # optimized (day-ahead DP) | fixed (daily fill) | on_demand (float switch)
+    "fixed_start_hour": 2,
+    "refill_level": 6000.0,  # on_demand: switch on at or below this, off when full
+    # Battery (capacity 0: no battery)
+    "battery_capacity": 100.0,
+    "battery_soc_percent": 30.0,
+    "battery_max_kw": 10.0,
+    "battery_efficiency": 0.90,
+    "battery_reserve": 10.0,
+    # Anomaly rules
+    "leak_multiplier": 1.5,  # Water alert above predicted * multiplier + 1 L/min
+    "auto_cutoff": True,  # Valve closes after the first alert of a run
+    "tariff_scale": 1.0,
+}
+PUMP_STRATEGIES = ("optimized", "fixed", "on_demand")
+
+
+def prepare_history(df, brain):
+    """
+    Turns a readings DataFrame into the arrays a replay needs, scoring every
+    reading's normal flow with ONE EcoBrain batch. Rooms (room_id column, if any)
+    are averaged, so results are per room and scenarios scale them.
+    """
+    if "room_id" in df.columns:
+        df = df.sort_values(["room_id", "timestamp"], kind="stable")
+        room_codes = df["room_id"].astype("category").cat.codes.to_numpy()
+    else:
+        df = df.sort_values("timestamp", kind="stable")
+        room_codes = np.zeros(len(df), dtype=np.int8)
+    if df.empty:
+        raise ValueError("No readings to replay")
+
+    stamps = np.asarray(df["timestamp"].to_numpy(), dtype="datetime64[s]")
+    first_room_reading = np.r_[True, room_codes[1:] != room_codes[:-1]]
+    steps = np.diff(stamps).astype(np.float64)[~first_room_reading[1:]]
+    steps = steps[steps > 0]  # Duplicate timestamps say nothing about the interval
+    interval_minutes = float(np.median(steps) / 60) if len(steps) else 15.0
+
+    bucket = stamps.astype("datetime64[h]")
+    start = bucket.min()
+    hour_index = (bucket - start).astype(np.int64)
+    n_hours = int(hour_index.max()) + 1
+    hour_of_day = (start + np.arange(n_hours)).astype(np.int64) % 24
+    n_rooms = len(np.unique(room_codes))
+
+    occupancy = df["occupancy"].to_numpy(np.float64)
+    flow = df["water_flow"].to_numpy(np.float64)
+    predicted = np.asarray(brain.predict_demand_batch(df["hour"].to_numpy(np.float64), occupancy,
+                                                      df["light_lux"].to_numpy(np.float64)), dtype=np.float64)
+
+    readings_per_hour = np.bincount(hour_index, minlength=n_hours)
+    if "tariff" in df.columns:
+        recorded = np.bincount(hour_index, df["tariff"].to_numpy(np.float64), n_hours)
+        tariffs = np.where(readings_per_hour > 0, recorded / np.maximum(readings_per_hour, 1),
+                           derc_tariff(hour_of_day))
+    else:
+        tariffs = derc_tariff(hour_of_day)
+
+    def per_room_hourly(values):
+        return np.bincount(hour_index, values, n_hours) / n_rooms
+
+    interval_hours = interval_minutes / 60
+    return {
+        "start": start,
+        "n_rooms": n_rooms,
+        "interval_minutes": interval_minutes,
+        "hour_of_day": hour_of_day,
+        "tariffs": tariffs,
+        # Per reading (litres/min), for the anomaly rules
+        "hour_index": hour_index,
+        "flow": flow.astype(np.float32),
+        "predicted": predicted.astype(np.float32),
+        "first_room_reading": first_room_reading,
+        # Per room, per hour
+        "forecast_liters": per_room_hourly(predicted * interval_minutes),
+        "energy_kwh": per_room_hourly(expected_energy_load(occupancy) * interval_hours),
+    }
+
+
+def _apply_anomaly_rules(history, scenario, first_hour):
+    """Per-room hourly demand after cutoffs, plus per-room alert/waste totals, for one scenario."""
+    keep = history["hour_index"] >= first_hour
+    hour_index = history["hour_index"][keep] - first_hour
+    flow = history["flow"][keep].astype(np.float64)
+    predicted = history["predicted"][keep].astype(np.float64)
+    first_reading = history["first_room_reading"][keep]
+    first_reading[:1] = True
+    interval = history["interval_minutes"]
+    n_rooms = history["n_rooms"]
+
+    alert = flow > predicted * scenario["leak_multiplier"] + 1.0
+    run_start = alert & (first_reading | ~np.r_[False, alert[:-1]])
+    # With auto-cutoff, every alerted reading after the first of a run finds the valve shut
+    cut = alert & ~run_start if scenario["auto_cutoff"] else np.zeros_like(alert)
+    delivered = np.where(cut, 0.0, flow) * interval
+
+    n_hours = len(history["tariffs"]) - first_hour
+    return {
+        "demand": np.bincount(hour_index, delivered, n_hours) / n_rooms,
+        "leak_events": run_start.sum() / n_rooms,
+        "alert_readings": alert.sum() / n_rooms,
+        "wasted_liters": ((flow - predicted) * interval)[alert & ~cut].sum() / n_rooms,
+        "cutoff_saved_liters": (flow * interval)[cut].sum() / n_rooms,
+    }
+
+
+def _plan_days(solver, series, tariffs, columns):
+    """
+    Day-ahead policies for every day of the replay in ONE batch: each (scenario, day)
+    is an independent 24h horizon, plus one call for a trailing partial day.
+    Scenarios with identical inputs (e.g. a tank sweep, for the battery) are solved once.
+    solver(rows, tariff_rows, *columns) -> (policy (L, rows, ...), ...).
+    Returns (policy_at(t) -> (S, ...) policy for hour t, the solver's other outputs).
+    """
+    _, first, inverse = np.unique(np.column_stack([series] + columns), axis=0, return_index=True,
+                                  return_inverse=True)
+    inverse = inverse.ravel()
+    series, columns = series[first], [column[first] for column in columns]
+    n, horizon = series.shape
+    days, tail = divmod(horizon, 24)
+    blocks, extras = [], None
+    for first_day, n_days, length in ((0, days, 24), (days, 1 if tail else 0, tail)):
+        if not n_days:
+            continue
+        hours = slice(first_day * 24, first_day * 24 + n_days * length)
+        rows = series[:, hours].reshape(n, n_days, length).transpose(1, 0, 2).reshape(n_days * n, length)
+        tariff_rows = np.repeat(tariffs[hours].reshape(n_days, length), n, axis=0)
+        policy, *extras = solver(rows, tariff_rows, *(np.tile(column, n_days) for column in columns))
+        blocks.append(policy.reshape(length, n_days, n, *policy.shape[2:]))
+
+    def policy_at(t):
+        day, hour = divmod(t, 24)
+        return (blocks[0][hour, day] if day < days else blocks[-1][hour, 0])[inverse]
+    return policy_at, extras
+
+
+def simulate(history, scenarios, first_hour=0, level_bins=100, soc_bins=40):
+    """
+    Replays history[first_hour:] for a batch of scenarios (dicts; missing keys take
+    SCENARIO_DEFAULTS). Pump and battery policies are planned a day at a time from
+    the model's forecast, aiming to end each day at the scenario's starting level /
+    charge, and are then followed against the replayed demand.
+    """
+    scenarios = [dict(SCENARIO_DEFAULTS, **scenario) for scenario in scenarios]
+    for scenario in scenarios:
+        if scenario["pump_strategy"] not in PUMP_STRATEGIES:
+            raise ValueError(f"Unknown pump_strategy {scenario['pump_strategy']!r}")
+    n = len(scenarios)
+
+    def field(name, rows=slice(None)):
+        return np.array([scenario[name] for scenario in scenarios], dtype=np.float64)[rows]
+
+    rooms = field("rooms")
+    tariffs = history["tariffs"][first_hour:]
+    hour_of_day = history["hour_of_day"][first_hour:]
+    horizon = len(tariffs)
+    tariff_scale = field("tariff_scale")
+
+    # --- 1. ANOMALY RULES (vectorized over the whole replay) ---
+    rules = [_apply_anomaly_rules(history, scenario, first_hour) for scenario in scenarios]
+    demand = np.stack([rule["demand"] for rule in rules]) * rooms[:, None]  # (S, H) litres
+    forecast = history["forecast_liters"][first_hour:][None, :] * rooms[:, None]
+    load = history["energy_kwh"][first_hour:][None, :] * rooms[:, None]  # (S, H) kWh
+
+    # --- 2. DAY-AHEAD POLICIES (all days of all scenarios in one DP batch each) ---
+    capacity, pump_rate, min_level = field("tank_capacity"), field("pump_rate"), field("min_level")
+    level = np.minimum(field("initial_level"), capacity)
+    strategy = np.array([scenario["pump_strategy"] for scenario in scenarios])
+    optimized = np.flatnonzero(strategy == "optimized")
+    fixed, on_demand = strategy == "fixed", strategy == "on_demand"
+    fixed_start, refill_level = field("fixed_start_hour"), field("refill_level")
+    if len(optimized):
+        pump_plan, _ = _plan_days(
+            lambda rows, tariff_rows, *columns: pump_policy(rows, tariff_rows, *columns, level_bins=level_bins),
+            forecast[optimized], tariffs, [capacity[optimized], pump_rate[optimized], min_level[optimized],
+                                           level[optimized]])
+        level_step = capacity[optimized] / level_bins
+
+    with_battery = np.flatnonzero(field("battery_capacity") > 0)
+    if len(with_battery):
+        battery_capacity = field("battery_capacity", with_battery)
+        battery_efficiency = field("battery_efficiency", with_battery)
+        soc_bin = np.clip(np.round(field("battery_soc_percent", with_battery) / 100 * soc_bins), 0, soc_bins)
+        soc_bin = soc_bin.astype(np.int64)
+        soc_step = battery_capacity / soc_bins
+        battery_plan, (moves, _) = _plan_days(
+            lambda rows, tariff_rows, *columns: battery_policy(rows, tariff_rows, *columns, soc_bins=soc_bins),
+            load[with_battery], tariffs, [battery_capacity, soc_bin * soc_step,
+                                          field("battery_max_kw", with_battery), field("battery_max_kw", with_battery),
+                                          battery_efficiency, field("battery_reserve", with_battery)])
+        battery_cost = np.zeros(len(with_battery))
+
+    # --- 3. REPLAY: tank, pump and battery hour by hour, vectorized over scenarios ---
+    level_path = np.empty((n, horizon + 1))
+    level_path[:, 0] = level
+    pumped = np.zeros((n, horizon))
+    shortage = np.zeros((n, horizon))
+    below_min_hours = np.zeros(n, dtype=np.int64)
+    pump_state = np.zeros(n, dtype=bool)  # fixed: filling; on_demand: float switch latched on
+    for t in range(horizon):
+        on = np.zeros(n, dtype=bool)
+        if len(optimized):
+            bins = np.minimum(np.floor(level[optimized] / level_step + 1e-9).astype(np.int64), level_bins)
+            on[optimized] = pump_plan(t)[np.arange(len(optimized)), bins]
+        pump_state |= (fixed & (hour_of_day[t] == fixed_start)) | (on_demand & (level <= refill_level))
+        on |= pump_state
+
+        # The high-level switch stops the pump once the tank is full
+        inflow = on * np.minimum(pump_rate, np.maximum(0.0, capacity - level + demand[:, t]))
+        available = level + inflow
+        served = np.minimum(available, demand[:, t])
+        shortage[:, t] = demand[:, t] - served
+        level = available - served
+        pumped[:, t] = inflow
+        below_min_hours += level < min_level
+        level_path[:, t + 1] = level
+        pump_state &= level < capacity
+
+        if len(with_battery):
+            move = moves[battery_plan(t)[np.arange(len(with_battery)), soc_bin]]
+            draw, delivered = grid_exchange(move * soc_step, battery_efficiency)
+            battery_cost += np.maximum(0.0, load[with_battery, t] + draw - delivered) * tariffs[t]
+            soc_bin = soc_bin + move
+
+    pump_cost = (pumped * PUMP_KWH_PER_LITER * tariffs).sum(axis=1) * tariff_scale
+    no_battery_cost = (load * tariffs).sum(axis=1) * tariff_scale
+    energy_cost = no_battery_cost.copy()
+    if len(with_battery):
+        energy_cost[with_battery] = battery_cost * tariff_scale[with_battery]
+
+    results = []
+    for i, scenario in enumerate(scenarios):
+        results.append({
+            "name": scenario["name"],
+            "tank_level": level_path[i],
+            "min_tank_level": float(level_path[i].min()),
+            "shortage_liters": float(shortage[i].sum()),
+            "shortage_hours": int((shortage[i] > 0).sum()),
+            "hours_below_min_level": int(below_min_hours[i]),
+            "water_demand_liters": float(demand[i].sum()),
+            "pumped_liters": float(pumped[i].sum()),
+            "pump_cost": float(pump_cost[i]),
+            "energy_cost": float(energy_cost[i]),
+            "battery_savings": float(no_battery_cost[i] - energy_cost[i]),
+            "total_cost": float(pump_cost[i] + energy_cost[i]),
+            "leak_events": round(float(rules[i]["leak_events"] * rooms[i])),
+            "alert_readings": round(float(rules[i]["alert_readings"] * rooms[i])),
+            "wasted_liters": float(rules[i]["wasted_liters"] * rooms[i]),
+            "cutoff_saved_liters": float(rules[i]["cutoff_saved_liters"] * rooms[i]),
+        })
+    return results
+
+
+# --- PROCESS POOL ---
+_worker_history = None
+
+
+def _init_worker(history):
+    global _worker_history
+    _worker_history = history
+
+
+def _simulate_in_worker(scenarios, first_hour):
+    return simulate(_worker_history, scenarios, first_hour)
+
+
+class DigitalTwin:
+    """
+    What-if replays over the research dataset or the telemetry archive. The history
+    is prepared once per (source data, model version); scenario results are cached
+    on the same key. Archive replays read only their window, which ends at the
+    start of the current hour, so live flushes don't invalidate a prepared history.
+    A batch's uncached scenarios are split across `workers` processes, each of
+    which vectorizes over its share.
+    """
+
+    def __init__(self, brain, source_path=None, archive=None, workers=None, cache_size=256):
+        self.brain = brain
+        self.source_path = source_path
+        self.archive = archive  # TelemetryArchive/ArchiveReader, for source="archive"
+        self.workers = workers or os.cpu_count() or 1
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._history = None
+        self._history_key = None
+        self._executor = None
+        self._executor_key = None  # The history its workers were started with
+        self.hits = 0
+        self.misses = 0
+
+    def _archive_window(self, days):
+        """(since, until) of an archive replay: the last `days` days (default all) up to the current hour."""
+        until = datetime.now().replace(minute=0, second=0, microsecond=0)
+        since = (until - timedelta(days=days)).replace(hour=0) if days else None
+        return since, until - timedelta(milliseconds=1)
+
+    def _read_source(self, source, since=None, until=None):
+        import pandas as pd
+        if source == "archive":
+            if self.archive is None:
+                raise ValueError("No telemetry archive configured")
+            readings = self.archive.read(since=since, until=until, room_ids=True,
+                                         columns=["time", "occupancy", "light_lux", "water_flow"])
+            return pd.DataFrame({"timestamp": readings["time"], "hour": hour_of_day(readings["time"]),
+                                 "occupancy": readings["occupancy"], "light_lux": readings["light_lux"],
+                                 "water_flow": readings["water_flow"], "room_id": readings["room_id"]})
+        return pd.read_csv(self.source_path or self.brain.data_path)
+
+    def _load(self, source="research", days=None):
+        """(key, history), re-preparing when the source's data or the model changed."""
+        self.brain.ensure_loaded()
+        since = until = None
+        if source == "archive":
+            since, until = self._archive_window(days)
+            # Closed days' segments only change when compaction merges them; the open
+            # day's are flushed constantly, but the window stops at `until`
+            today = until.date().isoformat()
+            closed = tuple(path for path in (self.archive.segment_paths(since, until) if self.archive else [])
+                           if os.path.basename(os.path.dirname(path)) < today)
+            version = (since, until, closed)
+        else:
+            path = self.source_path or self.brain.data_path
+            version = (path, os.path.getmtime(path))
+        key = (source, version, getattr(self.brain, "model_version", 0))
+        with self._lock:
+            if key == self._history_key:
+                return key, self._history
+        history = prepare_history(self._read_source(source, since, until), self.brain)
+        with self._lock:
+            # Results cached under older keys are never looked up again and age out of the LRU
+            self._history, self._history_key = history, key
+        return key, history
+
+    def _pool(self, key, history):
+        with self._lock:
+            if self._executor_key != key:
+                if self._executor is not None:
+                    # Workers hold another history: retire them once their queued work is done
+                    self._executor.shutdown(wait=False)
+                # spawn: workers must not inherit the server's threads and sockets
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"),
+                                                     initializer=_init_worker, initargs=(history,))
+                self._executor_key = key
+            return self._executor
+
+    def run(self, scenarios, days=None, source="research"):
+        """
+        Replays the last `days` days (default: all of it) of the research CSV, or of
+        the telemetry archive (source="archive"), for every scenario.
+        """
+        key, history = self._load(source, days)
+        horizon = len(history["tariffs"])
+        first_hour = max(0, horizon - days * 24) if days else 0
+
+        scenarios = [dict(SCENARIO_DEFAULTS, **scenario) for scenario in scenarios]
+        keys = [(key, first_hour, tuple(sorted(scenario.items()))) for scenario in scenarios]
+        results = [None] * len(scenarios)
+        with self._lock:
+            for i, scenario_key in enumerate(keys):
+                if scenario_key in self._cache:
+                    self._cache.move_to_end(scenario_key)
+                    results[i] = self._cache[scenario_key]
+            self.hits += sum(r is not None for r in results)
+        missing = [i for i, r in enumerate(results) if r is None]
+        if missing:
+            batch = [scenarios[i] for i in missing]
+            if self.workers == 1 or len(batch) == 1:
+                solved = simulate(history, batch, first_hour)  # A pool would only add overhead
+            else:
+                chunks = [chunk.tolist() for chunk in np.array_split(np.arange(len(batch)), self.workers)
+                          if len(chunk)]
+                pool = self._pool(key, history)
+                futures = [pool.submit(_simulate_in_worker, [batch[j] for j in chunk], first_hour) for chunk in chunks]
+                solved = [result for future in futures for result in future.result()]
+            with self._lock:
+                self.misses += len(missing)
+                for i, result in zip(missing, solved):
+                    results[i] = self._cache[keys[i]] = result
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        start = (history["start"] + np.timedelta64(first_hour, "h")).astype(object)
+        return {"start": start, "hours": horizon - first_hour, "scenarios": results}
+
+    def stats(self):
+        return {"entries": len(self._cache), "hits": self.hits, "misses": self.misses, "workers": self.workers,
+                "pool_running": self._executor is not None}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._executor_key = None
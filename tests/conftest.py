@@ -0,0 +1,36 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+# Keep the API's side effects out of the source tree: raw readings go to a scratch
+# archive and the store stays in memory (set before ml.main is imported).
+os.environ.setdefault("ECOCORE_ARCHIVE", tempfile.mkdtemp(prefix="ecocore-archive-"))
+os.environ["ECOCORE_STORE"] = "memory"
+os.environ.pop("ECOCORE_SHARDS", None)
+os.environ.pop("ECOCORE_ACTUATORS", None)
+
+
+class ConstantModel:
+    """Predicts the same demand everywhere, so thresholds are known without loading or training a model."""
+
+    def __init__(self, demand=2.0):
+        self.demand = demand
+
+    def predict(self, X):
+        return np.full(len(X), self.demand)
+
+
+@pytest.fixture(scope="session")
+def main():
+    import ml.main as main
+    main.brain.loaded = True
+    main.brain.swap_model(ConstantModel())
+    return main
+
+
+@pytest.fixture
+def client(main):
+    from fastapi.testclient import TestClient
+    return TestClient(main.app)  # No lifespan: background loops and actuators stay off
@@ -0,0 +1,138 @@
+import asyncio
+import threading
+import time
+
+from ml.actuators import ActuatorDispatcher, ModbusSimulator
+
+UNIT, WATER_COIL = 1, 3
+
+
+def device_map(simulator):
+    return {"controllers": {"plc-1": {"host": simulator.host, "port": simulator.port}},
+            "rooms": {"Room 101": {"controller": "plc-1", "unit": UNIT, "water_coil": WATER_COIL}}}
+
+
+async def until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        await asyncio.sleep(0.005)
+
+
+def run(scenario, simulator_options=None, **options):
+    """Runs scenario(simulator, dispatcher, results) against a local simulator on a free port."""
+    async def main():
+        simulator = ModbusSimulator(port=0, **(simulator_options or {}))
+        await simulator.start()
+        results = []
+        dispatcher = ActuatorDispatcher(device_map(simulator),
+                                        on_result=lambda room_id: results.append(threading.current_thread()),
+                                        **options)
+        await dispatcher.start()
+        try:
+            await scenario(simulator, dispatcher, results)
+        finally:
+            await dispatcher.stop()
+            await simulator.stop()
+    asyncio.run(main())
+
+
+def test_command_is_acknowledged_and_reported_off_the_loop():
+    async def scenario(simulator, dispatcher, results):
+        assert dispatcher.command("Room 101", "WATER", False) == "QUEUED"
+        await until(lambda: dispatcher.acked == 1 and results)
+        assert simulator.coils[(UNIT, WATER_COIL)] is False
+        status = dispatcher.room_status("Room 101")
+        assert status["pump_on"] is False
+        assert status["actuators"]["WATER"]["state"] == "ACKED"
+        assert results[0] is not threading.current_thread()  # Callback ran on the worker thread
+
+    run(scenario)
+
+
+def test_unmapped_rooms_and_utilities_are_not_sent():
+    async def scenario(simulator, dispatcher, results):
+        assert dispatcher.command("Room 999", "WATER", False) == "UNMAPPED"
+        assert dispatcher.command("Room 101", "POWER", False) == "UNMAPPED"  # No power_coil
+        assert dispatcher.unmapped == 2 and simulator.writes == 0
+
+    run(scenario)
+
+
+def test_commands_during_a_write_collapse_into_the_latest():
+    async def scenario(simulator, dispatcher, results):
+        for on in (False, True, False, True):
+            dispatcher.command("Room 101", "WATER", on)
+        await until(lambda: dispatcher.acked == 2)
+        await asyncio.sleep(0.1)
+        assert simulator.writes == 2  # The first and the last
+        assert simulator.coils[(UNIT, WATER_COIL)] is True
+        assert dispatcher.coalesced == 2
+
+    run(scenario, {"latency": 0.05})
+
+
+def test_recent_acknowledgement_suppresses_a_repeat():
+    async def scenario(simulator, dispatcher, results):
+        dispatcher.command("Room 101", "WATER", False)
+        await until(lambda: dispatcher.acked == 1)
+        dispatcher.command("Room 101", "WATER", False)
+        await asyncio.sleep(0.05)
+        assert simulator.writes == 1 and dispatcher.coalesced == 1 and dispatcher.read_back == 0
+
+    run(scenario, ack_ttl=60)
+
+
+def test_stale_acknowledgement_is_read_back_before_suppressing():
+    async def scenario(simulator, dispatcher, results):
+        dispatcher.command("Room 101", "WATER", False)
+        await until(lambda: dispatcher.acked == 1)
+
+        # Unchanged on the controller: read back, not rewritten
+        dispatcher.command("Room 101", "WATER", False)
+        await until(lambda: dispatcher.coalesced == 1)
+        assert dispatcher.read_back == 1 and simulator.writes == 1
+
+        # Reopened by hand: the same cutoff goes out again
+        simulator.coils[(UNIT, WATER_COIL)] = True
+        dispatcher.command("Room 101", "WATER", False)
+        await until(lambda: dispatcher.acked == 2)
+        assert simulator.writes == 2 and simulator.coils[(UNIT, WATER_COIL)] is False
+
+    run(scenario, ack_ttl=0)
+
+
+def test_timeouts_are_retried_then_reported_failed():
+    async def scenario(simulator, dispatcher, results):
+        dispatcher.command("Room 101", "WATER", False)
+        await until(lambda: dispatcher.failed == 1 and results)
+        assert dispatcher.sent == 3 and dispatcher.retried == 2
+        record = dispatcher.room_status("Room 101")["actuators"]["WATER"]
+        assert record["state"] == "FAILED" and record["attempts"] == 3
+        assert "pump_on" not in dispatcher.room_status("Room 101")
+
+    run(scenario, {"unanswered_units": {UNIT}}, timeout=0.05, retries=2, backoff=0.01)
+
+
+def test_modbus_exceptions_are_not_retried():
+    async def scenario(simulator, dispatcher, results):
+        dispatcher.command("Room 101", "WATER", False)
+        await until(lambda: dispatcher.failed == 1)
+        assert dispatcher.sent == 1 and dispatcher.retried == 0
+        assert "Modbus exception" in dispatcher.room_status("Room 101")["actuators"]["WATER"]["error"]
+
+    run(scenario, {"coils": 2}, retries=3, backoff=0.01)  # Coil 3 doesn't exist
+
+
+def test_dropped_connection_is_reopened():
+    async def scenario(simulator, dispatcher, results):
+        dispatcher.command("Room 101", "WATER", False)
+        await until(lambda: dispatcher.acked == 1)
+        simulator.disconnect()
+        await asyncio.sleep(0.05)
+        dispatcher.command("Room 101", "WATER", True)
+        await until(lambda: dispatcher.acked == 2)
+        assert simulator.connections == 2
+        assert simulator.coils[(UNIT, WATER_COIL)] is True
+
+    run(scenario, retries=2, backoff=0.01)
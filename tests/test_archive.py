@@ -0,0 +1,94 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from ml.archive import TelemetryArchive
+
+
+def append_flushes(archive, start, flushes, rooms=5):
+    for i in range(flushes):
+        ts = start + timedelta(seconds=i)
+        archive.append([f"Room {i % rooms}"], [ts], [1], [10.0], [float(i)], [0.5])
+        archive.flush()
+        archive.merge_open_day()
+
+
+def test_open_day_is_merged_level_by_level(tmp_path):
+    archive = TelemetryArchive(str(tmp_path), flush_interval=3600, merge_fanout=4, max_level=3)
+    try:
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        append_flushes(archive, today, 200)
+        stats = archive.stats()
+        assert stats["rows"] == 200
+        assert stats["segments"] < 30  # 200 flushes, at most fanout - 1 per level below max_level
+
+        room = archive.read(room_id="Room 3")
+        assert len(room["time"]) == 40
+        assert (np.diff(room["time"].astype(np.int64)) > 0).all()  # Still oldest first across segments
+        assert room["water_flow"].tolist() == [float(i) for i in range(3, 200, 5)]
+    finally:
+        archive.close()
+
+
+def test_closed_days_are_not_merged_incrementally(tmp_path):
+    archive = TelemetryArchive(str(tmp_path), flush_interval=3600, merge_fanout=2)
+    try:
+        yesterday = datetime.now() - timedelta(days=1)
+        append_flushes(archive, yesterday.replace(hour=0), 4)
+        assert archive.stats()["segments"] == 4
+        archive.compact()
+        assert archive.stats()["segments"] == 1 and archive.stats()["rows"] == 4
+    finally:
+        archive.close()
+
+
+def test_flusher_survives_a_bad_batch(tmp_path):
+    archive = TelemetryArchive(str(tmp_path), flush_interval=0.01)
+    try:
+        archive.append(["Room 1"], ["not a time"], [1], [1.0], [1.0], [1.0])
+        time.sleep(0.1)
+        archive.append(["Room 1"], [datetime.now()], [1], [1.0], [1.0], [1.0])
+        deadline = time.monotonic() + 5
+        while archive.stats()["rows"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert archive.stats()["rows"] == 1
+    finally:
+        archive.close()
+
+
+def test_leftovers_of_a_crashed_merge_do_not_block_the_next_one(tmp_path):
+    archive = TelemetryArchive(str(tmp_path), flush_interval=3600, merge_fanout=2)
+    try:
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        append_flushes(archive, today, 1)
+        partition = tmp_path / today.date().isoformat()
+        [first] = os.listdir(partition)
+        leftover = partition / f".tmp-{first}+1"  # Where the merge of this level will be written
+        leftover.mkdir()
+        (leftover / "time.npy").write_bytes(b"half written")
+
+        append_flushes(archive, today + timedelta(seconds=1), 1)
+        assert sorted(os.listdir(partition)) == [f"{first}+1"]
+        assert archive.stats()["rows"] == 2
+    finally:
+        archive.close()
+
+
+def test_compaction_removes_stale_temporary_segments(tmp_path):
+    archive = TelemetryArchive(str(tmp_path), flush_interval=3600)
+    try:
+        yesterday = datetime.now() - timedelta(days=1)
+        append_flushes(archive, yesterday.replace(hour=0), 1)
+        partition = tmp_path / yesterday.date().isoformat()
+        stale, live = partition / ".tmp-stale", partition / ".tmp-live"
+        stale.mkdir()
+        live.mkdir()
+        old = time.time() - 2 * 3600
+        os.utime(stale, (old, old))
+
+        archive.compact()
+        assert not stale.exists() and live.exists()
+    finally:
+        archive.close()
@@ -0,0 +1,98 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from ml.battery import TARGET_PENALTY, BatteryFleet, optimize_battery_schedules, grid_exchange
+
+
+def brute_force(load, tariffs, capacity, soc, max_charge, max_discharge, efficiency, reserve, soc_bins):
+    """Cheapest cost over every feasible sequence of bin moves (same rules as the DP)."""
+    step = capacity / soc_bins
+    start = int(round(soc / capacity * soc_bins))
+    reserve_bin = np.ceil(reserve / step - 1e-9)
+    moves = [m for m in range(-soc_bins, soc_bins + 1)
+             if m * step <= max_charge + 1e-9 and -m * step <= max_discharge + 1e-9]
+    best = np.inf
+    for path in itertools.product(moves, repeat=len(load)):
+        state, cost = start, 0.0
+        for move, demand, tariff in zip(path, load, tariffs):
+            nxt = state + move
+            if not 0 <= nxt <= soc_bins or (move < 0 and nxt < reserve_bin):
+                break
+            draw, out = grid_exchange(np.float64(move * step), efficiency)
+            cost += max(0.0, demand + draw - out) * tariff
+            state = nxt
+        else:
+            best = min(best, cost + TARGET_PENALTY * max(0.0, start * step - state * step))
+    return best
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_dp_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    horizon, soc_bins = 5, 4
+    load = rng.uniform(0, 6, horizon)
+    tariffs = rng.choice([4.0, 6.8, 10.2], horizon)
+    capacity = 8.0
+    soc = float(rng.integers(0, soc_bins + 1)) * capacity / soc_bins
+    max_charge, max_discharge = rng.choice([2.0, 4.0, 8.0], 2)
+    efficiency, reserve = rng.uniform(0.8, 1.0), rng.choice([0.0, 2.0])
+
+    result = optimize_battery_schedules(load[None, :], tariffs, capacity, soc, max_charge, max_discharge,
+                                        efficiency, reserve, soc_bins=soc_bins)
+    final = result["soc"][0, -1]
+    dp_cost = result["cost"][0] + TARGET_PENALTY * max(0.0, soc - final)
+    assert dp_cost == pytest.approx(brute_force(load, tariffs, capacity, soc, max_charge, max_discharge,
+                                                efficiency, reserve, soc_bins))
+
+
+def test_mixed_action_spaces_solve_like_separate_batteries():
+    rng = np.random.default_rng(0)
+    load = rng.uniform(0, 6, (3, 12))
+    tariffs = np.r_[np.full(6, 4.0), np.full(6, 10.2)]
+    capacity = np.array([100.0, 1.0, 50.0])
+    rates = np.array([10.0, 500.0, 5.0])  # The second battery can empty itself several times an hour
+    fleet = optimize_battery_schedules(load, tariffs, capacity, capacity / 2, rates, rates, 0.9, 0.0)
+    for i in range(3):
+        alone = optimize_battery_schedules(load[i:i + 1], tariffs, capacity[i], capacity[i] / 2, rates[i],
+                                           rates[i], 0.9, 0.0)
+        assert fleet["cost"][i] == pytest.approx(alone["cost"][0])
+        np.testing.assert_allclose(fleet["energy"][i], alone["energy"][0])
+
+
+class FlatLoad:
+    def hourly_energy_load(self, start, hours, weekday_occupancy, weekend_occupancy):
+        return np.full(hours, 1.0)
+
+
+def test_invalid_configuration_is_rejected_and_leaves_the_battery_unchanged():
+    fleet = BatteryFleet(FlatLoad())
+    fleet.update("b1", soc_percent=50)
+    for config in ({"capacity_kwh": 0}, {"efficiency": 0}, {"max_charge_kw": 0}, {"reserve_kwh": 500}):
+        with pytest.raises(ValueError):
+            fleet.update("b1", **config)
+    assert fleet.get("b1")["capacity_kwh"] == 100.0 and fleet.get("b1")["soc_kwh"] == 50.0
+    with pytest.raises(ValueError):
+        fleet.update("b2", capacity_kwh=-1)
+    assert fleet.get("b2") is None
+
+
+def test_one_unplannable_battery_does_not_fail_the_fleet():
+    fleet = BatteryFleet(FlatLoad())
+    fleet.update("good", soc_percent=50)
+    fleet.update("bad", soc_percent=50)
+    fleet._batteries["bad"]["efficiency"] = 0.0  # e.g. stored before validation existed
+    good, bad = fleet.plan(["good", "bad"], hours=6)
+    assert "error" in bad and "efficiency" in bad["error"]
+    assert good["energy"].shape == (6,)
+
+
+def test_telemetry_routes_validate_inputs(client):
+    assert client.post("/sensor/battery", json={"battery_id": "v1", "capacity_kwh": 0}).status_code == 422
+    assert client.post("/sensor/battery", json={"battery_id": "v1", "efficiency": 0}).status_code == 422
+    assert client.post("/sensor/battery", json={"battery_id": "v1", "efficiency": 1.5}).status_code == 422
+    assert client.post("/sensor/battery", json={"battery_id": "v1", "reserve_kwh": 1000}).status_code == 422
+    assert client.post("/sensor/battery", json={"battery_id": "v1", "soc_percent": 40}).status_code == 200
+    assert client.get("/api/battery/optimize", params={"battery_id": "v1", "hours": 6}).status_code == 200
+    assert client.get("/api/battery/fleet", params={"hours": 6}).status_code == 200
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+from ml.incidents import IncidentEngine
+from ml.records import AlertRecord, WATER_ALERT, ENERGY_ALERT, ACTIVE, RESOLVED
+
+
+def ids():
+    counter = iter(range(1, 1000))
+    return lambda: next(counter)
+
+
+def water(room_id, time, observed=12.0, expected=2.0):
+    wasted = (observed - expected) * 60
+    return AlertRecord(None, time, room_id, WATER_ALERT, expected, observed, wasted, wasted / 1000 * 5.1, 90.0)
+
+
+def test_breaches_fold_into_one_incident_per_room_and_type():
+    engine = IncidentEngine(ids(), quiet_period=300)
+    t0 = datetime(2026, 1, 1, 8)
+
+    opening, opened = engine.breach(water("Room 1", t0))
+    assert opened and opening.id == opening.incident == 1 and opening.status == ACTIVE
+
+    view, opened = engine.breach(water("Room 1", t0 + timedelta(seconds=60), observed=22.0))
+    assert not opened and view.id == 1 and view.breaches == 2 and view.peak == 20.0
+
+    other, opened = engine.breach(water("Room 2", t0))
+    assert opened and other.incident == 2
+    energy = AlertRecord(None, t0, "Room 1", ENERGY_ALERT, 0.2, 5.0, 4.8, 49.0, 90.0)
+    assert engine.breach(energy)[1]  # Another type in the same room is its own incident
+    assert engine.stats()["open"] == 3
+
+
+def test_closing_alert_integrates_waste_between_breaches():
+    engine = IncidentEngine(ids(), quiet_period=300)
+    t0 = datetime(2026, 1, 1, 8)
+    for minute in range(11):  # 10 L/min over normal for 10 minutes
+        engine.breach(water("Room 1", t0 + timedelta(minutes=minute)))
+
+    assert engine.sweep() == []  # Still inside the quiet period
+    [closing] = engine.sweep(force=True)
+    assert closing.status == RESOLVED and closing.closes_incident
+    assert closing.incident == 1 and closing.id == 2
+    assert closing.breaches == 11 and closing.started == t0
+    assert closing.wasted == 100.0
+    assert engine.stats() == {"open": 0, "opened": 1, "closed": 1, "breaches": 11, "quiet_period": 300}
+
+
+def test_gaps_count_at_most_the_quiet_period():
+    engine = IncidentEngine(ids(), quiet_period=60)
+    t0 = datetime(2026, 1, 1, 8)
+    engine.breach(water("Room 1", t0))
+    engine.breach(water("Room 1", t0 + timedelta(hours=5)))
+    [closing] = engine.sweep(force=True)
+    assert closing.wasted == 10.0  # 600 L/h for 60 s, not for 5 hours
+
+
+def test_readings_with_and_without_an_offset_fold_together(client):
+    reading = {"room_id": "Room TZ", "occupancy": 0, "light_lux": 0, "water_flow": 50, "energy_load": 0.2}
+    aware = client.post("/sensor/ingest", json={**reading, "timestamp": datetime.now().astimezone().isoformat()})
+    naive = client.post("/sensor/ingest", json=reading)  # Stamped with naive datetime.now()
+    assert aware.status_code == naive.status_code == 200
+    assert naive.json()["alert"]["breaches"] == 2
+    assert naive.json()["alert"]["incident_id"] == aware.json()["alert"]["incident_id"]
+
+
+def test_every_breach_resends_the_cutoff_but_only_the_opening_is_recorded(client, main, monkeypatch):
+    commands = []
+    monkeypatch.setattr(main.actuators, "command", lambda *args: commands.append(args) or "QUEUED")
+    before = main.incidents.opened
+    reading = {"room_id": "Room Cutoff", "occupancy": 0, "light_lux": 0, "water_flow": 50, "energy_load": 0.2}
+    for _ in range(5):
+        assert client.post("/sensor/ingest", json=reading).status_code == 200
+
+    assert commands == [("Room Cutoff", "WATER", False)] * 5
+    assert main.incidents.opened == before + 1
+    assert len(main.store.query("alerts", room_id="Room Cutoff")[0]) == 1
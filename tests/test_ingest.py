@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+
+def test_batch_updates_each_room_once_with_its_last_reading(client, main, monkeypatch):
+    updates = []
+    monkeypatch.setattr(main, "update_room_status", lambda room_id, status: updates.append((room_id, status)))
+    t0 = datetime(2026, 3, 2, 9)
+    readings = [{"room_id": f"Room B{i % 3}", "timestamp": (t0 + timedelta(seconds=i)).isoformat(), "occupancy": 4,
+                 "light_lux": 300, "water_flow": 50 if i == 997 else 1.0, "energy_load": 1.0} for i in range(1000)]
+
+    response = client.post("/sensor/ingest/batch", json=readings)
+    assert response.status_code == 200 and response.json()["processed"] == 1000
+    assert [room_id for room_id, _ in updates] == ["Room B0", "Room B1", "Room B2"]
+    status = dict(updates)
+    assert status["Room B1"]["last_update"] == t0 + timedelta(seconds=997)
+    assert status["Room B1"]["latest_alert"]["room_id"] == "Room B1"
+    assert status["Room B0"]["last_update"] == t0 + timedelta(seconds=999)
+    assert status["Room B0"]["latest_alert"] is None
+
+
+def alert_sequence(room_id, t0):
+    """Warm-up, a spike, a drip that becomes sustained, an energy spike, then a second spike (exact in float32)."""
+    flows = [2.0] * 5 + [50.0, 2.0] + [2.5] * 5 + [2.0, 2.0, 40.0]
+    energy = [0.0] * 13 + [3.0, 0.0]
+    return [{"room_id": room_id, "timestamp": (t0 + timedelta(minutes=i)).isoformat(), "occupancy": 0,
+             "light_lux": 300, "water_flow": flow, "energy_load": load}
+            for i, (flow, load) in enumerate(zip(flows, energy))]
+
+
+def comparable(alert, room_id):
+    """An alert without what differs by path: IDs and the room's name."""
+    if alert is None:
+        return None
+    return {key: value.replace(room_id, "ROOM") if isinstance(value, str) else value
+            for key, value in alert.items() if key not in ("id", "incident_id", "room_id")}
+
+
+def test_single_batch_and_binary_paths_raise_the_same_alerts(client):
+    from ml.wire import MEDIA_TYPE, encode_frame
+
+    t0 = datetime(2026, 3, 3, 10)
+    single = [client.post("/sensor/ingest", json=reading).json()["alert"]
+              for reading in alert_sequence("Room Path S", t0)]
+    results = client.post("/sensor/ingest/batch", json=alert_sequence("Room Path B", t0)).json()["results"]
+    batch = [result["alert"] for result in results]
+    readings = alert_sequence("Room Path F", t0)
+    frame = encode_frame(*([reading[name] for reading in readings] for name in
+                           ("room_id", "occupancy", "light_lux", "water_flow", "energy_load")),
+                         times=[datetime.fromisoformat(reading["timestamp"]) for reading in readings])
+    response = client.post("/sensor/ingest/binary", content=frame, headers={"Content-Type": MEDIA_TYPE})
+    binary = [None] * len(readings)
+    for alert in response.json()["alerts"]:
+        binary[alert.pop("index")] = alert
+
+    single = [comparable(alert, "Room Path S") for alert in single]
+    assert {alert["type"] for alert in single if alert} == {"AI_ANOMALY_WATER", "SUSTAINED_LEAK", "AI_ANOMALY_ENERGY"}
+    assert single[-1]["breaches"] == 2  # Folded into the first spike's incident
+    assert [comparable(alert, "Room Path B") for alert in batch] == single
+    assert [comparable(alert, "Room Path F") for alert in binary] == single
@@ -0,0 +1,79 @@
+from datetime import datetime
+
+import numpy as np
+
+from ml.prediction_cache import PredictionCache
+
+
+def predict_batch(hours, occupancies, luxes):
+    return np.asarray(hours) * 1000.0 + np.asarray(occupancies) + np.asarray(luxes) / 10_000
+
+
+def test_warm_keeps_whole_hours_around_now_within_max_entries():
+    cache = PredictionCache(max_entries=50_000)
+    cache.warm(predict_batch, now=datetime(2024, 5, 1, 23, 30))
+
+    per_hour = 101 * 101
+    assert len(cache._entries) == 4 * per_hour <= cache.max_entries
+    assert {key[0] for key in cache._entries} == {22, 23, 0, 1}  # Wraps past midnight
+    assert cache.evictions == 0
+
+    value = cache.get_or_compute(23, 40, 455.0, predict_batch)
+    assert cache.hits == 1 and cache.misses == 0
+    assert value == predict_batch([23], [40], [460.0])[0]  # 455 lux is in the 460 bin
+
+
+def test_warm_fills_only_the_current_hour_when_one_hour_does_not_fit():
+    cache = PredictionCache(max_entries=1000)
+    cache.warm(predict_batch, now=datetime(2024, 5, 1, 9))
+    assert len(cache._entries) == 1000
+    assert {key[0] for key in cache._entries} == {9}
+
+
+def test_rebuild_rewarms_after_a_model_swap():
+    cache = PredictionCache(max_entries=50_000)
+    cache.warm(predict_batch)
+    cache.rebuild(lambda h, o, l: predict_batch(h, o, l) + 1)
+    hour, occupancy, lux_bin = next(iter(cache._entries))
+    assert cache._entries[(hour, occupancy, lux_bin)] == predict_batch([hour], [occupancy], [lux_bin * 10.0])[0] + 1
+
+
+def test_batch_looks_up_each_cell_once_and_scores_misses_together():
+    cache = PredictionCache(max_entries=3)
+    calls = []
+
+    def counting(hours, occupancies, luxes):
+        calls.append(len(hours))
+        return predict_batch(hours, occupancies, luxes)
+
+    values = cache.get_or_compute_batch([8, 8, 9, 8, 10, 11], [5, 5, 5, 5, 0, 0], [100.0, 101.0, 100.0, 99.0, 0, 0],
+                                        counting)
+    assert calls == [4]  # Four distinct cells, one call
+    assert values.tolist() == predict_batch([8, 8, 9, 8, 10, 11], [5, 5, 5, 5, 0, 0], [100.0] * 4 + [0, 0]).tolist()
+    assert (cache.hits, cache.misses, cache.evictions) == (0, 6, 1)
+
+    cache.get_or_compute_batch([11, 11], [0, 0], [0, 0], counting)
+    assert calls == [4] and cache.hits == 2
+
+
+class ConstantModel:
+    def __init__(self, demand):
+        self.demand = demand
+
+    def predict(self, X):
+        return np.full(len(X), self.demand)
+
+
+def test_brain_warms_on_load_and_rewarms_on_swap(monkeypatch):
+    from ml.analytics import EcoBrain
+
+    brain = EcoBrain(cache_size=50_000, lazy=True)
+    monkeypatch.setattr(brain, "load_model", lambda: setattr(brain, "model", ConstantModel(2.0)))
+    monkeypatch.setattr(brain, "train_new_model", lambda: setattr(brain, "model", ConstantModel(2.0)))
+    brain.ensure_loaded()
+    assert brain.cache.stats()["entries"] == 4 * 101 * 101
+
+    brain.swap_model(ConstantModel(3.0))
+    assert brain.cache.stats()["entries"] == 4 * 101 * 101
+    assert brain.predict_demand(datetime.now().hour, 10, 200.0) == 3.0
+    assert brain.cache.stats()["misses"] == 0
@@ -0,0 +1,53 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from ml.pump_scheduler import VIOLATION_PENALTY, optimize_pump_schedules
+from ml.tariffs import PUMP_KWH_PER_LITER
+
+
+def brute_force(demand, tariffs, capacity, level, pump_rate, min_level, level_bins):
+    """Cheapest penalized cost over all 2^H on/off plans, on the DP's level grid (levels rounded down)."""
+    step = capacity / level_bins
+    best = np.inf
+    for plan in itertools.product((0, 1), repeat=len(demand)):
+        current, cost = np.floor(level / step + 1e-9) * step, 0.0
+        for on, drawn, tariff in zip(plan, demand, tariffs):
+            raw = current + on * pump_rate - drawn
+            cost += on * pump_rate * PUMP_KWH_PER_LITER * tariff
+            cost += VIOLATION_PENALTY * (max(0.0, min_level - raw) + max(0.0, raw - capacity))
+            current = np.floor(min(max(raw, 0.0), capacity) / step + 1e-9) * step
+        cost += VIOLATION_PENALTY * max(0.0, level - current)
+        best = min(best, cost)
+    return best
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_dp_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    horizon, level_bins, capacity = 6, 20, 2000.0
+    demand = rng.choice([0.0, 100.0, 300.0, 500.0], horizon)
+    tariffs = rng.choice([4.0, 6.8, 10.2], horizon)
+    level = float(rng.integers(0, level_bins + 1)) * capacity / level_bins
+    pump_rate, min_level = 500.0, float(rng.choice([0.0, 200.0]))
+
+    result = optimize_pump_schedules(demand[None, :], tariffs, capacity, level, pump_rate, min_level,
+                                     level_bins=level_bins)
+    pumped = result["pump_on"][0] * pump_rate
+    shortfall = max(0.0, level - result["level"][0, -1])
+    dp_cost = (pumped * PUMP_KWH_PER_LITER * tariffs).sum() + VIOLATION_PENALTY * (
+        result["violation_liters"][0] + shortfall)
+    assert dp_cost == pytest.approx(brute_force(demand, tariffs, capacity, level, pump_rate, min_level,
+                                                level_bins))
+
+
+def test_tank_inputs_are_validated(client):
+    for params in ({"capacity": 0}, {"pump_rate": -100}, {"level": -1}, {"level": 30000},
+                   {"min_level": 9000, "level": 8000}):
+        assert client.get("/api/pump/optimize", params=params).status_code == 422, params
+    tank = {"tank_id": "t1", "capacity": 1000, "level": 500}
+    assert client.post("/api/pump/optimize/fleet", json=[{**tank, "capacity": 0}]).status_code == 422
+    assert client.post("/api/pump/optimize/fleet", json=[{**tank, "level": 1500}]).status_code == 422
+    assert client.post("/api/pump/optimize/fleet", json=[{**tank, "pump_rate": -5}]).status_code == 422
+    assert client.post("/api/pump/optimize/fleet", json=[tank], params={"hours": 6}).status_code == 200
@@ -0,0 +1,112 @@
+import math
+
+import numpy as np
+import pytest
+
+from ml.room_state import RoomStateEngine
+
+OPTIONS = {"alpha": 0.05, "z_threshold": 3.0, "sustain_readings": 4, "water_floor": 0.25, "energy_floor": 0.5}
+
+
+def reference(readings, alpha, z_threshold, sustain_readings, water_floor, energy_floor):
+    """One reading at a time, in plain Python: what update() must match batch or not."""
+    rooms, runs = {}, []
+    for room_id, water, energy in readings:
+        state = rooms.setdefault(room_id, {"water": [0.0, 0.0, 0], "energy": [0.0, 0.0, 0], "count": 0})
+        row = {}
+        for kind, x, floor in (("water", water, water_floor), ("energy", energy, energy_floor)):
+            mean, var, run = state[kind]
+            std = math.sqrt(var) + 1e-6
+            abnormal = x > floor and (state["count"] < sustain_readings or x > mean + z_threshold * std)
+            run = min(run + 1, 65535) if abnormal else 0
+            if not abnormal:
+                diff = x - mean
+                mean, var = mean + alpha * diff, (1 - alpha) * (var + diff * alpha * diff)
+            state[kind] = [mean, var, run]
+            row[kind] = run
+        state["count"] += 1
+        runs.append(row)
+    return rooms, runs
+
+
+def random_readings(n, rooms=7, seed=0):
+    rng = np.random.default_rng(seed)
+    room_ids = [f"Room {i}" for i in rng.integers(0, rooms, n)]
+    water = rng.choice([0.0, 0.1, 0.3, 2.0], n) + rng.uniform(0, 0.05, n)
+    energy = rng.uniform(0, 1.5, n)
+    return room_ids, water, energy
+
+
+def test_batches_match_one_reading_at_a_time():
+    room_ids, water, energy = random_readings(400)
+    engine = RoomStateEngine(capacity=4, **OPTIONS)  # Also grows past its capacity
+    out = {}
+    for start in range(0, 400, 50):  # Batches with several readings per room
+        batch = engine.update(room_ids[start:start + 50], water[start:start + 50], energy[start:start + 50])
+        for name, values in batch.items():
+            out.setdefault(name, []).extend(values.tolist())
+
+    rooms, runs = reference(zip(room_ids, water, energy), **OPTIONS)
+    assert out["water_run"] == [row["water"] for row in runs]
+    assert out["energy_run"] == [row["energy"] for row in runs]
+    assert engine.capacity >= 7 and engine.stats()["rooms"] == 7 and engine.updates == 400
+    for room_id, state in rooms.items():
+        room = engine.room(room_id)
+        assert room["readings"] == state["count"]
+        assert room["water_baseline"] == pytest.approx(state["water"][0], abs=1e-3)
+        assert room["water_std"] == pytest.approx(math.sqrt(state["water"][1]), abs=1e-3)
+        assert room["energy_baseline"] == pytest.approx(state["energy"][0], abs=1e-3)
+
+
+def test_array_room_ids_match_lists():
+    room_ids, water, energy = random_readings(200, seed=1)
+    by_list, by_array = RoomStateEngine(**OPTIONS), RoomStateEngine(**OPTIONS)
+    expected = by_list.update(room_ids, water, energy)
+    actual = by_array.update(np.array(room_ids), water, energy)
+    for name, values in expected.items():
+        np.testing.assert_array_equal(actual[name], values)
+    assert by_array.room("Room 3") == by_list.room("Room 3")
+
+
+def test_drip_is_flagged_once_per_episode():
+    engine = RoomStateEngine(**OPTIONS)
+    for _ in range(20):  # Warm up on a dry room
+        engine.update(["Room 1"], [0.0], [0.0])
+
+    drip = engine.update(["Room 1"] * 6, [0.4] * 6, [0.0] * 6)  # Small, but reading after reading
+    assert drip["water_run"].tolist() == [1, 2, 3, 4, 5, 6]
+    assert drip["water_sustained"].tolist() == [False, False, False, True, False, False]
+    assert engine.room("Room 1")["water_baseline"] == 0.0  # Abnormal readings don't move the baseline
+
+    stopped = engine.update(["Room 1", "Room 1"], [0.0, 0.4], [0.0, 0.0])
+    assert stopped["water_run"].tolist() == [0, 1]  # A dry reading ends the run
+    assert engine.sustained_events == 1
+
+
+def test_spike_is_not_sustained_and_z_uses_the_previous_baseline():
+    engine = RoomStateEngine(**OPTIONS)
+    engine.update(["Room 1"] * 100, [0.0, 0.2] * 50, [0.0] * 100)  # Noise under the floor: learnt as normal
+    baseline = engine.room("Room 1")["water_baseline"]
+    assert baseline > 0
+
+    spike = engine.update(["Room 1", "Room 1"], [9.0, 0.1], [0.0, 0.0])
+    assert spike["water_run"].tolist() == [1, 0]
+    assert not spike["water_sustained"].any()
+    assert spike["water_baseline"][0] == pytest.approx(baseline, abs=1e-3)
+    assert spike["water_z"][0] > OPTIONS["z_threshold"]
+
+
+def test_run_counter_saturates():
+    engine = RoomStateEngine(**OPTIONS)
+    engine._slot_array(["Room 1"])
+    engine._columns["water_run"][0] = 65535
+    out = engine.update(["Room 1"], [5.0], [0.0])
+    assert out["water_run"][0] == 65535
+
+
+def test_unknown_room_and_empty_batch():
+    engine = RoomStateEngine(**OPTIONS)
+    assert engine.room("Room 1") is None
+    out = engine.update([], [], [])
+    assert all(len(values) == 0 for values in out.values())
+    assert engine.updates == 0
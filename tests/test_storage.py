@@ -0,0 +1,183 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from ml.records import AlertRecord, WATER_ALERT, ENERGY_ALERT
+from ml.storage import MemoryStore, SQLiteStore, decode_cursor, encode_cursor
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    store = MemoryStore() if request.param == "memory" else SQLiteStore(str(tmp_path / "history.db"),
+                                                                        flush_interval=3600)
+    yield store
+    store.close()
+
+
+def alert(store, time, room_id="Room 1", code=WATER_ALERT):
+    record = AlertRecord(store.next_alert_id(), time, room_id, code, 2.0, 12.0, 600.0, 3.06, 90.0)
+    store.append("alerts", record)
+    return record
+
+
+def test_cursor_pages_cover_every_entry_once_newest_first(store):
+    t0 = datetime(2026, 1, 1)
+    for i in range(25):
+        alert(store, t0 + timedelta(minutes=i // 2))  # Pairs share a timestamp: the seq breaks ties
+    store.flush()
+    seen, cursor = [], None
+    while True:
+        page, cursor = store.query("alerts", limit=7, cursor=cursor)
+        seen += [entry.id for entry in page]
+        if not cursor:
+            break
+    assert sorted(seen) == list(range(1, 26)) and len(seen) == 25
+    times = [entry.time for entry in store.query("alerts")[0]]
+    assert times == sorted(times, reverse=True)
+
+
+def test_filters_and_windows(store):
+    t0 = datetime(2026, 1, 1)
+    for i in range(10):
+        alert(store, t0 + timedelta(hours=i), room_id=f"Room {i % 2}", code=ENERGY_ALERT if i % 3 else WATER_ALERT)
+    store.flush()
+    entries, _ = store.query("alerts", since=t0 + timedelta(hours=2), until=t0 + timedelta(hours=5))
+    assert [entry.time.hour for entry in entries] == [5, 4, 3, 2]
+    entries, _ = store.query("alerts", room_id="Room 1", type="AI_ANOMALY_WATER")
+    assert [entry.time.hour for entry in entries] == [9, 3]
+
+
+def test_records_round_trip(store):
+    original = alert(store, datetime(2026, 1, 1, 8, 30))
+    store.flush()
+    [stored], _ = store.query("alerts")
+    assert stored.render() == original.render()
+
+
+def test_version_changes_on_every_append(store):
+    before = store.version("alerts")
+    alert(store, datetime(2026, 1, 1))
+    store.flush()
+    assert store.version("alerts") != before
+
+
+@pytest.mark.parametrize("cursor", ["garbage", "1.5", "x:1", "1.5:y", "nan:1", "inf:1", ":"])
+def test_malformed_cursors_raise_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor((1767225600.25, 42))) == (1767225600.25, 42)
+
+
+def test_history_routes_validate_cursor_and_limit(client):
+    assert client.get("/api/history/alerts", params={"cursor": "garbage"}).status_code == 400
+    for route in ("alerts", "pumping", "battery"):
+        for limit in (0, -1):
+            assert client.get(f"/api/history/{route}", params={"limit": limit}).status_code == 422
+
+
+def test_history_etag_and_next_cursor(client):
+    first = client.get("/api/history/alerts", params={"limit": 2})
+    assert first.status_code == 200 and len(first.json()) <= 2
+    etag = first.headers["ETag"]
+    assert client.get("/api/history/alerts", params={"limit": 2}, headers={"If-None-Match": etag}).status_code == 304
+    if "X-Next-Cursor" in first.headers:
+        page = client.get("/api/history/alerts", params={"limit": 2, "cursor": first.headers["X-Next-Cursor"]})
+        assert {a["id"] for a in page.json()}.isdisjoint({a["id"] for a in first.json()})
+
+
+def test_changes_follow_commit_order_not_alert_ids(store):
+    t0 = datetime(2026, 1, 1)
+    early_id, late_id = store.next_alert_id(), store.next_alert_id()
+    store.append("alerts", AlertRecord(late_id, t0, "Room 1", WATER_ALERT))
+    store.flush()
+    entries, last_seq = store.changes("alerts", store.last_seq("alerts") - 1)
+    assert [entry.id for entry in entries] == [late_id]
+
+    store.append("alerts", AlertRecord(early_id, t0, "Room 1", WATER_ALERT))  # Lower ID, committed later
+    store.flush()
+    entries, last_seq = store.changes("alerts", last_seq)
+    assert [entry.id for entry in entries] == [early_id]
+    assert store.changes("alerts", last_seq) == ([], last_seq)
+
+
+def test_changes_page_forward_with_a_limit(store):
+    start = store.last_seq("alerts")
+    for i in range(10):
+        alert(store, datetime(2026, 1, 1) + timedelta(minutes=i), room_id=f"Room {i % 2}")
+    store.flush()
+    seen, seq = [], start
+    while True:
+        page, seq = store.changes("alerts", seq, limit=3, room_id="Room 0")
+        if not page:
+            break
+        assert [entry.time for entry in page] == sorted((entry.time for entry in page), reverse=True)
+        seen += [entry.time.minute for entry in page]
+    assert sorted(seen) == [0, 2, 4, 6, 8]
+
+
+def test_changes_see_rows_another_worker_commits_late(tmp_path):
+    path = str(tmp_path / "shared.db")
+    first, second = SQLiteStore(path, flush_interval=3600), SQLiteStore(path, flush_interval=3600)
+    try:
+        held = alert(first, datetime(2026, 1, 1))  # Buffered in the first worker, not committed yet
+        newer = alert(second, datetime(2026, 1, 1))
+        second.flush()
+        assert newer.id > held.id
+        entries, seq = second.changes("alerts", 0)
+        assert [entry.id for entry in entries] == [newer.id]
+        first.flush()
+        entries, _ = second.changes("alerts", seq)
+        assert [entry.id for entry in entries] == [held.id]  # Skipped by an ID watermark
+    finally:
+        first.close()
+        second.close()
+
+
+def test_sqlite_reads_see_committed_rows_only(tmp_path):
+    store = SQLiteStore(str(tmp_path / "history.db"), flush_interval=3600)
+    try:
+        version, last_seq = store.version("alerts"), store.last_seq("alerts")
+        alert(store, datetime(2026, 1, 1))
+        assert store.query("alerts") == ([], None)  # Reads don't flush
+        assert (store.version("alerts"), store.last_seq("alerts")) == (version, last_seq)
+        store.flush()
+        assert len(store.query("alerts")[0]) == 1 and store.version("alerts") != version
+    finally:
+        store.close()
+
+
+def test_sqlite_failed_flush_keeps_the_batch_for_the_next_one(tmp_path):
+    path = str(tmp_path / "history.db")
+    store = SQLiteStore(path, flush_interval=3600)
+    store._conn.execute("PRAGMA busy_timeout = 0")  # Fail at once instead of waiting for the lock
+    blocker = sqlite3.connect(path)
+    try:
+        store.next_alert_id()  # Reserves a block of IDs while the database is free
+        blocker.execute("BEGIN IMMEDIATE")  # Another worker holding the write lock
+        alert(store, datetime(2026, 1, 1, 8))
+        store.set_room_status("Room 1", {"water_status": "LEAK"})
+        with pytest.raises(sqlite3.OperationalError):
+            store.flush()
+        blocker.rollback()
+
+        store.flush()
+        assert len(store.query("alerts")[0]) == 1
+        assert store.rollups("daily")
+        assert store.get_room_status("Room 1") == {"water_status": "LEAK"}
+    finally:
+        blocker.close()
+        store.close()
+
+
+def test_history_routes_poll_by_commit_sequence(client, main):
+    seq = int(client.get("/api/history/alerts", params={"limit": 1}).headers["X-Last-Seq"])
+    record = AlertRecord(main.next_alert_id(), datetime.now(), "Room Seq", WATER_ALERT)
+    main.record_history("alerts", record)
+    delta = client.get("/api/history/alerts", params={"after_seq": seq})
+    assert [a["id"] for a in delta.json()] == [record.id]
+    assert int(delta.headers["X-Last-Seq"]) > seq
+    assert client.get("/api/history/alerts", params={"after_seq": -1}).status_code == 422
@@ -0,0 +1,30 @@
+import numpy as np
+
+from ml.training import train_streaming
+
+
+def write_csv(path, rows=400, seed=0):
+    rng = np.random.default_rng(seed)
+    hour, occupancy, lux = rng.integers(0, 24, rows), rng.integers(0, 100, rows), rng.uniform(0, 900, rows)
+    flow = occupancy * 0.2 + 2.0 + rng.uniform(-0.5, 0.5, rows)
+    with open(path, "w") as f:
+        f.write("hour,occupancy,light_lux,water_flow\n")
+        f.writelines(f"{h},{o},{l:.1f},{w:.2f}\n" for h, o, l, w in zip(hour, occupancy, lux, flow))
+    return str(path)
+
+
+def test_streaming_fit_stops_adding_trees_at_the_cap(tmp_path):
+    source = write_csv(tmp_path / "data.csv")
+    model, rows = train_streaming(source, chunksize=100, initial_iters=10, iters_per_chunk=5, max_iters=18)
+    assert model.n_iter_ == 18  # 10, 15, 18, then the last chunk is skipped
+    assert rows == 300
+
+
+def test_incremental_refits_stay_bounded(tmp_path):
+    source = write_csv(tmp_path / "data.csv")
+    model, _ = train_streaming(source, chunksize=200, initial_iters=10, iters_per_chunk=5, max_iters=20)
+    sizes = []
+    for _ in range(3):
+        model, _ = train_streaming(source, model, chunksize=200, initial_iters=10, iters_per_chunk=5, max_iters=20)
+        sizes.append(model.n_iter_)
+    assert sizes == [20, 15, 20]  # Refits grow the model to the cap; one found at the cap starts over
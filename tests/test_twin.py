@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from ml.archive import TelemetryArchive
+from ml.twin import DigitalTwin
+
+
+class FlatBrain:
+    """Predicts 2 L/min everywhere; enough for the replay plumbing."""
+    model_version = 1
+    data_path = None
+
+    def ensure_loaded(self):
+        pass
+
+    def predict_demand_batch(self, hours, occupancy, light_lux):
+        return np.full(len(hours), 2.0)
+
+
+def fill(archive, start, end, rooms=3):
+    times = np.arange(np.datetime64(start, "m"), np.datetime64(end, "m"), np.timedelta64(15, "m"))
+    times = np.repeat(times, rooms)
+    n = len(times)
+    archive.append([f"Room {i % rooms}" for i in range(n)], times.astype(object).tolist(), [5] * n, [300.0] * n,
+                   [2.0] * n, [1.2] * n)
+    archive.flush()
+
+
+def test_archive_replay_reads_only_its_window(tmp_path, monkeypatch):
+    archive = TelemetryArchive(str(tmp_path), flush_interval=3600)
+    try:
+        hour = datetime.now().replace(minute=0, second=0, microsecond=0)
+        fill(archive, hour - timedelta(days=6), hour - timedelta(hours=1))
+        reads = []
+        read = archive.read
+        monkeypatch.setattr(archive, "read", lambda **options: reads.append(options) or read(**options))
+
+        twin = DigitalTwin(FlatBrain(), archive=archive, workers=1)
+        replay = twin.run([{}], days=2, source="archive")
+        assert replay["hours"] <= 48
+        assert reads[0]["since"] == (hour - timedelta(days=2)).replace(hour=0) and reads[0]["until"] < hour
+    finally:
+        archive.close()
+
+
+def test_live_flushes_keep_the_prepared_archive_history(tmp_path):
+    archive = TelemetryArchive(str(tmp_path), flush_interval=3600)
+    try:
+        hour = datetime.now().replace(minute=0, second=0, microsecond=0)
+        fill(archive, hour - timedelta(days=3), hour)
+        twin = DigitalTwin(FlatBrain(), archive=archive, workers=1)
+        key, history = twin._load("archive", days=2)
+
+        fill(archive, hour, hour + timedelta(minutes=30))  # Readings still arriving in the current hour
+        same_key, same_history = twin._load("archive", days=2)
+        assert same_key == key and same_history is history
+        twin.run([{}], days=2, source="archive")
+        twin.run([{}], days=2, source="archive")
+        assert twin.stats()["hits"] == 1 and twin.stats()["misses"] == 1
+    finally:
+        archive.close()
@@ -0,0 +1,98 @@
+import struct
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from ml.wire import HEADER, MAGIC, MEDIA_TYPE, VERSION, FLAG_TIMES, FrameError, decode_frame, encode_frame
+
+
+def columns(n=50, seed=0):
+    rng = np.random.default_rng(seed)
+    start = datetime(2026, 3, 1, 7, 30)
+    return {
+        "room_ids": [f"Room {i}" for i in rng.integers(0, 7, n)],
+        "occupancy": rng.integers(0, 60, n),
+        "light_lux": rng.uniform(0, 800, n).astype(np.float32),
+        "water_flow": rng.choice([0.0, 0.5, 3.0, 12.0], n),
+        "energy_load": rng.uniform(0, 8, n).astype(np.float32),
+        "times": [start + timedelta(seconds=int(s)) for s in np.sort(rng.integers(0, 86_400, n))],
+    }
+
+
+def test_round_trip():
+    data = columns()
+    frame = decode_frame(encode_frame(**data))
+    assert len(frame) == 50
+    assert frame.room_ids.tolist() == data["room_ids"]
+    assert frame.times.astype(object).tolist() == data["times"]
+    assert frame.occupancy.tolist() == data["occupancy"].tolist()
+    for name in ("light_lux", "water_flow", "energy_load"):
+        np.testing.assert_array_equal(getattr(frame, name), np.asarray(data[name], dtype=np.float32))
+
+
+def test_frames_without_times_use_the_arrival_time():
+    data = columns(5)
+    del data["times"]
+    now = datetime(2026, 3, 1, 12)
+    frame = decode_frame(encode_frame(**data), now=now)
+    assert (frame.times == np.datetime64(now, "ms")).all()
+
+
+def test_empty_frame():
+    assert len(decode_frame(encode_frame([], [], [], [], []))) == 0
+
+
+def frame_bytes(rooms=(b"A",), codes=(0,), base_time=1.7e9, flags=FLAG_TIMES, values=(1.0, 1.0, 1.0)):
+    n = len(codes)
+    body = HEADER.pack(MAGIC, VERSION, flags, len(rooms), n, base_time)
+    body += b"".join(bytes([len(room)]) + room for room in rooms)
+    body += struct.pack(f"<{n}H", *codes)
+    if flags & FLAG_TIMES:
+        body += struct.pack(f"<{n}I", *([0] * n))
+    body += struct.pack(f"<{n}H", *([1] * n))
+    for value in values:
+        body += struct.pack(f"<{n}f", *([value] * n))
+    return body
+
+
+@pytest.mark.parametrize("body, message", [
+    (b"", "shorter than its header"),
+    (b"JSON" + frame_bytes()[4:], "Not an EcoCore"),
+    (frame_bytes()[:-1], "bytes"),
+    (frame_bytes() + b"\0", "bytes"),
+    (frame_bytes(codes=(1,)), "outside the dictionary"),
+    (frame_bytes(rooms=(b"A", b"A"), codes=(0, 1)), "twice"),
+    (frame_bytes(rooms=(b"\xff",)), "UTF-8"),
+    (frame_bytes(base_time=1e20), "base_time"),
+    (frame_bytes(base_time=-1e20), "base_time"),
+    (frame_bytes(base_time=float("nan")), "base_time"),
+    (frame_bytes(values=(1.0, float("nan"), 1.0)), "water_flow"),
+    (frame_bytes(values=(1.0, 1.0, float("inf"))), "energy_load"),
+])
+def test_malformed_frames_are_rejected(body, message):
+    with pytest.raises(FrameError, match=message):
+        decode_frame(body)
+
+
+def test_binary_and_json_ingest_raise_the_same_alerts(client):
+    data = columns(40, seed=1)
+    data["room_ids"] = [f"Wire {room}" for room in data["room_ids"]]
+    response = client.post("/sensor/ingest/binary", content=encode_frame(**data),
+                           headers={"content-type": MEDIA_TYPE})
+    assert response.status_code == 200
+    binary = response.json()
+
+    readings = [{"room_id": room.replace("Wire", "Json"), "occupancy": int(occupancy), "light_lux": float(lux),
+                 "water_flow": float(water), "energy_load": float(energy), "timestamp": time.isoformat()}
+                for room, occupancy, lux, water, energy, time in zip(*data.values())]
+    json = client.post("/sensor/ingest/batch", json=readings).json()
+    assert binary["processed"] == json["processed"] == 40
+    assert binary["alerts_raised"] == json["alerts_raised"]
+    assert [alert["index"] for alert in binary["alerts"]] == [
+        i for i, result in enumerate(json["results"]) if result["alert"]]
+
+
+def test_malformed_frames_get_422(client):
+    for body in (b"junk", frame_bytes(base_time=1e20), frame_bytes(rooms=(b"A", b"A"), codes=(0, 1))):
+        assert client.post("/sensor/ingest/binary", content=body).status_code == 422